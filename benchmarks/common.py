@@ -0,0 +1,42 @@
+# benchmarks/common.py
+import os
+import json
+import platform
+import subprocess
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def save_report(name: str, params: dict, results: list, output: str = None) -> str:
+    """Guarda los resultados con revisión git y entorno; por defecto en benchmarks/results/<name>_<fecha>.json."""
+    report = {
+        "benchmark": name,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    output = output or os.path.join(RESULTS_DIR, f"{name}_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"📝 Resultados guardados en {output}")
+    return output
+
+
+def load_baseline(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["results"]
@@ -0,0 +1,247 @@
+# benchmarks/fixture_site.py
+import json
+import time
+import threading
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Réplica local de la estructura de página de la que dependen las comprobaciones
+# Selenium, para medir y ajustar sus esperas sin tocar los portales de gencat:
+#
+#   /emd/acces              botón "Soc un ciutadà/ana" dentro del shadowRoot de app-root
+#   /emd/cert               iframe con #btnContinuaCertCaptcha
+#   /emd/home               enlace #apt_did ("Dades i documents")
+#   /emd/dades              center_1R → app-home → "Els meus documents"
+#   /emd/documents          tarjetas de documentos (emd-cards-view) tras un spinner
+#   /carpetaciutadana360    Área privada: spinner y contenido (o banner de error)
+#
+# Cada página muestra un spinner durante `delays[página]` segundos antes de
+# pintar su contenido; `latency` retrasa además la respuesta HTTP.
+
+DEFAULT_DELAYS = {
+    "acces": 0.8,
+    "cert_frame": 0.5,
+    "home": 0.8,
+    "dades": 0.3,
+    "documents": 1.5,
+    "area_privada": 1.0,
+}
+# ok: flujo completo; broken: las páginas finales fallan (sin documentos / banner de error);
+# down: el portal responde 503 (lo resuelve la sonda HTTP sin abrir el navegador)
+SCENARIOS = ("ok", "broken", "down")
+
+ACCES_PATH = "/emd/acces"
+AREA_PRIVADA_PATH = "/carpetaciutadana360"
+
+_PAGE = """<!DOCTYPE html>
+<html lang="ca">
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+<style>
+  body { font-family: sans-serif; margin: 0; }
+  .spinner { position: fixed; inset: 0; background: rgba(255,255,255,.9); display: flex;
+             align-items: center; justify-content: center; font-size: 2em; }
+  .card { border: 1px solid #ccc; padding: 1em; margin: .5em; }
+</style>
+</head>
+<body>
+<div class="spinner" id="spinner">Carregant…</div>
+%(body)s
+<script>
+const FIXTURE = %(fixture)s;
+function ready(render) {
+  setTimeout(function () {
+    render();
+    const spinner = document.getElementById('spinner');
+    if (spinner && FIXTURE.remove_spinner) spinner.remove();
+  }, FIXTURE.delay_ms);
+}
+%(script)s
+</script>
+</body>
+</html>
+"""
+
+_PAGES = {
+    "acces": {
+        "title": "Accés - Els meus documents",
+        "body": '<div id="single-spa-application:mfe-main-app"><app-root></app-root></div>',
+        "script": """
+ready(function () {
+  const shadow = document.querySelector('app-root').attachShadow({mode: 'open'});
+  shadow.innerHTML = '<main><app-acces><div><div class="left">' +
+    '<button type="button">Soc un ciutadà/ana</button></div><div class="right"></div></div></app-acces></main>';
+  shadow.querySelector('button').addEventListener('click', function () { location.href = '/emd/cert'; });
+});
+""",
+    },
+    "cert": {
+        "title": "Identificació",
+        "body": '<h2>Identificació amb certificat digital</h2><iframe src="/emd/cert/frame" width="600" height="300"></iframe>',
+        "script": "ready(function () {});",
+    },
+    "cert_frame": {
+        "title": "VALid",
+        "body": '<div id="cert"></div>',
+        "script": """
+ready(function () {
+  document.getElementById('cert').innerHTML =
+    '<button id="btnContinuaCertCaptcha" type="button">Certificat digital</button>';
+  document.getElementById('btnContinuaCertCaptcha').addEventListener('click', function () {
+    window.top.location.href = '/emd/home';
+  });
+});
+""",
+    },
+    "home": {
+        "title": "Inici",
+        "body": '<nav id="menu"></nav>',
+        "script": """
+ready(function () {
+  document.getElementById('menu').innerHTML = '<a id="apt_did" href="/emd/dades">Dades i documents</a>';
+});
+""",
+    },
+    "dades": {
+        "title": "Dades i documents",
+        "body": '<div id="center_1R"><app-root></app-root></div>',
+        "script": """
+ready(function () {
+  document.querySelector('#center_1R > app-root').innerHTML =
+    '<app-home><div><div><h2>Les meves dades</h2></div><div><div><h3>Notificacions</h3></div>' +
+    '<div><h3><a href="/emd/documents">Els meus documents</a></h3></div></div></div></app-home>';
+});
+""",
+    },
+    "documents": {
+        "title": "Els meus documents",
+        "body": '<div id="center_1R"><app-root><app-emd><emd-home><emd-documents><div>'
+                '<emd-cards-view><ul id="cards"></ul></emd-cards-view>'
+                '</div></emd-documents></emd-home></app-emd></app-root></div>',
+        "script": """
+ready(function () {
+  if (FIXTURE.broken) return;
+  const cards = document.getElementById('cards');
+  for (let i = 1; i <= 5; i++) {
+    const li = document.createElement('li');
+    li.innerHTML = '<div class="card">Document ' + i + '</div>';
+    cards.appendChild(li);
+  }
+});
+""",
+    },
+    "area_privada": {
+        "title": "Carpeta Ciutadana",
+        "body": '<div id="app"></div>',
+        "script": """
+ready(function () {
+  document.getElementById('app').innerHTML = FIXTURE.broken
+    ? '<div class="error-message">Service Unavailable</div>'
+    : '<main><h1>Carpeta Ciutadana</h1><p>Benvingut/da a la teva àrea privada.</p></main>';
+});
+""",
+    },
+}
+
+_ROUTES = {
+    ACCES_PATH: "acces",
+    "/emd/cert": "cert",
+    "/emd/cert/frame": "cert_frame",
+    "/emd/home": "home",
+    "/emd/dades": "dades",
+    "/emd/documents": "documents",
+    AREA_PRIVADA_PATH: "area_privada",
+}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        page = _ROUTES.get(urlparse(self.path).path)
+        if page is None:
+            self._reply(404, b"Not found", "text/plain")
+            return
+        site = self.server
+        if site.latency:
+            time.sleep(site.latency)
+        with site.lock:
+            site.hits[page] = site.hits.get(page, 0) + 1
+            broken = site.scenario == "broken"
+            down = site.scenario == "down"
+            delay = site.delays.get(page, 0)
+        if down:
+            self._reply(503, b"Service Unavailable", "text/plain")
+            return
+        fixture = {
+            "delay_ms": int(delay * 1000),
+            "broken": broken,
+            # Sin documentos el spinner se queda: igual que el portal cuando falla la API
+            "remove_spinner": not (broken and page == "documents"),
+        }
+        html = _PAGE % dict(_PAGES[page], fixture=json.dumps(fixture))
+        self._reply(200, html.encode("utf-8"), "text/html; charset=utf-8")
+
+    def _reply(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureSite(ThreadingHTTPServer):
+    """Servidor de la réplica en un hilo; escenario y retardos se pueden cambiar en caliente."""
+
+    daemon_threads = True
+
+    def __init__(self, delays: dict = None, scenario: str = "ok", latency: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), FixtureHandler)
+        self.lock = threading.Lock()
+        self.delays = dict(DEFAULT_DELAYS, **(delays or {}))
+        self.latency = latency
+        self.hits = {}
+        self.set_scenario(scenario)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def set_scenario(self, scenario: str) -> None:
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Escenario desconocido '{scenario}'. Disponibles: {SCENARIOS}")
+        with self.lock:
+            self.scenario = scenario
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fixture-site", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Réplica local de los portales para las comprobaciones Selenium")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="ok")
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    with FixtureSite(scenario=args.scenario, latency=args.latency, port=args.port) as site:
+        print(f"Acces frontal EMD: {site.url}{ACCES_PATH}")
+        print(f"Área privada:      {site.url}{AREA_PRIVADA_PATH}#/acces")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
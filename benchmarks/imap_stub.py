@@ -0,0 +1,216 @@
+# benchmarks/imap_stub.py
+import re
+import socketserver
+import threading
+from email import message_from_bytes
+
+# Servidor IMAP4rev1 mínimo, en memoria y sin TLS, con lo justo para que el
+# listener (imapclient) haga CAPABILITY, LOGIN, SELECT, UID SEARCH, UID FETCH,
+# UID STORE, NOOP y LOGOUT. Solo para benchmarks locales: no valida credenciales.
+
+UIDVALIDITY = 1
+_FIELDS_RE = re.compile(rb"HEADER\.FIELDS \(([^)]*)\)", re.IGNORECASE)
+
+
+class Mailbox:
+    """INBOX en memoria: UID == número de secuencia (sin EXPUNGE)."""
+
+    def __init__(self, messages=()):
+        self.lock = threading.Lock()
+        self.messages = []   # bytes RFC 822
+        self.flags = []      # set de flags por mensaje
+        self._headers = {}   # (uid, campos) -> bytes
+        for raw in messages:
+            self.append(raw)
+
+    def append(self, raw: bytes) -> int:
+        with self.lock:
+            self.messages.append(raw)
+            self.flags.append(set())
+            return len(self.messages)
+
+    def reset_flags(self) -> None:
+        with self.lock:
+            self.flags = [set() for _ in self.messages]
+
+    def header_fields(self, uid: int, fields: tuple) -> bytes:
+        key = (uid, fields)
+        if key not in self._headers:
+            msg = message_from_bytes(self.messages[uid - 1])
+            lines = [f"{name}: {value}" for name, value in msg.items() if name.upper() in fields]
+            self._headers[key] = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8", "replace")
+        return self._headers[key]
+
+
+def parse_sequence_set(spec: str, highest: int) -> set:
+    """'1,3:5,7:*' -> {1, 3, 4, 5, 7, ...}."""
+    uids = set()
+    for part in spec.split(","):
+        if ":" in part:
+            start, end = part.split(":", 1)
+            start = highest if start == "*" else int(start)
+            end = highest if end == "*" else int(end)
+            # RFC 3501: "n:*" equivale a "*:n", así que incluye el último aunque sea < n
+            uids.update(range(min(start, end), max(start, end) + 1))
+        elif part == "*":
+            uids.add(highest)
+        else:
+            uids.add(int(part))
+    return uids
+
+
+class IMAPHandler(socketserver.StreamRequestHandler):
+
+    def send(self, line: str) -> None:
+        self.wfile.write(line.encode("utf-8") + b"\r\n")
+
+    def handle(self):
+        self.mailbox = self.server.mailbox
+        self.send("* OK [CAPABILITY IMAP4rev1 IDLE] Benchmark IMAP stand-in ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.rstrip(b"\r\n").decode("utf-8", "replace").partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            if command == "UID":
+                command, _, args = args.partition(" ")
+                command = "UID " + command.upper()
+            handler = getattr(self, "cmd_" + command.replace(" ", "_").lower(), None)
+            if handler is None:
+                self.send(f"{tag} BAD Comando no soportado: {command}")
+            elif handler(tag, args) is False:
+                return
+            self.wfile.flush()
+
+    def cmd_capability(self, tag, args):
+        self.send("* CAPABILITY IMAP4rev1 IDLE")
+        self.send(f"{tag} OK CAPABILITY completed")
+
+    def cmd_login(self, tag, args):
+        self.send(f"{tag} OK [CAPABILITY IMAP4rev1 IDLE] LOGIN completed")
+
+    def cmd_noop(self, tag, args):
+        self.send(f"{tag} OK NOOP completed")
+
+    def cmd_logout(self, tag, args):
+        self.send("* BYE Logging out")
+        self.send(f"{tag} OK LOGOUT completed")
+        self.wfile.flush()
+        return False
+
+    def cmd_select(self, tag, args):
+        with self.mailbox.lock:
+            total = len(self.mailbox.messages)
+            unseen = sum(1 for flags in self.mailbox.flags if "\\Seen" not in flags)
+        self.send(f"* {total} EXISTS")
+        self.send("* 0 RECENT")
+        self.send("* FLAGS (\\Seen \\Answered \\Flagged \\Deleted \\Draft)")
+        self.send(f"* OK [UNSEEN {unseen}] Message count")
+        self.send(f"* OK [UIDVALIDITY {UIDVALIDITY}] UIDs valid")
+        self.send(f"* OK [UIDNEXT {total + 1}] Predicted next UID")
+        self.send(f"{tag} OK [READ-WRITE] SELECT completed")
+
+    cmd_examine = cmd_select
+
+    def _search(self, args: str) -> list:
+        with self.mailbox.lock:
+            highest = len(self.mailbox.messages)
+            flags = list(self.mailbox.flags)
+        result = set(range(1, highest + 1))
+        tokens = args.replace("(", " ").replace(")", " ").split()
+        i = 0
+        while i < len(tokens):
+            token = tokens[i].upper()
+            if token == "UNSEEN":
+                result = {uid for uid in result if "\\Seen" not in flags[uid - 1]}
+            elif token == "SEEN":
+                result = {uid for uid in result if "\\Seen" in flags[uid - 1]}
+            elif token == "UID":
+                i += 1
+                result &= parse_sequence_set(tokens[i], highest)
+            elif token in ("ALL", "CHARSET"):
+                i += 1 if token == "CHARSET" else 0
+            elif token[0].isdigit() or token[0] == "*":
+                result &= parse_sequence_set(token, highest)
+            i += 1
+        return sorted(result)
+
+    def cmd_uid_search(self, tag, args):
+        self.send("* SEARCH " + " ".join(map(str, self._search(args))))
+        self.send(f"{tag} OK SEARCH completed")
+
+    cmd_search = cmd_uid_search
+
+    def cmd_uid_fetch(self, tag, args):
+        spec, _, items = args.partition(" ")
+        with self.mailbox.lock:
+            highest = len(self.mailbox.messages)
+        uids = sorted(uid for uid in parse_sequence_set(spec, highest) if 1 <= uid <= highest)
+        items_b = items.encode("utf-8")
+        fields_match = _FIELDS_RE.search(items_b)
+        if fields_match:
+            fields = tuple(f.decode().upper() for f in fields_match.group(1).split())
+            key = "BODY[HEADER.FIELDS (" + " ".join(fields) + ")]"
+        else:
+            fields = None
+            key = "RFC822" if b"RFC822" in items_b.upper() else "BODY[]"
+        peek = b"PEEK" in items_b.upper() or fields is not None
+        out = self.wfile
+        for uid in uids:
+            data = self.mailbox.header_fields(uid, fields) if fields else self.mailbox.messages[uid - 1]
+            out.write(f"* {uid} FETCH (UID {uid} {key} {{{len(data)}}}\r\n".encode("utf-8"))
+            out.write(data)
+            out.write(b")\r\n")
+            if not peek:
+                with self.mailbox.lock:
+                    self.mailbox.flags[uid - 1].add("\\Seen")
+        self.send(f"{tag} OK FETCH completed")
+
+    def cmd_uid_store(self, tag, args):
+        spec, _, rest = args.partition(" ")
+        mode, _, flag_list = rest.partition(" ")
+        flags = set(flag_list.strip("()").split())
+        with self.mailbox.lock:
+            highest = len(self.mailbox.messages)
+            uids = sorted(uid for uid in parse_sequence_set(spec, highest) if 1 <= uid <= highest)
+            for uid in uids:
+                current = self.mailbox.flags[uid - 1]
+                if mode.upper().startswith("+"):
+                    current |= flags
+                elif mode.upper().startswith("-"):
+                    current -= flags
+                else:
+                    current.clear()
+                    current |= flags
+            lines = [f"* {uid} FETCH (UID {uid} FLAGS ({' '.join(sorted(self.mailbox.flags[uid - 1]))}))"
+                     for uid in uids] if ".SILENT" not in mode.upper() else []
+        for line in lines:
+            self.send(line)
+        self.send(f"{tag} OK STORE completed")
+
+
+class IMAPStub(socketserver.ThreadingTCPServer):
+    """Servidor IMAP local en un hilo; `with IMAPStub(mailbox) as stub: stub.port`."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox: Mailbox, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), IMAPHandler)
+        self.mailbox = mailbox
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="imap-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
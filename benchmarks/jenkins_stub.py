@@ -0,0 +1,70 @@
+# benchmarks/jenkins_stub.py
+import time
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Endpoint local que imita buildWithParameters de Jenkins: responde 201 y
+# cuenta los lanzamientos. `latency` simula el tiempo de respuesta real.
+
+
+class JenkinsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como el Jenkins real
+
+    def _reply(self, status: int, body: bytes = b"") -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Sin crumbIssuer: el cliente sigue sin cabecera CSRF
+        self._reply(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        url = urlparse(self.path)
+        if not url.path.endswith("/buildWithParameters"):
+            self._reply(404)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with self.server.lock:
+            self.server.builds.append(params)
+        self._reply(201)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class JenkinsStub(ThreadingHTTPServer):
+    """Jenkins falso en un hilo; `builds` guarda los parámetros de cada lanzamiento."""
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), JenkinsHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.builds = []
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def reset(self) -> None:
+        with self.lock:
+            self.builds = []
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="jenkins-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,317 @@
+# benchmarks/mailbox_bench.py
+"""
+Benchmark del listener de correo contra un IMAP local.
+
+Siembra un buzón en memoria (benchmarks/imap_stub.py) con N correos sintéticos
+de alerta y de ruido y mide, en mensajes/s:
+
+  fetch         búsqueda UNSEEN + cabeceras + cuerpos de los candidatos
+  parse         message_text + AlertEnvelope.from_text (antes parse_email_body)
+  detect_alert  identificación de la alerta con el RuleMatcher
+  dispatch      process_unseen completo contra un Jenkins falso (extremo a extremo)
+
+Uso:
+  python benchmarks/mailbox_bench.py --sizes 100,1000,10000
+  python benchmarks/mailbox_bench.py --baseline benchmarks/results/mailbox_20250101_120000.json
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+import importlib
+import statistics
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email import message_from_bytes
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+for path in (os.path.join(ROOT_DIR, "src"), ROOT_DIR, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+from common import load_baseline, save_report
+from imap_stub import IMAPStub, Mailbox
+from jenkins_stub import JenkinsStub
+from utils.alert_envelope import AlertEnvelope, message_text
+
+DISCLAIMER = (
+    "---------------------------------------------------------------------------------------------------------------\n"
+    "Este mensaje va dirigido exclusivamente a su destinatario y puede contener información confidencial.\n"
+    "This message is addressed only to its recipient and may contain confidential information.\n"
+    "Viewnext, S.A."
+)
+NOISE_SENDERS = ("newsletter@proveedor.com", "rrhh@empresa.com", "noreply@jira.empresa.com",
+                 "monitor@otro-equipo.com", "compras@empresa.com")
+NOISE_SUBJECTS = ("Resumen semanal", "Nueva incidencia asignada", "Cambio planificado",
+                  "Factura pendiente", "Recordatorio de formación", "ALERTA ACTIVA - SERVEI EXTERN")
+AFECTACIONS = ("Usuaris externs", "Tots els usuaris", "Usuaris interns", "Servei parcial")
+CRITICITATS = ("Alta", "Mitjana", "Baixa", "Crítica")
+
+
+# ============================
+# Buzón sintético
+# ============================
+
+def alert_body(rule: dict, alert_type: str, received: datetime, rng: random.Random) -> str:
+    """Cuerpo con el formato de las alertas reales (Recepció, Criticitat, Afectació…)."""
+    lines = [
+        f"ALERTA {alert_type} - {rule['subject_contains']}",
+        f"Objecte: {rule['body_contains']}",
+        f"Recepció: {received:%d/%m/%Y %H:%M:%S}",
+        f"Inici: {received - timedelta(minutes=rng.randint(1, 10)):%d/%m/%Y %H:%M}",
+    ]
+    if alert_type == "RESUELTA":
+        lines.append(f"Recuperació: {received + timedelta(minutes=rng.randint(5, 90)):%d/%m/%Y %H:%M:%S}")
+    afectacio = rng.choice(AFECTACIONS)
+    lines += [
+        f"Criticitat: {rng.choice(CRITICITATS)} / Servei",
+        f"Afectació: {afectacio}",
+        f"Afectació: {afectacio}",
+        f"Descripció: Temps de resposta superior al llindar ({rng.randint(5, 60)}s)",
+        f"Error: HTTP {rng.choice((500, 502, 503, 504))} - Timeout en la petició de control",
+        "",
+        DISCLAIMER,
+    ]
+    return "\n".join(lines)
+
+
+def noise_body(rng: random.Random) -> str:
+    words = ("informe", "reunión", "entrega", "servidor", "ventana", "cambio", "revisión", "usuario")
+    paragraphs = [" ".join(rng.choice(words) for _ in range(rng.randint(20, 60))) for _ in range(rng.randint(2, 6))]
+    return "\n\n".join(paragraphs) + "\n\n" + DISCLAIMER
+
+
+def build_message(uid: int, sender: str, subject: str, body: str, html: bool) -> bytes:
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["To"] = "gsit.alertas@empresa.com"
+    msg["Subject"] = subject
+    msg["Message-ID"] = f"<bench-{uid}@imap-stub>"
+    if html:
+        paragraphs = "".join(f"<p>{line}</p>" for line in body.splitlines())
+        msg.set_content(f"<html><head><style>p {{margin: 0}}</style></head><body>{paragraphs}</body></html>",
+                        subtype="html")
+    else:
+        msg.set_content(body)
+    return msg.as_bytes()
+
+
+def build_mailbox(size: int, rules: dict, alert_ratio: float, seed: int):
+    """
+    Genera `size` correos: alertas de las reglas configuradas (ACTIVA/RESUELTA,
+    texto o HTML), casi-alertas que pasan el prefiltro de cabeceras pero no el
+    de cuerpo, y ruido.
+
+    :return: Tupla (mensajes, alertas_esperadas).
+    """
+    rng = random.Random(seed)
+    rules = list(rules.values())
+    received = datetime(2025, 1, 1, 8, 0, 0)
+    messages, expected = [], 0
+    for uid in range(1, size + 1):
+        roll = rng.random()
+        html = rng.random() < 0.5
+        if roll < alert_ratio:
+            rule = rng.choice(rules)
+            alert_type = rng.choice(("ACTIVA", "RESUELTA"))
+            received += timedelta(seconds=rng.randint(1, 120))  # Recepció única → ALERT_ID único
+            subject = f"ALERTA {alert_type} - {rule['subject_contains']}"
+            body = alert_body(rule, alert_type, received, rng)
+            expected += 1
+        elif roll < alert_ratio * 1.2:
+            rule = rng.choice(rules)
+            subject = f"RE: {rule['subject_contains']} - seguimiento"
+            body = noise_body(rng)
+            rule = {"from": rule["from"]}
+        else:
+            rule = {"from": rng.choice(NOISE_SENDERS)}
+            subject = rng.choice(NOISE_SUBJECTS)
+            body = noise_body(rng)
+        messages.append(build_message(uid, rule["from"], subject, body, html))
+    return messages, expected
+
+
+# ============================
+# Medición
+# ============================
+
+def measure(fn, repeat: int, setup=None) -> dict:
+    """Ejecuta fn() `repeat` veces; devuelve tiempos y el valor de la última ejecución."""
+    times, value = [], None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        value = fn()
+        times.append(time.perf_counter() - started)
+    return {"times": times, "value": value}
+
+
+def stage_stats(times: list, count: int) -> dict:
+    median = statistics.median(times)
+    return {
+        "messages": count,
+        "runs": len(times),
+        "best_s": round(min(times), 6),
+        "median_s": round(median, 6),
+        "msgs_per_s": round(count / median, 1) if median > 0 else None,
+    }
+
+
+def connect(listener, port: int):
+    from imapclient import IMAPClient
+    server = IMAPClient("127.0.0.1", port=port, ssl=False)
+    server.login("bench", "bench")
+    folder_info = server.select_folder("INBOX")
+    return server, folder_info.get(b"UIDVALIDITY")
+
+
+def fetch_pass(listener, port: int) -> list:
+    """Misma E/S que process_unseen: UNSEEN, cabeceras, prefiltro y cuerpos de candidatos."""
+    server, _ = connect(listener, port)
+    with server:
+        messages = sorted(server.search(["UNSEEN"]))
+        headers = server.fetch(messages, [listener.HEADER_FIELDS]) if messages else {}
+        candidates = {}
+        for uid in messages:
+            header_msg = message_from_bytes(headers.get(uid, {}).get(listener.HEADER_KEY, b""))
+            from_email = header_msg.get("From", "").lower()
+            subject = listener.decode_mime_words(header_msg.get("Subject", ""))
+            if listener.is_candidate(from_email, subject):
+                candidates[uid] = (from_email, subject, header_msg.get("Message-ID", "").strip())
+        bodies = server.fetch(list(candidates), ["BODY.PEEK[]"]) if candidates else {}
+    return [candidates[uid] + (bodies.get(uid, {}).get(b"BODY[]", b""),) for uid in candidates]
+
+
+def parse_pass(candidates: list) -> list:
+    parsed = []
+    for from_email, subject, message_id, raw in candidates:
+        body = message_text(message_from_bytes(raw))
+        parsed.append((AlertEnvelope.from_text(body, from_email, subject, message_id), body))
+    return parsed
+
+
+def detect_pass(listener, parsed: list) -> int:
+    return sum(1 for envelope, body in parsed if listener.detect_alert(envelope, body)[1])
+
+
+def reset_listener_state(listener, mailbox: Mailbox, jenkins: JenkinsStub) -> None:
+    """Buzón sin leer, checkpoint y registro de ingesta vacíos, Jenkins sin builds."""
+    mailbox.reset_flags()
+    jenkins.reset()
+    state_dir = tempfile.mkdtemp(prefix="state_", dir=os.environ["STATE_DIR"])
+    listener.LEDGER.close()
+    listener.STATE_DIR = state_dir
+    listener.CHECKPOINT_PATH = os.path.join(state_dir, "imap_checkpoint.json")
+    listener.LEDGER = listener.IngestionLedger(os.path.join(state_dir, "ingest_ledger.db"))
+
+
+def dispatch_pass(listener, port: int) -> None:
+    server, uidvalidity = connect(listener, port)
+    with server:
+        listener.process_unseen(server, uidvalidity)
+    listener.JENKINS.drain()
+
+
+def run_size(listener, jenkins: JenkinsStub, size: int, args) -> dict:
+    messages, expected = build_mailbox(size, listener.ALERTS, args.alert_ratio, args.seed)
+    mailbox = Mailbox(messages)
+    print(f"📬 Buzón de {size} correos ({expected} alertas)")
+    with IMAPStub(mailbox) as imap:
+        fetch = measure(lambda: fetch_pass(listener, imap.port), args.repeat)
+        candidates = fetch["value"]
+        parse = measure(lambda: parse_pass(candidates), args.repeat)
+        parsed = parse["value"]
+        detect = measure(lambda: detect_pass(listener, parsed), args.repeat)
+        dispatch = measure(lambda: dispatch_pass(listener, imap.port), args.repeat,
+                           setup=lambda: reset_listener_state(listener, mailbox, jenkins))
+    dispatched = len(jenkins.builds)
+    if dispatched != expected:
+        logging.error(f"❌ Lanzamientos en Jenkins: {dispatched}, esperados {expected}")
+    return {
+        "size": size,
+        "alerts": expected,
+        "candidates": len(candidates),
+        "detected": detect["value"],
+        "dispatched": dispatched,
+        "stages": {
+            "fetch": stage_stats(fetch["times"], size),
+            "parse": stage_stats(parse["times"], len(candidates)),
+            "detect_alert": stage_stats(detect["times"], len(parsed)),
+            "dispatch": stage_stats(dispatch["times"], size),
+        },
+    }
+
+
+# ============================
+# Resultados
+# ============================
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """Lista de regresiones (msgs/s por debajo de baseline * (1 - tolerance))."""
+    baseline = {r["size"]: r["stages"] for r in load_baseline(baseline_path)}
+    regressions = []
+    for result in results:
+        for stage, stats in result["stages"].items():
+            before = baseline.get(result["size"], {}).get(stage, {}).get("msgs_per_s")
+            now = stats["msgs_per_s"]
+            if not before or now is None:
+                continue
+            change = now / before - 1
+            print(f"{result['size']:>7} {stage:<13} {before:>10.1f} → {now:>10.1f} msgs/s ({change:+.1%})")
+            if change < -tolerance:
+                regressions.append(f"{stage}@{result['size']}: {before:.1f} → {now:.1f} msgs/s")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de throughput del buzón (IMAP local + Jenkins falso)")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Tamaños de buzón separados por comas")
+    parser.add_argument("--alert-ratio", type=float, default=0.3, help="Fracción de correos que son alertas")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por etapa (se informa la mediana)")
+    parser.add_argument("--jenkins-latency", type=float, default=0.0, help="Latencia simulada de Jenkins (s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Fichero JSON de resultados (por defecto benchmarks/results/)")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior con la que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Caída de msgs/s admitida frente al baseline")
+    parser.add_argument("--verbose", action="store_true", help="Mantener los logs del listener")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="mailbox_bench_") as tmp, \
+            JenkinsStub(latency=args.jenkins_latency) as jenkins:
+        # El listener se configura al importarse: apuntarlo al Jenkins falso y a un estado temporal
+        os.environ.update({
+            "JENKINS_URL": jenkins.url,
+            "STATE_DIR": tmp,
+            "RETRY_STORE": os.path.join(tmp, "retries.db"),
+            "ALERTS_CONFIG": os.getenv("ALERTS_CONFIG", os.path.join(ROOT_DIR, "config", "alerts.json")),
+        })
+        listener = importlib.import_module("email_listener")
+        # Sin esto el log de cada correo domina la medida
+        logging.disable(logging.NOTSET if args.verbose else logging.ERROR)
+
+        results = []
+        for size in sizes:
+            results.append(run_size(listener, jenkins, size, args))
+            for stage, stats in results[-1]["stages"].items():
+                print(f"{size:>7} {stage:<13} {stats['msgs_per_s'] or 0:>10.1f} msgs/s  "
+                      f"(mediana {stats['median_s']:.4f}s, {stats['messages']} correos)")
+        listener.JENKINS.close()
+
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "verbose")}
+    save_report("mailbox", params, results, args.output)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print("❌ Regresiones: " + "; ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# benchmarks/selenium_bench.py
+"""
+Benchmark de las comprobaciones Selenium contra la réplica local de los portales.
+
+Levanta benchmarks/fixture_site.py, apunta ACCES_FRONTAL_EMD_URL y
+AREA_PRIVADA_URL a ella y ejecuta cada comprobación con el runner real
+(mismo RunContext, mismos ctx.step), registrando la latencia de cada paso
+y la total. Sirve para medir cambios en la lógica de espera sin red.
+
+Uso:
+  python benchmarks/selenium_bench.py --iterations 3
+  python benchmarks/selenium_bench.py --scenarios ok,broken --delay documents=4 --pool 1
+  python benchmarks/selenium_bench.py --baseline benchmarks/results/selenium_20250101_120000.json
+"""
+import os
+import sys
+import shutil
+import argparse
+import statistics
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+for path in (os.path.join(ROOT_DIR, "src"), BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+from common import RESULTS_DIR, load_baseline, save_report
+from fixture_site import FixtureSite, ACCES_PATH, AREA_PRIVADA_PATH, SCENARIOS
+
+# Comprobaciones con réplica local y la variable de entorno de su URL
+CHECKS = {
+    "acces_frontal_emd": ("ACCES_FRONTAL_EMD_URL", ACCES_PATH),
+    "area_privada": ("AREA_PRIVADA_URL", AREA_PRIVADA_PATH + "#/acces"),
+}
+EXPECTED_VERDICT = {"ok": "falso_positivo", "broken": "alarma_confirmada", "down": "alarma_confirmada"}
+
+
+def parse_delays(items) -> dict:
+    """['documents=4', 'home=0.2'] -> {'documents': 4.0, 'home': 0.2}."""
+    delays = {}
+    for item in items or []:
+        page, _, seconds = item.partition("=")
+        delays[page.strip()] = float(seconds)
+    return delays
+
+
+def summarize(values: list) -> dict:
+    return {
+        "median_s": round(statistics.median(values), 3),
+        "min_s": round(min(values), 3),
+        "max_s": round(max(values), 3),
+    }
+
+
+def run_iterations(runner, check: str, scenario: str, args, stamp: str) -> dict:
+    """Ejecuta la comprobación `iterations` veces y agrega los tiempos por paso y total."""
+    from dispatcher.plugin import RunContext
+    totals, steps, waits, verdicts, failing = [], {}, {}, {}, {}
+    for i in range(1, args.iterations + 1):
+        context = RunContext(
+            alert_id=f"bench_{stamp}_{check}_{scenario}_{i}",
+            script=check,
+            alert_name=f"Benchmark {check}",
+            alert_type="ACTIVA",
+            profile=args.profile,
+        )
+        result = runner.run_check(context)
+        totals.append(result.total_s)
+        verdicts[str(result.verdict)] = verdicts.get(str(result.verdict), 0) + 1
+        if result.failing_step:
+            failing[result.failing_step] = failing.get(result.failing_step, 0) + 1
+        for step in result.steps:
+            steps.setdefault(step.name, []).append(step.duration_s)
+            waits.setdefault(step.name, []).append(step.wait_s)
+        print(f"  {check:<20} {scenario:<7} #{i}: {result.verdict} en {result.total_s}s")
+        if not args.keep_runs:
+            shutil.rmtree(context.run_dir, ignore_errors=True)
+
+    expected = EXPECTED_VERDICT[scenario]
+    if verdicts.get(expected, 0) != args.iterations:
+        print(f"❌ {check}/{scenario}: veredictos {verdicts}, se esperaba {expected}")
+    return {
+        "check": check,
+        "scenario": scenario,
+        "iterations": args.iterations,
+        "expected_verdict": expected,
+        "verdicts": verdicts,
+        "failing_steps": failing,
+        "total": summarize(totals),
+        "steps": {name: dict(summarize(values), runs=len(values),
+                             wait_median_s=round(statistics.median(waits[name]), 3))
+                  for name, values in steps.items()},
+    }
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """Lista de regresiones (mediana total o de paso por encima de baseline * (1 + tolerance))."""
+    baseline = {(r["check"], r["scenario"]): r for r in load_baseline(baseline_path)}
+    regressions = []
+    for result in results:
+        before = baseline.get((result["check"], result["scenario"]))
+        if not before:
+            continue
+        pairs = [("total", before["total"], result["total"])]
+        pairs += [(name, before["steps"][name], stats) for name, stats in result["steps"].items()
+                  if name in before["steps"]]
+        for name, old, new in pairs:
+            if not old["median_s"]:
+                continue
+            change = new["median_s"] / old["median_s"] - 1
+            label = f"{result['check']}/{result['scenario']}/{name}"
+            print(f"{label:<55} {old['median_s']:>8.3f}s → {new['median_s']:>8.3f}s ({change:+.1%})")
+            if change > tolerance:
+                regressions.append(f"{label}: {old['median_s']:.3f}s → {new['median_s']:.3f}s")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Latencia por paso de las comprobaciones Selenium (réplica local)")
+    parser.add_argument("--checks", default=",".join(CHECKS), help="Comprobaciones separadas por comas")
+    parser.add_argument("--scenarios", default="ok", help=f"Escenarios de la réplica: {', '.join(SCENARIOS)}")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--delay", action="append", metavar="PAGINA=SEGUNDOS",
+                        help="Retardo del spinner de una página (repetible), p. ej. documents=4")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia HTTP de la réplica (s)")
+    parser.add_argument("--pool", type=int, default=0, help="Firefox precalentados (0 = arranque en frío)")
+    parser.add_argument("--profile", default=os.path.join(ROOT_DIR, "profiles", "selenium_cert"))
+    parser.add_argument("--keep-runs", action="store_true", help="No borrar runs/<ALERT_ID> de cada iteración")
+    parser.add_argument("--output", help="Fichero JSON de resultados (por defecto benchmarks/results/)")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior con la que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Aumento de latencia admitido frente al baseline")
+    args = parser.parse_args()
+    checks = [c.strip() for c in args.checks.split(",") if c.strip()]
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    for check in checks:
+        if check not in CHECKS:
+            parser.error(f"Comprobación sin réplica local: {check}. Disponibles: {', '.join(CHECKS)}")
+
+    # Scripts, loader y runs/ se resuelven desde WORKSPACE: la raíz del repo
+    os.environ["WORKSPACE"] = ROOT_DIR
+    # Las métricas de los benchmarks no se mezclan con las de producción
+    os.environ.setdefault("METRICS_DB", os.path.join(RESULTS_DIR, "metrics", "metrics.db"))
+    os.environ.setdefault("METRICS_TEXTFILE_DIR", os.path.join(RESULTS_DIR, "metrics"))
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    results = []
+    with FixtureSite(delays=parse_delays(args.delay), latency=args.latency) as site:
+        # Los scripts leen su URL al importarse: fijarla antes de cargar el runner
+        for check in checks:
+            env_name, path = CHECKS[check]
+            os.environ[env_name] = site.url + path
+        import runner
+        from browser.pool import configure_pool, shutdown_pool
+        if args.pool:
+            configure_pool(args.profile, args.pool)
+        try:
+            for scenario in scenarios:
+                site.set_scenario(scenario)
+                for check in checks:
+                    results.append(run_iterations(runner, check, scenario, args, stamp))
+        finally:
+            shutdown_pool()
+
+    for result in results:
+        print(f"{result['check']:<20} {result['scenario']:<7} total {result['total']['median_s']:>7.3f}s "
+              f"(min {result['total']['min_s']:.3f}s) {result['verdicts']}")
+        for name, stats in result["steps"].items():
+            print(f"    {name:<22} {stats['median_s']:>7.3f}s (esperando {stats['wait_median_s']:.3f}s)")
+
+    params = {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "keep_runs")}
+    params["delays"] = site.delays
+    save_report("selenium", params, results, args.output)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print("❌ Regresiones: " + "; ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# src/browser/driver.py
+import os
+import json
+import shutil
+import logging
+from selenium import webdriver
+from selenium.webdriver.firefox.options import Options
+from selenium.webdriver.firefox.service import Service
+from browser.profile import STATE_DIR, clone_profile
+
+
+PAGE_LOAD_TIMEOUT = int(os.getenv("PAGE_LOAD_TIMEOUT", "60"))
+GECKODRIVER_CACHE = os.path.join(STATE_DIR, "geckodriver.json")
+
+_geckodriver_path = None
+
+
+def _read_cached_geckodriver():
+    try:
+        with open(GECKODRIVER_CACHE, "r", encoding="utf-8") as f:
+            path = json.load(f).get("path")
+    except (OSError, ValueError):
+        return None
+    return path if path and os.path.isfile(path) else None
+
+
+def _write_cached_geckodriver(path: str) -> None:
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        with open(GECKODRIVER_CACHE, "w", encoding="utf-8") as f:
+            json.dump({"path": path}, f)
+    except OSError as e:
+        logging.warning(f"No se pudo cachear la ruta de geckodriver: {e}")
+
+
+def resolve_geckodriver() -> str:
+    """
+    Ruta de geckodriver: GECKODRIVER_PATH, el del PATH, la última resuelta
+    (state/geckodriver.json, funciona sin red) o, en último caso, webdriver-manager.
+    """
+    global _geckodriver_path
+    if _geckodriver_path:
+        return _geckodriver_path
+
+    path = os.getenv("GECKODRIVER_PATH") or shutil.which("geckodriver") or _read_cached_geckodriver()
+    if not path:
+        from webdriver_manager.firefox import GeckoDriverManager
+        path = GeckoDriverManager().install()
+        _write_cached_geckodriver(path)
+    _geckodriver_path = path
+    return path
+
+
+class ProfiledFirefox(webdriver.Firefox):
+    """Firefox que borra su clon de perfil al cerrarse."""
+
+    profile_dir = None
+
+    def quit(self) -> None:
+        try:
+            super().quit()
+        finally:
+            if self.profile_dir:
+                shutil.rmtree(self.profile_dir, ignore_errors=True)
+                self.profile_dir = None
+
+
+def build_options(profile_dir: str) -> Options:
+    """Opciones comunes de Firefox headless para todas las comprobaciones."""
+    options = Options()
+    options.add_argument("--headless")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--window-size=1920,1080")
+    # Perfil ya clonado: Firefox lo usa en sitio, sin el zip/base64 de FirefoxProfile
+    options.add_argument("-profile")
+    options.add_argument(profile_dir)
+    return options
+
+
+def create_driver(profile_path: str) -> webdriver.Firefox:
+    """Arranca un Firefox WebDriver nuevo sobre un clon podado del perfil de certificado.
+
+
+    Lanza FileNotFoundError si el perfil no existe.
+    """
+    profile_dir = clone_profile(profile_path)
+    try:
+        service = Service(resolve_geckodriver())
+        driver = ProfiledFirefox(service=service, options=build_options(profile_dir))
+    except Exception:
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        raise
+    driver.profile_dir = profile_dir
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    return driver
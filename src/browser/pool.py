@@ -0,0 +1,257 @@
+# src/browser/pool.py
+import os
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from browser.driver import create_driver
+
+
+POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "0"))             # 0 = sin pool (arranque en frío)
+POOL_MAX_USES = int(os.getenv("BROWSER_POOL_MAX_USES", "20"))     # reciclar tras N préstamos
+POOL_MAX_RSS_MB = int(os.getenv("BROWSER_POOL_MAX_RSS_MB", "1500"))
+POOL_LEASE_TIMEOUT = int(os.getenv("BROWSER_POOL_LEASE_TIMEOUT", "120"))
+
+# Limpieza de estado entre préstamos desde el contexto privilegiado de Firefox:
+# cookies, localStorage/sessionStorage y caché TLS/HTTP auth (se conserva la
+# decisión recordada de certificado cliente).
+_RESET_CHROME_SCRIPT = """
+const done = arguments[arguments.length - 1];
+const flags = Ci.nsIClearDataService.CLEAR_COOKIES
+            | Ci.nsIClearDataService.CLEAR_DOM_STORAGES
+            | Ci.nsIClearDataService.CLEAR_AUTH_CACHE;
+Services.clearData.deleteData(flags, () => done(true));
+"""
+
+
+def _process_tree_rss_mb(pid: int) -> float:
+    """Memoria residente (MB) de un proceso y sus hijos, leída de /proc."""
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+            with open(f"/proc/{current}/task/{current}/children", "r") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total_kb / 1024
+
+
+class PooledSession:
+    """Un Firefox arrancado y su contador de usos."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.monotonic()
+
+    def is_healthy(self) -> bool:
+        try:
+            return self.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def rss_mb(self) -> float:
+        pid = self.driver.capabilities.get("moz:processID")
+        return _process_tree_rss_mb(pid) if pid else 0.0
+
+    def reset(self) -> None:
+        """Deja la sesión como recién arrancada: una pestaña, about:blank y sin cookies/almacenamiento."""
+        driver = self.driver
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.switch_to.default_content()
+        try:
+            with driver.context(driver.CONTEXT_CHROME):
+                driver.execute_async_script(_RESET_CHROME_SCRIPT)
+        except Exception:
+            # Sin acceso al contexto chrome: limpiar al menos el dominio actual
+            driver.delete_all_cookies()
+            driver.execute_script("try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}")
+        driver.get("about:blank")
+
+    def quit(self) -> None:
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logging.warning(f"No se pudo cerrar Firefox del pool: {e}")
+
+
+class FirefoxPool:
+    """
+    Pool de sesiones Firefox precalentadas.
+
+    Las comprobaciones piden prestada una sesión con `lease()` y la devuelven
+    al terminar. Antes de prestarla se verifica que responde; al devolverla se
+    limpia su estado o se recicla si superó `max_uses` préstamos o
+    `max_rss_mb` de memoria, arrancando una sustituta en segundo plano.
+    """
+
+    def __init__(self, profile_path: str, size: int = 2, max_uses: int = POOL_MAX_USES,
+                 max_rss_mb: int = POOL_MAX_RSS_MB, lease_timeout: int = POOL_LEASE_TIMEOUT):
+        self.profile_path = profile_path
+        self.size = size
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+        self.lease_timeout = lease_timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._total = 0
+        self._closed = False
+
+    def warm_up(self) -> None:
+        """Arranca en segundo plano las sesiones que falten hasta `size`."""
+        while self._reserve_slot():
+            threading.Thread(target=self._spawn_into_idle, daemon=True).start()
+
+    def _reserve_slot(self) -> bool:
+        with self._lock:
+            if self._closed or self._total >= self.size:
+                return False
+            self._total += 1
+            return True
+
+    def _free_slot(self) -> None:
+        with self._lock:
+            self._total -= 1
+
+    def _spawn(self) -> PooledSession:
+        started = time.monotonic()
+        try:
+            session = PooledSession(create_driver(self.profile_path))
+        except Exception:
+            self._free_slot()
+            raise
+        logging.info(f"Firefox del pool arrancado en {time.monotonic() - started:.1f}s")
+        return session
+
+    def _spawn_into_idle(self) -> None:
+        try:
+            self._idle.put(self._spawn())
+        except Exception as e:
+            logging.error(f"No se pudo arrancar Firefox para el pool: {e}")
+
+    def _discard(self, session: PooledSession, reason: str) -> None:
+        logging.info(f"Reciclando Firefox del pool ({reason}, {session.uses} usos)")
+        session.quit()
+        self._free_slot()
+        self.warm_up()
+
+    def acquire(self) -> PooledSession:
+        deadline = time.monotonic() + self.lease_timeout
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                if self._reserve_slot():
+                    return self._spawn()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("No hay sesiones Firefox libres en el pool")
+                try:
+                    session = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+            if session.is_healthy():
+                return session
+            self._discard(session, "no responde")
+
+    def release(self, session: PooledSession, broken: bool = False) -> None:
+        session.uses += 1
+        if self._closed:
+            session.quit()
+            self._free_slot()
+            return
+        if broken:
+            self._discard(session, "error durante el préstamo")
+            return
+        if session.uses >= self.max_uses:
+            self._discard(session, "máximo de usos")
+            return
+        if self.max_rss_mb and session.rss_mb() > self.max_rss_mb:
+            self._discard(session, "umbral de memoria")
+            return
+        try:
+            session.reset()
+        except Exception as e:
+            self._discard(session, f"fallo al limpiar estado: {e}")
+            return
+        self._idle.put(session)
+
+    @contextmanager
+    def lease(self):
+        session = self.acquire()
+        broken = False
+        try:
+            yield session.driver
+        except BaseException:
+            broken = True
+            raise
+        finally:
+            self.release(session, broken=broken)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            session.quit()
+            self._free_slot()
+
+
+_POOL = None
+
+
+def configure_pool(profile_path: str, size: int = POOL_SIZE) -> FirefoxPool:
+    """Crea (y precalienta) el pool global. Solo tiene sentido en procesos de larga duración."""
+    global _POOL
+    if _POOL is not None:
+        _POOL.close()
+    _POOL = FirefoxPool(profile_path, size=size) if size > 0 else None
+    if _POOL is not None:
+        _POOL.warm_up()
+    return _POOL
+
+
+def forget_pool() -> None:
+    """Olvida el pool sin cerrarlo (procesos hijos creados por fork)."""
+    global _POOL
+    _POOL = None
+
+
+def shutdown_pool() -> None:
+    global _POOL
+    if _POOL is not None:
+        _POOL.close()
+        _POOL = None
+
+
+@contextmanager
+def lease_driver(profile_path: str):
+    """
+    Presta un Firefox del pool global si está configurado para ese perfil;
+    si no, arranca uno en frío y lo cierra al terminar.
+    """
+    pool = _POOL
+    if pool is not None and pool.profile_path == profile_path:
+        with pool.lease() as driver:
+            yield driver
+        return
+    driver = create_driver(profile_path)
+    try:
+        yield driver
+    finally:
+        driver.quit()
@@ -0,0 +1,40 @@
+# src/browser/probes.py
+
+
+# Todos los selectores viajan en un único execute_script: CSS con
+# querySelectorAll y XPath (los que empiezan por "/" o "(") con
+# document.evaluate. Solo vuelve un resumen de lo encontrado.
+_ERROR_SCAN_SCRIPT = """
+const selectors = arguments[0], maxText = arguments[1];
+const report = [];
+for (const sel of selectors) {
+    let nodes = [];
+    try {
+        if (sel.startsWith('/') || sel.startsWith('(')) {
+            const snap = document.evaluate(sel, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            for (let i = 0; i < snap.snapshotLength; i++) nodes.push(snap.snapshotItem(i));
+        } else {
+            nodes = Array.from(document.querySelectorAll(sel));
+        }
+    } catch (e) {
+        continue;
+    }
+    if (nodes.length) {
+        const text = (nodes[0].textContent || '').replace(/\\s+/g, ' ').trim().slice(0, maxText);
+        report.push({selector: sel, count: nodes.length, text: text});
+    }
+}
+return report;
+"""
+
+
+def scan_errors(driver, selectors, max_text: int = 200) -> list:
+    """
+    Busca indicadores de error en la página con un solo round trip.
+
+    :param selectors: Lista de selectores CSS o XPath.
+    :return: Lista de {selector, count, text} de los selectores con coincidencias.
+    """
+    if not selectors:
+        return []
+    return driver.execute_script(_ERROR_SCAN_SCRIPT, list(selectors), max_text) or []
@@ -0,0 +1,106 @@
+# src/browser/profile.py
+import os
+import shutil
+import hashlib
+import tempfile
+
+
+WORKSPACE = os.getenv("WORKSPACE", os.getcwd())
+STATE_DIR = os.getenv("STATE_DIR", os.path.join(WORKSPACE, "state"))
+PROFILE_CACHE_DIR = os.path.join(STATE_DIR, "profiles")
+
+# Lo imprescindible para la autenticación con certificado cliente.
+# Telemetría, sesiones, caches, plugins y WAL de sqlite se descartan.
+PROFILE_KEEP_FILES = tuple(
+    name.strip() for name in os.getenv(
+        "PROFILE_KEEP_FILES",
+        "cert9.db,key4.db,pkcs11.txt,prefs.js,user.js,ClientAuthRememberList.bin,"
+        "cert_override.txt,SiteSecurityServiceState.bin,permissions.sqlite,handlers.json",
+    ).split(",") if name.strip()
+)
+
+
+def _clone_root() -> str:
+    """Directorio para los clones por ejecución: tmpfs (/dev/shm) si está disponible."""
+    configured = os.getenv("PROFILE_CLONE_DIR")
+    if configured:
+        return configured
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def _kept_files(source_dir: str):
+    for name in PROFILE_KEEP_FILES:
+        path = os.path.join(source_dir, name)
+        if os.path.isfile(path) and not os.path.islink(path):
+            yield name, path
+
+
+def profile_digest(source_dir: str) -> str:
+    """Hash del contenido de los ficheros conservados del perfil."""
+    digest = hashlib.sha256()
+    for name, path in _kept_files(source_dir):
+        digest.update(name.encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def prepare_profile(source_dir: str) -> str:
+    """
+    Devuelve un perfil podado y cacheado por hash de contenido.
+
+    Solo se reconstruye cuando cambia alguno de los ficheros conservados;
+    la creación es atómica para que varias ejecuciones no se pisen.
+    """
+    if not os.path.isdir(source_dir):
+        raise FileNotFoundError(f"Perfil Selenium no encontrado en: {source_dir}")
+    cached_dir = os.path.join(PROFILE_CACHE_DIR, profile_digest(source_dir))
+    if os.path.isdir(cached_dir):
+        return cached_dir
+
+    os.makedirs(PROFILE_CACHE_DIR, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=PROFILE_CACHE_DIR, prefix=".build_")
+    for name, path in _kept_files(source_dir):
+        shutil.copy2(path, os.path.join(build_dir, name))
+    try:
+        os.rename(build_dir, cached_dir)
+    except OSError:
+        # Otra ejecución lo ha creado a la vez
+        shutil.rmtree(build_dir, ignore_errors=True)
+    return cached_dir
+
+
+def _fast_copy(src: str, dst: str) -> None:
+    """Copia con copy_file_range (reflink en btrfs/xfs) y recurre a shutil si no es posible."""
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is not None:
+        try:
+            with open(src, "rb") as fin, open(dst, "wb") as fout:
+                remaining = os.fstat(fin.fileno()).st_size
+                while remaining > 0:
+                    copied = copy_file_range(fin.fileno(), fout.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining == 0:
+                return
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+
+
+def clone_profile(source_dir: str) -> str:
+    """
+    Crea un clon desechable del perfil podado para una sesión de Firefox.
+
+    Firefox escribe en su perfil (sqlite), por eso cada sesión recibe su
+    propia copia en lugar de compartir la cacheada.
+    """
+    cached_dir = prepare_profile(source_dir)
+    clone_dir = tempfile.mkdtemp(dir=_clone_root(), prefix="gsit_profile_")
+    for name in os.listdir(cached_dir):
+        _fast_copy(os.path.join(cached_dir, name), os.path.join(clone_dir, name))
+    return clone_dir
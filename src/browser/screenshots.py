@@ -0,0 +1,140 @@
+# src/browser/screenshots.py
+import io
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Optional
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow es opcional: sin él se guarda el PNG tal cual
+    Image = None
+
+
+# full: resolución completa; thumbnail: miniatura; none: sin captura
+SUCCESS_POLICY = os.getenv("SCREENSHOT_ON_SUCCESS", "thumbnail")
+FAILURE_POLICY = os.getenv("SCREENSHOT_ON_FAILURE", "full")
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "jpeg")          # jpeg | png (jpeg requiere Pillow)
+JPEG_QUALITY = int(os.getenv("SCREENSHOT_JPEG_QUALITY", "80"))
+THUMB_WIDTH = int(os.getenv("SCREENSHOT_THUMB_WIDTH", "480"))
+RUN_MAX_BYTES = int(os.getenv("SCREENSHOT_RUN_MAX_BYTES", str(5 * 1024 * 1024)))
+WRITER_WORKERS = int(os.getenv("SCREENSHOT_WORKERS", "2"))
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Pool de escritura del proceso (se recrea en un hijo de fork: los hilos no se heredan)."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=WRITER_WORKERS, thread_name_prefix="screenshot")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def effective_policy(success: bool) -> str:
+    """Política de la captura; una miniatura sin Pillow no se puede generar y pasa a none."""
+    policy = SUCCESS_POLICY if success else FAILURE_POLICY
+    if policy == "thumbnail" and Image is None:
+        return "none"
+    return policy
+
+
+def encode(png: bytes, policy: str) -> bytes:
+    """Reduce (miniatura) y recomprime la captura; sin Pillow devuelve el PNG original."""
+    if Image is None:
+        return png
+    image = Image.open(io.BytesIO(png))
+    if policy == "thumbnail":
+        image.thumbnail((THUMB_WIDTH, THUMB_WIDTH * 4))
+    out = io.BytesIO()
+    if SCREENSHOT_FORMAT == "jpeg":
+        image.convert("RGB").save(out, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    else:
+        image.save(out, "PNG", optimize=True)
+    return out.getvalue()
+
+
+def extension() -> str:
+    return ".jpg" if Image is not None and SCREENSHOT_FORMAT == "jpeg" else ".png"
+
+
+class RunScreenshots:
+    """
+    Capturas de una ejecución (runs/<ALERT_ID>/screenshots).
+
+    - La captura se toma en el hilo del script (la página de ese instante);
+      recomprimir y escribir a disco se hace en segundo plano.
+    - Un fotograma idéntico a uno ya guardado no se vuelve a escribir: se
+      devuelve la ruta del anterior.
+    - Las escrituras que superarían `max_bytes` para la ejecución se descartan.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = RUN_MAX_BYTES, log=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._log = log or (lambda level, message: logging.info(message))
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._by_digest = {}
+        self._pending = []
+
+    def capture(self, driver, name: str, success: bool = False) -> Optional[str]:
+        """
+        Toma la captura y encola su escritura.
+
+        :return: Ruta donde quedará la imagen, o None si la política no guarda captura.
+        """
+        policy = effective_policy(success)
+        if policy == "none":
+            return None
+        png = driver.get_screenshot_as_png()
+        digest = hashlib.sha1(png).hexdigest()
+        with self._lock:
+            if digest in self._by_digest:
+                return self._by_digest[digest]
+            path = os.path.join(self.directory, f"{name}{extension()}")
+            self._by_digest[digest] = path
+            self._pending.append((path, _get_executor().submit(self._write, png, path, policy)))
+        return path
+
+    def _write(self, png: bytes, path: str, policy: str) -> Optional[str]:
+        try:
+            data = encode(png, policy)
+        except Exception as e:
+            self._log("warn", f"No se pudo recomprimir la captura {path}, se guarda sin recomprimir: {e}")
+            data = png
+        with self._lock:
+            if self._bytes + len(data) > self.max_bytes:
+                self._log("warn", f"Captura descartada por el límite de {self.max_bytes} bytes por ejecución: {path}")
+                return None
+            self._bytes += len(data)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".shot.")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self._log("error", f"No se pudo guardar la captura {path}: {e}")
+            return None
+        return path
+
+    def wait(self, timeout: Optional[float] = None) -> List[str]:
+        """Espera a las escrituras pendientes y devuelve las rutas escritas, en orden de captura."""
+        with self._lock:
+            pending = list(self._pending)
+        wait([future for _, future in pending], timeout=timeout)
+        written = []
+        for path, future in pending:
+            if not future.done():
+                self._log("warn", f"Captura todavía escribiéndose: {path}")
+            elif future.result():
+                written.append(path)
+        return written
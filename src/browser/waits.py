@@ -0,0 +1,286 @@
+# src/browser/waits.py
+import time
+from selenium.common.exceptions import (
+    JavascriptException, StaleElementReferenceException, TimeoutException, WebDriverException,
+)
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+
+# Spinners, overlays y modales que indican que la página aún no está lista
+LOADER_SELECTORS = [
+    ".spinner", ".loading", ".loader", "[class*='spinner']", "[class*='loading']",
+    "app-root[loading]", "div[id*='loader']", ".overlay", ".blocker",
+    "body > div[style*='block']", "div[role='dialog']", ".modal-backdrop"
+]
+
+QUIET_MS = 300  # sin mutaciones del DOM ni actividad de red durante este tiempo = página en calma
+# La calma es orientativa: sin loaders visibles, como mucho se espera esto a que
+# llegue (una página con sondeos o animaciones continuas nunca está en calma)
+QUIET_CAP_MS = 2000
+
+# Contador de peticiones fetch/XHR en vuelo, instalado una vez por documento.
+# Los recursos ya descargados (imágenes, scripts) se siguen con la Resource
+# Timing API: un cambio en el número de entradas cuenta como actividad de red.
+_NETWORK_TRACKER = """
+if (!window.__gsitNet) {
+    const net = window.__gsitNet = {inflight: 0, last: performance.now()};
+    const begin = () => { net.inflight++; net.last = performance.now(); };
+    const end = () => { net.inflight = Math.max(0, net.inflight - 1); net.last = performance.now(); };
+    if (window.fetch) {
+        const originalFetch = window.fetch;
+        window.fetch = function () {
+            begin();
+            return originalFetch.apply(this, arguments).finally(end);
+        };
+    }
+    const originalSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        begin();
+        this.addEventListener('loadend', end, {once: true});
+        return originalSend.apply(this, arguments);
+    };
+}
+"""
+
+# Un único script por espera: comprueba todos los selectores en cada sondeo y
+# observa el DOM con un MutationObserver; resuelve en cuanto no queda ningún
+# loader visible, el documento ha cargado y ni el DOM ni la red han tenido
+# actividad durante QUIET_MS. Si no llega la calma, resuelve igualmente tras
+# quietCapMs sin loaders visibles, o al agotar el tiempo.
+_PAGE_IDLE_SCRIPT = _NETWORK_TRACKER + """
+const selectors = arguments[0], timeoutMs = arguments[1], quietMs = arguments[2], quietCapMs = arguments[3];
+const done = arguments[arguments.length - 1];
+const start = performance.now();
+const net = window.__gsitNet;
+let lastMutation = start;
+let clearSince = null;
+let resources = performance.getEntriesByType('resource').length;
+let finished = false;
+
+function visible(el) {
+    const style = getComputedStyle(el);
+    if (style.display === 'none' || style.visibility === 'hidden' || style.opacity === '0') return false;
+    const rect = el.getBoundingClientRect();
+    return rect.width > 0 && rect.height > 0;
+}
+function blockingSelector() {
+    for (const sel of selectors) {
+        let elems;
+        try { elems = document.querySelectorAll(sel); } catch (e) { continue; }
+        for (const el of elems) { if (visible(el)) return sel; }
+    }
+    return null;
+}
+const observer = new MutationObserver(() => { lastMutation = performance.now(); });
+observer.observe(document.documentElement, {childList: true, subtree: true, attributes: true, characterData: true});
+
+function networkIdle(now) {
+    const count = performance.getEntriesByType('resource').length;
+    if (count !== resources) { resources = count; net.last = now; }
+    return document.readyState === 'complete' && net.inflight === 0 && now - net.last >= quietMs;
+}
+function finish(blocking, quiet, networkQuiet) {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    done({idle: blocking === null, quiet: quiet, network_idle: networkQuiet, blocking: blocking,
+          inflight: net.inflight, elapsed_ms: Math.round(performance.now() - start)});
+}
+function tick() {
+    const blocking = blockingSelector();
+    const now = performance.now();
+    const networkQuiet = networkIdle(now);
+    const quiet = now - lastMutation >= quietMs && networkQuiet;
+    if (blocking === null && quiet) return finish(null, true, true);
+    clearSince = blocking === null && document.readyState === 'complete' ? (clearSince === null ? now : clearSince) : null;
+    if (clearSince !== null && now - clearSince >= quietCapMs) return finish(null, false, networkQuiet);
+    if (now - start >= timeoutMs) return finish(blocking, quiet, networkQuiet);
+    setTimeout(tick, 50);
+}
+tick();
+"""
+
+# Desplaza el elemento al centro y sondea hasta que sea clicable de verdad:
+# visible, habilitado, sin nada encima (elementFromPoint, también dentro de un
+# shadow root) y con la misma posición en dos sondeos seguidos (sin animación).
+_CLICKABLE_SCRIPT = """
+const el = arguments[0], timeoutMs = arguments[1];
+const done = arguments[arguments.length - 1];
+const start = performance.now();
+let lastRect = null, stableTicks = 0;
+
+function check() {
+    const style = getComputedStyle(el);
+    const rect = el.getBoundingClientRect();
+    const visible = el.isConnected && style.display !== 'none' && style.visibility !== 'hidden'
+        && style.opacity !== '0' && rect.width > 0 && rect.height > 0;
+    const enabled = !el.disabled && el.getAttribute('aria-disabled') !== 'true';
+    let onTop = false;
+    if (visible) {
+        const root = el.getRootNode();
+        const hit = (root.elementFromPoint ? root : document).elementFromPoint(
+            rect.left + rect.width / 2, rect.top + rect.height / 2);
+        onTop = hit !== null && (hit === el || el.contains(hit));
+    }
+    const key = [rect.left, rect.top, rect.width, rect.height].map(Math.round).join(',');
+    stableTicks = key === lastRect ? stableTicks + 1 : 0;
+    lastRect = key;
+    return {visible: visible, enabled: enabled, on_top: onTop, stable: stableTicks >= 1};
+}
+el.scrollIntoView({block: 'center'});
+function tick() {
+    const state = check();
+    const ready = state.visible && state.enabled && state.on_top && state.stable;
+    const elapsed = performance.now() - start;
+    if (ready || elapsed >= timeoutMs) {
+        state.clickable = ready;
+        state.elapsed_ms = Math.round(elapsed);
+        return done(state);
+    }
+    setTimeout(tick, 50);
+}
+tick();
+"""
+
+
+def _is_transient(error: WebDriverException) -> bool:
+    """Error de un script asíncrono que se arregla reintentando: timeout o documento sustituido."""
+    # Selenium traduce "script timeout" a TimeoutException
+    if isinstance(error, (TimeoutException, StaleElementReferenceException)):
+        return True
+    message = (error.msg or "").lower() if isinstance(error, JavascriptException) else ""
+    return "unload" in message or "navigat" in message
+
+
+def wait_for_page_idle(driver, timeout: float, selectors=None, quiet_ms: int = QUIET_MS,
+                       quiet_cap_ms: int = QUIET_CAP_MS) -> dict:
+    """
+    Espera a que la página esté lista en un solo round trip por intento.
+    Sin loaders visibles, la calma (quiet) se espera como mucho `quiet_cap_ms`.
+    Solo se reintenta ante timeouts del script o navegaciones; cualquier otro
+    error (p. ej. sesión cerrada) se propaga al momento.
+
+    :return: dict con idle (ningún loader visible), quiet (DOM y red sin
+             actividad), network_idle, blocking (selector que seguía visible),
+             inflight (peticiones fetch/XHR pendientes) y elapsed_ms.
+    """
+    selectors = selectors or LOADER_SELECTORS
+    deadline = time.monotonic() + timeout
+    previous_script_timeout = driver.timeouts.script
+    state = {"idle": False, "quiet": False, "blocking": None, "elapsed_ms": 0}
+    try:
+        driver.set_script_timeout(timeout + 5)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return state
+            try:
+                state = driver.execute_async_script(_PAGE_IDLE_SCRIPT, selectors, int(remaining * 1000),
+                                                    quiet_ms, quiet_cap_ms)
+                return state
+            except WebDriverException as e:
+                if not _is_transient(e):
+                    raise
+                # Navegación en curso (documento descargado): reintentar en el nuevo documento
+                time.sleep(0.1)
+    finally:
+        driver.set_script_timeout(previous_script_timeout)
+
+
+def wait_for_loaders(ctx, driver, timeout: float) -> bool:
+    """
+    Espera a que desaparezcan elementos de carga (spinners, overlays, etc.).
+
+    :param ctx: Contexto de la ejecución.
+    :param driver: Instancia de WebDriver.
+    :param timeout: Tiempo máximo de espera total.
+    :return: True si no queda ningún loader visible.
+    """
+    with ctx.waiting():
+        state = wait_for_page_idle(driver, timeout)
+    if state.get("idle"):
+        ctx.log("info", f"Loaders/Overlays desaparecidos ({state.get('elapsed_ms')} ms).")
+        return True
+    ctx.log("warn", f"Loader todavía visible tras {timeout}s: {state.get('blocking')}")
+    return False
+
+
+def wait_until(ctx, driver, timeout: float, condition):
+    """
+    WebDriverWait(driver, timeout).until(condition) contando el tiempo como
+    espera del paso en curso (wait_s en result.json y en las métricas).
+    """
+    with ctx.waiting():
+        return WebDriverWait(driver, timeout).until(condition)
+
+
+def _run_async(driver, script: str, timeout: float, *args):
+    """execute_async_script con el timeout de script ajustado a la espera."""
+    previous_script_timeout = driver.timeouts.script
+    try:
+        driver.set_script_timeout(timeout + 5)
+        return driver.execute_async_script(script, *args, int(timeout * 1000))
+    finally:
+        driver.set_script_timeout(previous_script_timeout)
+
+
+def wait_clickable(ctx, driver, elem, timeout: float) -> dict:
+    """
+    Centra el elemento y espera a que sea clicable (visible, habilitado, sin
+    overlays encima y sin moverse). Sustituye al sleep fijo antes de cada clic.
+
+    :return: dict con clickable, visible, enabled, on_top, stable y elapsed_ms.
+    """
+    with ctx.waiting():
+        state = _run_async(driver, _CLICKABLE_SCRIPT, timeout, elem)
+    if not state.get("clickable"):
+        ctx.log("warn", f"Elemento no clicable tras {timeout:.1f}s: {state}")
+    return state
+
+
+def find_in_frames(ctx, driver, by, selector, timeout: float):
+    """
+    Busca el elemento en el DOM principal y en cada iframe en el mismo sondeo,
+    en lugar de agotar primero la espera en el DOM principal.
+
+    :return: El elemento, con el driver situado en su frame (volver con
+             driver.switch_to.default_content()).
+    :raises TimeoutException: Si no aparece en ningún documento a tiempo.
+    """
+    def locate(d):
+        d.switch_to.default_content()
+        found = d.find_elements(by, selector)
+        if found:
+            return found[0]
+        for frame in d.find_elements(By.TAG_NAME, "iframe"):
+            try:
+                d.switch_to.frame(frame)
+                found = d.find_elements(by, selector)
+            except WebDriverException:
+                found = []
+            if found:
+                return found[0]
+            d.switch_to.default_content()
+        return False
+
+    with ctx.waiting():
+        return WebDriverWait(driver, timeout, poll_frequency=0.2).until(locate)
+
+
+def wait_for_route_change(ctx, driver, previous_url: str, timeout: float) -> bool:
+    """
+    Espera a que la aplicación cambie de ruta (URL distinta de `previous_url`,
+    incluido el fragmento de las SPA) y el nuevo documento termine de cargar.
+
+    :return: True si la ruta cambió dentro del plazo.
+    """
+    try:
+        wait_until(ctx, driver, timeout,
+                   lambda d: d.current_url != previous_url
+                   and d.execute_script("return document.readyState") == "complete")
+    except TimeoutException:
+        ctx.log("warn", f"La URL no cambió tras {timeout:.1f}s: {previous_url}")
+        return False
+    ctx.log("info", f"Ruta cambiada: {driver.current_url}")
+    return True
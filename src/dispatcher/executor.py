@@ -0,0 +1,73 @@
+# src/dispatcher/executor.py
+import os
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dispatcher.loader import load_check_config
+
+
+MAX_WORKERS = int(os.getenv("CHECK_WORKERS", "4"))
+PER_TARGET_LIMIT = int(os.getenv("CHECK_PER_TARGET_LIMIT", "1"))
+
+
+class AlertExecutor:
+    """
+    Pool acotado de workers para ejecutar varias comprobaciones a la vez.
+
+    - Como máximo `max_workers` comprobaciones en paralelo.
+    - Como máximo `per_target_limit` por script/servicio objetivo (ajustable por
+      comprobación con `max_concurrency` en config/checks.json); el resto
+      espera en cola sin ocupar un worker.
+    - Un mismo ALERT_ID nunca se ejecuta dos veces a la vez: se devuelve el
+      Future de la ejecución en curso.
+    """
+
+    def __init__(self, run_job, max_workers: int = MAX_WORKERS, per_target_limit: int = PER_TARGET_LIMIT):
+        self._run_job = run_job
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="alert")
+        self._default_limit = per_target_limit
+        self._lock = threading.Lock()
+        self._running = defaultdict(int)
+        self._pending = defaultdict(deque)
+        self._in_flight = {}
+
+    def _limit(self, target: str) -> int:
+        return int(load_check_config(target).get("max_concurrency", self._default_limit))
+
+    def submit(self, target: str, alert_id: str, job) -> Future:
+        """Encola `job` (se pasa tal cual a run_job) para el script `target`."""
+        with self._lock:
+            if alert_id in self._in_flight:
+                return self._in_flight[alert_id]
+            future = Future()
+            self._in_flight[alert_id] = future
+            if self._running[target] >= self._limit(target):
+                self._pending[target].append((alert_id, job, future))
+                return future
+            self._running[target] += 1
+        # Fuera del lock: si el job ya ha terminado, add_done_callback llama a _finished en este hilo
+        self._start(target, alert_id, job, future)
+        return future
+
+    def _start(self, target, alert_id, job, future) -> None:
+        inner = self._pool.submit(self._run_job, job)
+        inner.add_done_callback(lambda done: self._finished(target, alert_id, future, done))
+
+    def _finished(self, target, alert_id, future, done) -> None:
+        with self._lock:
+            self._in_flight.pop(alert_id, None)
+            if self._pending[target]:
+                following = self._pending[target].popleft()
+            else:
+                following = None
+                self._running[target] -= 1
+        error = done.exception()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(done.result())
+        if following is not None:
+            self._start(target, *following)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
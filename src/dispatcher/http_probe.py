@@ -0,0 +1,116 @@
+# src/dispatcher/http_probe.py
+import os
+import time
+import threading
+from dataclasses import dataclass
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+
+PROBE_ENABLED = os.getenv("CHECK_PROBE", "1") != "0"
+PROBE_TIMEOUT = float(os.getenv("CHECK_PROBE_TIMEOUT", "5"))
+PROBE_POOL_SIZE = int(os.getenv("CHECK_PROBE_POOL_SIZE", "8"))
+
+UP, DOWN, INCONCLUSIVE = "up", "down", "inconclusive"
+# Veredicto que fija la sonda cuando la señal es inequívoca; el resto escala al navegador
+VERDICTS = {UP: "falso_positivo", DOWN: "alarma_confirmada"}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+@dataclass
+class ProbeResult:
+    """Resultado de la sonda HTTP: up, down o inconclusive, con el motivo."""
+    outcome: str
+    reason: str
+    url: str = ""
+    status: Optional[int] = None
+    elapsed_ms: int = 0
+
+    @property
+    def verdict(self) -> Optional[str]:
+        return VERDICTS.get(self.outcome)
+
+
+def _get_session() -> requests.Session:
+    """Sesión compartida por proceso: conexiones keep-alive (y TLS ya negociado) entre comprobaciones."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers["User-Agent"] = "GSIT_Alertas-probe/1.0"
+            _session.mount("http://", HTTPAdapter(pool_maxsize=PROBE_POOL_SIZE))
+            _session.mount("https://", HTTPAdapter(pool_maxsize=PROBE_POOL_SIZE))
+        return _session
+
+
+def probe_url(config: dict) -> str:
+    """URL a sondear: `url` o la variable de entorno `url_env` (la misma que usa el script)."""
+    return config.get("url") or os.getenv(config.get("url_env", ""), "")
+
+
+def classify(config: dict, url: str) -> ProbeResult:
+    """
+    Un intento de sonda. Inequívocamente caído: DNS, conexión rechazada o
+    HTTP 5xx. Inequívocamente arriba: estado esperado, `expect_text` presente
+    y ningún `forbid_text`. Todo lo demás (TLS, timeouts, 4xx, páginas sin
+    marcador) es inconcluso.
+    """
+    timeout = float(config.get("timeout", PROBE_TIMEOUT))
+    expect_status = config.get("expect_status", [200])
+    start = time.monotonic()
+
+    def result(outcome, reason, status=None):
+        return ProbeResult(outcome, reason, url, status, int((time.monotonic() - start) * 1000))
+
+    try:
+        resp = _get_session().get(url, timeout=timeout, allow_redirects=True)
+    except requests.exceptions.SSLError as e:
+        # La sonda no usa el certificado cliente ni las excepciones de confianza del
+        # perfil de Firefox: un fallo TLS aquí no implica que el navegador falle
+        return result(INCONCLUSIVE, f"Error TLS: {e}")
+    except requests.exceptions.Timeout as e:
+        return result(INCONCLUSIVE, f"Timeout tras {timeout}s: {e}")
+    except requests.exceptions.ConnectionError as e:
+        # DNS y conexión rechazada llegan aquí; un reset a medias no es concluyente
+        text = str(e)
+        if any(marker in text for marker in ("NameResolutionError", "Name or service not known",
+                                             "getaddrinfo failed", "Connection refused")):
+            return result(DOWN, f"Sin conexión: {e}")
+        return result(INCONCLUSIVE, f"Error de conexión: {e}")
+    except requests.RequestException as e:
+        return result(INCONCLUSIVE, f"Error HTTP: {e}")
+
+    status = resp.status_code
+    if status >= 500:
+        return result(DOWN, f"HTTP {status}", status)
+    if status not in expect_status:
+        return result(INCONCLUSIVE, f"HTTP {status} inesperado", status)
+    forbidden = [t for t in config.get("forbid_text", []) if t in resp.text]
+    if forbidden:
+        return result(DOWN, f"HTTP {status} con texto de error: {forbidden[0]}", status)
+    expect_text = config.get("expect_text")
+    if expect_text and expect_text in resp.text:
+        return result(UP, f"HTTP {status} con '{expect_text}'", status)
+    # Sin marcador de contenido un 200 puede ser el esqueleto de una SPA: decide el navegador
+    return result(INCONCLUSIVE, f"HTTP {status} sin marcador de contenido", status)
+
+
+def run_probe(config: dict) -> ProbeResult:
+    """
+    Sonda HTTP/TLS de una comprobación (`probe` en config/checks.json).
+    Una señal de caída se confirma con hasta `attempts` intentos (2 por defecto)
+    separados `retry_delay` segundos, para no confirmar un corte de un instante.
+    """
+    url = probe_url(config)
+    if not url:
+        return ProbeResult(INCONCLUSIVE, "Sonda sin URL configurada")
+    attempts = max(1, int(config.get("attempts", 2)))
+    for attempt in range(1, attempts + 1):
+        probe = classify(config, url)
+        if probe.outcome != DOWN or attempt == attempts:
+            return probe
+        time.sleep(float(config.get("retry_delay", 0.5)))
+    return probe
@@ -0,0 +1,104 @@
+# src/dispatcher/jenkins.py
+import os
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+
+
+TRIGGER_WORKERS = int(os.getenv("JENKINS_TRIGGER_WORKERS", "4"))
+TRIGGER_TIMEOUT = int(os.getenv("JENKINS_TRIGGER_TIMEOUT", "30"))
+
+_NO_CRUMB = {}
+
+
+class JenkinsClient:
+    """
+    Lanza builds de Jenkins sin bloquear al llamante.
+
+    - Sesión HTTP persistente (keep-alive) con las credenciales del API token.
+    - El crumb CSRF se pide una sola vez y se renueva solo si Jenkins lo rechaza.
+    - Como máximo `max_workers` peticiones simultáneas.
+    - Una misma (SCRIPT_NAME, ALERT_NAME, ALERT_ID, ALERT_TYPE) no se encola dos
+      veces mientras está en vuelo: se devuelve el Future de la petición en curso.
+    """
+
+    def __init__(self, base_url: str, job_name: str, user: str = None, token: str = None,
+                 max_workers: int = TRIGGER_WORKERS, timeout: int = TRIGGER_TIMEOUT):
+        self.base_url = (base_url or "").rstrip("/")
+        self.job_name = job_name
+        self.timeout = timeout
+        self._session = requests.Session()
+        if user and token:
+            self._session.auth = (user, token)
+        self._session.mount("http://", HTTPAdapter(pool_maxsize=max_workers))
+        self._session.mount("https://", HTTPAdapter(pool_maxsize=max_workers))
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="jenkins")
+        self._lock = threading.Lock()
+        self._crumb = None
+        self._in_flight = {}
+
+    def _crumb_header(self, refresh: bool = False) -> dict:
+        with self._lock:
+            if self._crumb is not None and not refresh:
+                return self._crumb
+        crumb = _NO_CRUMB
+        try:
+            resp = self._session.get(f"{self.base_url}/crumbIssuer/api/json", timeout=self.timeout)
+            if resp.status_code == 200:
+                data = resp.json()
+                crumb = {data["crumbRequestField"]: data["crumb"]}
+        except (requests.RequestException, ValueError, KeyError) as e:
+            logging.warning(f"No se pudo obtener el crumb de Jenkins: {e}")
+        with self._lock:
+            self._crumb = crumb
+        return crumb
+
+    def _post_build(self, params: dict) -> bool:
+        url = f"{self.base_url}/job/{self.job_name}/buildWithParameters"
+        for refresh in (False, True):
+            resp = self._session.post(url, params=params, headers=self._crumb_header(refresh),
+                                      timeout=self.timeout)
+            if resp.status_code in (200, 201, 202):
+                logging.info(f"✅ Jenkins job lanzado correctamente ({params.get('ALERT_ID')}).")
+                return True
+            if resp.status_code != 403 or refresh:
+                break
+            logging.warning("Jenkins rechazó el crumb, se renueva y se reintenta.")
+        logging.error(f"Jenkins respondió: {resp.status_code} - {resp.text}")
+        return False
+
+    def trigger(self, params: dict) -> Future:
+        """Encola el lanzamiento del job con `params`; devuelve un Future[bool]."""
+        key = (params.get("SCRIPT_NAME"), params.get("ALERT_NAME"), params.get("ALERT_ID"), params.get("ALERT_TYPE"))
+        with self._lock:
+            if key in self._in_flight:
+                logging.info(f"⏩ Lanzamiento ya en curso para {key}, no se duplica.")
+                return self._in_flight[key]
+            future = self._pool.submit(self._run, params)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future
+
+    def _run(self, params: dict) -> bool:
+        try:
+            return self._post_build(params)
+        except Exception as e:
+            logging.error(f"Fallo al llamar a Jenkins: {e}")
+            return False
+
+    def _forget(self, key, future) -> None:
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def drain(self, timeout: float = None) -> None:
+        """Espera a que terminen los lanzamientos en vuelo."""
+        with self._lock:
+            pending = list(self._in_flight.values())
+        wait(pending, timeout=timeout)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+        self._session.close()
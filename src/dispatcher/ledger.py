@@ -0,0 +1,81 @@
+# src/dispatcher/ledger.py
+import os
+import time
+import sqlite3
+import threading
+
+
+LEDGER_TTL = int(os.getenv("INGEST_LEDGER_TTL", str(7 * 24 * 3600)))  # segundos
+_EVICT_EVERY = 300
+
+
+class IngestionLedger:
+    """
+    Registro persistente de alertas ya despachadas, para no lanzar dos veces
+    la misma verificación (copias reenviadas, reenvíos del emisor, correos
+    marcados de nuevo como no leídos).
+
+    Un correo es duplicado si ya se vio su Message-ID o la terna
+    (alerta, ALERT_ID, tipo) dentro de los últimos `ttl` segundos. ALERT_ID es
+    la fecha de recepción, así que dos alertas distintas pueden compartirlo.
+    """
+
+    def __init__(self, path: str, ttl: int = LEDGER_TTL):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingested (
+                message_id TEXT,
+                alert_key  TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ingested_message ON ingested (message_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ingested_alert ON ingested (alert_key)")
+        self._last_eviction = 0.0
+
+    @staticmethod
+    def _key(alert_id: str, alert_type: str, alert_name: str = "") -> str:
+        return f"{(alert_name or '').lower()}|{alert_id}|{(alert_type or '').upper()}"
+
+    def _evict(self, now: float) -> None:
+        if now - self._last_eviction >= _EVICT_EVERY:
+            self._conn.execute("DELETE FROM ingested WHERE created_at < ?", (now - self.ttl,))
+            self._last_eviction = now
+
+    def claim(self, message_id: str, alert_id: str, alert_type: str, alert_name: str = "") -> bool:
+        """
+        Registra la alerta si no es un duplicado.
+
+        :return: True si es nueva (hay que despacharla), False si ya se despachó.
+        """
+        now = time.time()
+        key = self._key(alert_id, alert_type, alert_name)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._evict(now)
+                duplicate = self._conn.execute(
+                    "SELECT 1 FROM ingested WHERE (alert_key = ? OR (message_id = ? AND message_id != '')) "
+                    "AND created_at >= ? LIMIT 1",
+                    (key, message_id or "", now - self.ttl)).fetchone()
+                if not duplicate:
+                    self._conn.execute("INSERT INTO ingested (message_id, alert_key, created_at) VALUES (?, ?, ?)",
+                                       (message_id or "", key, now))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return not duplicate
+
+    def release(self, message_id: str, alert_id: str, alert_type: str, alert_name: str = "") -> None:
+        """Olvida una alerta cuyo despacho falló, para que un nuevo correo pueda lanzarla."""
+        with self._lock:
+            self._conn.execute("DELETE FROM ingested WHERE alert_key = ? AND message_id = ?",
+                               (self._key(alert_id, alert_type, alert_name), message_id or ""))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,7 +1,17 @@
 # src/dispatcher/loader.py
+import os
+import json
+import threading
+import importlib.util
 from dispatcher.registry import SCRIPT_REGISTRY
 
 
+WORKSPACE = os.getenv("WORKSPACE", os.getcwd())
+CHECKS_CONFIG = os.getenv("CHECKS_CONFIG", os.path.join(WORKSPACE, "config", "checks.json"))
+
+_PLUGINS = {}
+_PLUGINS_LOCK = threading.Lock()
+_CHECKS = None
 
 
 def load_script_path(alert_name: str) -> str:
@@ -13,4 +23,42 @@ def load_script_path(alert_name: str) -> str:
     key = alert_name.lower().strip()
     if key not in SCRIPT_REGISTRY:
         raise ValueError(f"Script '{alert_name}' no está registrado. Disponibles: {list(SCRIPT_REGISTRY.keys())}")
-    return SCRIPT_REGISTRY[key]
\ No newline at end of file
+    return SCRIPT_REGISTRY[key]
+
+
+def load_plugin(alert_name: str):
+    """Importa (una sola vez por proceso) el módulo del script registrado.
+
+
+    Lanza ValueError si el script no existe o no expone `run(context)`.
+    """
+    key = alert_name.lower().strip()
+    # Varias comprobaciones en paralelo (--queue) no deben importar el mismo script dos veces
+    with _PLUGINS_LOCK:
+        if key in _PLUGINS:
+            return _PLUGINS[key]
+
+        script_abspath = os.path.join(WORKSPACE, load_script_path(key))
+        if not os.path.exists(script_abspath):
+            raise ValueError(f"Script no encontrado en: {script_abspath}")
+
+        # Los nombres de script pueden empezar por dígito: se importan por ruta
+        spec = importlib.util.spec_from_file_location(f"scripts.{key}", script_abspath)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if not callable(getattr(module, "run", None)):
+            raise ValueError(f"El script '{alert_name}' no expone run(context)")
+        _PLUGINS[key] = module
+        return module
+
+
+def load_check_config(alert_name: str) -> dict:
+    """Configuración específica de una comprobación (config/checks.json); {} si no tiene."""
+    global _CHECKS
+    if _CHECKS is None:
+        try:
+            with open(CHECKS_CONFIG, "r", encoding="utf-8") as f:
+                _CHECKS = json.load(f)
+        except FileNotFoundError:
+            _CHECKS = {}
+    return _CHECKS.get(alert_name.lower().strip(), {})
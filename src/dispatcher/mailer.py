@@ -0,0 +1,384 @@
+# src/dispatcher/mailer.py
+import os
+import json
+import time
+import uuid
+import atexit
+import logging
+import smtplib
+import tempfile
+import threading
+from email.mime.text import MIMEText
+from email.mime.image import MIMEImage
+from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
+
+
+WORKSPACE = os.getenv("WORKSPACE", os.getcwd())
+STATE_DIR = os.getenv("STATE_DIR", os.path.join(WORKSPACE, "state"))
+# Cola de salida en disco: sobrevive al proceso que encola (scripts en proceso hijo, reinicios)
+MAIL_OUTBOX = os.getenv("MAIL_OUTBOX", os.path.join(STATE_DIR, "outbox"))
+EMAIL_USER = os.getenv("EMAIL_USER")
+EMAIL_PASS = os.getenv("EMAIL_PASS")
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_MAX_ATTEMPTS = int(os.getenv("SMTP_MAX_ATTEMPTS", "5"))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "60"))   # cierra la conexión tras este tiempo sin correo
+MAIL_FLUSH_TIMEOUT = float(os.getenv("MAIL_FLUSH_TIMEOUT", "30"))
+ATTACHMENT_GRACE = 10   # segundos que se espera a un adjunto que todavía se está escribiendo
+CLAIM_STALE = 600       # un envío reclamado hace más de esto (proceso muerto) vuelve a la cola
+
+_mailer = None
+_mailer_pid = None
+_mailer_lock = threading.Lock()
+_sender_enabled = True
+# Entradas encoladas por este proceso: al salir solo se espera a estas
+_own_entries = set()
+_own_lock = threading.Lock()
+
+
+def enqueue(to, subject: str, html: str, attachments=(), outbox: str = MAIL_OUTBOX) -> str:
+    """
+    Deja un correo en la cola de salida (escritura atómica) y vuelve enseguida.
+    Los adjuntos se leen al enviar, así que pueden estar escribiéndose todavía.
+
+    :return: Ruta de la entrada en la cola.
+    """
+    os.makedirs(outbox, exist_ok=True)
+    entry = {
+        "to": [to] if isinstance(to, str) else list(to),
+        "subject": subject,
+        "html": html,
+        "attachments": [path for path in attachments if path],
+        "created": time.time(),
+        "attempts": 0,
+        "next_attempt": 0,
+    }
+    # El pid en el nombre permite al padre adoptar lo que encoló un hijo (adopt_entries)
+    path = os.path.join(outbox, f"{time.time_ns()}_{os.getpid()}_{uuid.uuid4().hex[:8]}.json")
+    _write_entry(path, entry)
+    with _own_lock:
+        _own_entries.add(path)
+    return path
+
+
+def _write_entry(path: str, entry: dict) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".mail.")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def build_message(entry: dict, sender: str) -> MIMEMultipart:
+    """MIME del correo: cuerpo HTML y adjuntos que existan en disco (imágenes inline como image/*)."""
+    msg = MIMEMultipart()
+    msg["From"] = sender
+    msg["To"] = ", ".join(entry["to"])
+    msg["Subject"] = entry["subject"]
+    msg.attach(MIMEText(entry["html"], "html"))
+    for path in entry["attachments"]:
+        if not os.path.exists(path):
+            logging.warning(f"Adjunto no encontrado, se envía sin él: {path}")
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        try:
+            part = MIMEImage(data)
+        except TypeError:
+            part = MIMEApplication(data)
+        part.add_header("Content-Disposition", "attachment", filename=os.path.basename(path))
+        msg.attach(part)
+    return msg
+
+
+class Mailer:
+    """
+    Envía la cola de salida desde un hilo con una conexión SMTP autenticada
+    (STARTTLS + login una sola vez) que se reutiliza entre correos.
+
+    - Una ráfaga de alertas comparte la conexión; se cierra tras SMTP_IDLE_TIMEOUT sin correo.
+    - Si el servidor ha cerrado la conexión se reabre y se reintenta al momento.
+    - Otros fallos se reintentan con backoff exponencial hasta SMTP_MAX_ATTEMPTS;
+      después la entrada pasa a outbox/failed.
+    - Varias instancias (procesos) pueden vaciar la misma cola: cada entrada
+      se reclama con un rename atómico antes de enviarla.
+    """
+
+    def __init__(self, user: str, password: str, host: str = SMTP_HOST, port: int = SMTP_PORT,
+                 outbox: str = MAIL_OUTBOX, timeout: float = SMTP_TIMEOUT, starttls: bool = SMTP_STARTTLS):
+        self.user = user
+        self.password = password
+        self.host = host
+        self.port = port
+        self.outbox = outbox
+        self.timeout = timeout
+        self.starttls = starttls
+        self._smtp = None
+        self._last_used = 0.0
+        self._wakeup = threading.Condition()
+        self._closed = False
+        os.makedirs(os.path.join(outbox, "failed"), exist_ok=True)
+        self._thread = threading.Thread(target=self._loop, name="mailer", daemon=True)
+        self._thread.start()
+
+    def wake(self) -> None:
+        """Avisa al hilo de que hay correo nuevo en la cola."""
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def pending(self, entries=None) -> list:
+        """
+        Entradas de la cola que se pueden enviar ya o se están enviando (las que
+        esperan un reintento no cuentan). Con `entries`, solo entre esas rutas.
+        """
+        if entries is None:
+            try:
+                entries = [os.path.join(self.outbox, name) for name in os.listdir(self.outbox)
+                           if name.endswith(".json")]
+            except FileNotFoundError:
+                return []
+        now = time.time()
+        pending = []
+        for path in entries:
+            if os.path.exists(path + ".sending"):
+                pending.append(path)
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    next_attempt = json.load(f).get("next_attempt", 0)
+            except (OSError, ValueError):
+                continue  # enviada, descartada o reclamada justo ahora
+            if next_attempt <= now:
+                pending.append(path)
+        return pending
+
+    def flush(self, timeout: float = MAIL_FLUSH_TIMEOUT, entries=None) -> bool:
+        """
+        Bloquea hasta que no quede nada por enviar ya (de `entries`, o de toda
+        la cola) o pase `timeout`; True si se vació.
+        """
+        deadline = time.monotonic() + timeout
+        entries = None if entries is None else list(entries)
+        while True:
+            pending = self.pending(entries)
+            if not pending:
+                return True
+            if time.monotonic() >= deadline:
+                logging.warning(f"📧 Quedan {len(pending)} correos en {self.outbox}; se enviarán más tarde.")
+                return False
+            entries = pending if entries is not None else None
+            self.wake()
+            time.sleep(0.2)
+
+    def close(self) -> None:
+        with self._wakeup:
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                next_due = self._drain()
+            except Exception as e:
+                logging.error(f"📧 Error vaciando la cola de correo: {e}")
+                next_due = time.time() + 5
+            with self._wakeup:
+                if self._closed:
+                    break
+                self._wakeup.wait(timeout=max(0.05, min(next_due - time.time(), SMTP_IDLE_TIMEOUT)))
+            if self._smtp is not None and time.monotonic() - self._last_used >= SMTP_IDLE_TIMEOUT:
+                self._disconnect()
+        self._disconnect()
+
+    def _drain(self) -> float:
+        """Envía todo lo que toca; devuelve el instante (epoch) del próximo reintento pendiente."""
+        now = time.time()
+        next_due = now + SMTP_IDLE_TIMEOUT
+        for name in sorted(os.listdir(self.outbox)):
+            path = os.path.join(self.outbox, name)
+            if name.endswith(".sending"):
+                self._recover_stale(path)
+                continue
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if entry.get("next_attempt", 0) > now:
+                next_due = min(next_due, entry["next_attempt"])
+                continue
+            if not self._attachments_ready(entry, now):
+                next_due = min(next_due, now + 0.2)
+                continue
+            claimed = path + ".sending"
+            try:
+                os.rename(path, claimed)
+                # rename conserva el mtime: la antigüedad del reclamo cuenta desde ahora
+                os.utime(claimed)
+            except FileNotFoundError:
+                continue  # otro proceso la ha reclamado
+            self._deliver(entry, claimed, path)
+        return next_due
+
+    @staticmethod
+    def _attachments_ready(entry: dict, now: float) -> bool:
+        """Los adjuntos existen, o ya no se esperan más (ATTACHMENT_GRACE desde que se encoló)."""
+        if now >= entry["created"] + ATTACHMENT_GRACE:
+            return True
+        return all(os.path.exists(path) for path in entry["attachments"])
+
+    def _recover_stale(self, claimed: str) -> None:
+        try:
+            if time.time() - os.path.getmtime(claimed) > CLAIM_STALE:
+                os.rename(claimed, claimed[:-len(".sending")])
+                logging.warning(f"📧 Envío abandonado devuelto a la cola: {claimed}")
+        except OSError:
+            pass
+
+    def _deliver(self, entry: dict, claimed: str, path: str) -> None:
+        try:
+            self._send(build_message(entry, self.user))
+        except Exception as e:
+            self._disconnect()
+            if not os.path.exists(claimed):
+                return  # el reclamo ya lo ha gestionado otro proceso
+            entry["attempts"] += 1
+            if entry["attempts"] >= SMTP_MAX_ATTEMPTS:
+                logging.error(f"📧 Correo descartado tras {entry['attempts']} intentos ({entry['subject']}): {e}")
+                _write_entry(os.path.join(self.outbox, "failed", os.path.basename(path)), entry)
+                _release(claimed)
+                return
+            wait = min(5 * 2 ** (entry["attempts"] - 1), 300)
+            entry["next_attempt"] = time.time() + wait
+            logging.warning(f"📧 Fallo enviando '{entry['subject']}' ({entry['attempts']}/{SMTP_MAX_ATTEMPTS}), "
+                            f"reintento en {wait}s: {e}")
+            # Se reescribe el propio reclamo y se devuelve a la cola con un rename
+            _write_entry(claimed, entry)
+            try:
+                os.rename(claimed, path)
+            except FileNotFoundError:
+                pass
+            return
+        _release(claimed)
+        logging.info(f"📧 Correo enviado: {entry['subject']}")
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._smtp is None:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.starttls:
+                    smtp.starttls()
+                smtp.login(self.user, self.password)
+            except Exception:
+                smtp.close()
+                raise
+            self._smtp = smtp
+        return self._smtp
+
+    def _send(self, msg) -> None:
+        try:
+            self._connect().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Conexión keep-alive cerrada por el servidor: se reabre una vez
+            self._disconnect()
+            self._connect().send_message(msg)
+        self._last_used = time.monotonic()
+
+    def _disconnect(self) -> None:
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+        self._smtp = None
+
+
+def _release(claimed: str) -> None:
+    """Borra un reclamo; si ya no existe, otro proceso lo ha gestionado."""
+    try:
+        os.remove(claimed)
+    except FileNotFoundError:
+        pass
+
+
+def get_mailer():
+    """
+    Mailer compartido del proceso (se crea al primer uso y vacía la cola al
+    salir). None si EMAIL_USER/EMAIL_PASS no están configurados.
+    """
+    global _mailer, _mailer_pid
+    if not EMAIL_USER or not EMAIL_PASS:
+        return None
+    with _mailer_lock:
+        # Tras un fork el hilo de envío no existe en el hijo: nueva instancia
+        if _mailer is None or _mailer_pid != os.getpid():
+            _mailer = Mailer(EMAIL_USER, EMAIL_PASS)
+            _mailer_pid = os.getpid()
+            atexit.register(flush_outbox)
+        return _mailer
+
+
+def disable_sender() -> None:
+    """Este proceso solo encola (p. ej. el hijo de una comprobación aislada); envía el padre."""
+    global _sender_enabled
+    _sender_enabled = False
+
+
+def queue_mail(to, subject: str, html: str, attachments=()) -> bool:
+    """
+    Encola un correo y despierta al mailer del proceso. No bloquea: el envío
+    va por la conexión compartida en segundo plano.
+
+    :return: False si el correo no está configurado.
+    """
+    if not EMAIL_USER or not EMAIL_PASS:
+        return False
+    enqueue(to, subject, html, attachments)
+    if _sender_enabled:
+        get_mailer().wake()
+    return True
+
+
+def kick_outbox() -> None:
+    """
+    Arranca el envío de lo que haya en la cola (lo encolado por un proceso
+    hijo o lo que quedó pendiente de ejecuciones anteriores); no bloquea.
+    """
+    if not _sender_enabled or not os.path.isdir(MAIL_OUTBOX):
+        return
+    if any(name.endswith(".json") for name in os.listdir(MAIL_OUTBOX)):
+        mailer = get_mailer()
+        if mailer:
+            mailer.wake()
+
+
+def adopt_entries(pid: int, outbox: str = MAIL_OUTBOX) -> None:
+    """Hace propios (para flush_outbox) los correos que encoló el proceso hijo `pid`."""
+    marker = f"_{pid}_"
+    try:
+        names = os.listdir(outbox)
+    except FileNotFoundError:
+        return
+    with _own_lock:
+        for name in names:
+            if marker in name and name.endswith((".json", ".json.sending")):
+                _own_entries.add(os.path.join(outbox, name[:-len(".sending")] if name.endswith(".sending") else name))
+
+
+def flush_outbox(timeout: float = MAIL_FLUSH_TIMEOUT) -> bool:
+    """
+    Espera (como mucho `timeout`) a que salgan los correos que encoló este
+    proceso. Los de otros procesos y los que esperan un reintento no bloquean
+    la salida: los envía la siguiente ejecución.
+    """
+    if not _sender_enabled or _mailer is None or _mailer_pid != os.getpid():
+        return True
+    with _own_lock:
+        entries = list(_own_entries)
+    return _mailer.flush(timeout, entries=entries)
@@ -0,0 +1,258 @@
+# src/dispatcher/metrics.py
+import os
+import json
+import math
+import time
+import sqlite3
+import tempfile
+import threading
+
+
+WORKSPACE = os.getenv("WORKSPACE", os.getcwd())
+STATE_DIR = os.getenv("STATE_DIR", os.path.join(WORKSPACE, "state"))
+# Acumulados entre ejecuciones (compartido por todas las comprobaciones del nodo)
+METRICS_DB = os.getenv("METRICS_DB", os.path.join(STATE_DIR, "metrics.db"))
+# Directorio del textfile collector de node_exporter (--collector.textfile.directory)
+METRICS_TEXTFILE_DIR = os.getenv("METRICS_TEXTFILE_DIR", os.path.join(STATE_DIR, "metrics"))
+TEXTFILE_NAME = "gsit_checks.prom"
+
+# Presupuestos de espera por paso aprendidos del histórico (sustituyen a las
+# constantes tipo DEFAULT_WAIT cuando hay muestras suficientes)
+BUDGET_ENABLED = os.getenv("WAIT_BUDGET_LEARN", "1") != "0"
+BUDGET_WINDOW = int(os.getenv("WAIT_BUDGET_WINDOW", "50"))            # últimas N duraciones ok por paso
+BUDGET_MIN_SAMPLES = int(os.getenv("WAIT_BUDGET_MIN_SAMPLES", "10"))
+BUDGET_PERCENTILE = float(os.getenv("WAIT_BUDGET_PERCENTILE", "0.95"))
+BUDGET_FACTOR = float(os.getenv("WAIT_BUDGET_FACTOR", "3"))            # margen sobre el percentil
+BUDGET_MIN = float(os.getenv("WAIT_BUDGET_MIN", "5"))
+BUDGET_MAX = float(os.getenv("WAIT_BUDGET_MAX", "120"))
+
+# Cubetas en segundos: pasos de milisegundos (scan) hasta cargas de minutos
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30, 60, 120, 300)
+
+# nombre -> (tipo, ayuda)
+FAMILIES = {
+    "gsit_check_duration_seconds": ("histogram", "Duración total de la comprobación"),
+    "gsit_check_step_duration_seconds": ("histogram", "Duración de cada paso de la comprobación"),
+    "gsit_check_step_wait_seconds": ("histogram", "Tiempo de cada paso esperando a la página"),
+    "gsit_check_runs_total": ("counter", "Comprobaciones ejecutadas por veredicto"),
+    "gsit_check_steps_total": ("counter", "Pasos ejecutados por resultado (ok, failed, error)"),
+    "gsit_check_last_run_timestamp_seconds": ("gauge", "Fin de la última comprobación (epoch)"),
+    "gsit_check_last_duration_seconds": ("gauge", "Duración de la última comprobación"),
+    "gsit_check_last_step_duration_seconds": ("gauge", "Duración del paso en la última comprobación"),
+}
+
+_lock = threading.Lock()
+
+
+class MetricsStore:
+    """
+    Series acumuladas en SQLite para que cada proceso (un build de Jenkins,
+    el runner en cola…) sume sus observaciones a las de los anteriores.
+    """
+
+    def __init__(self, path: str = METRICS_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS series (
+                name   TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                value  TEXT NOT NULL,
+                PRIMARY KEY (name, labels)
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS step_samples (
+                script     TEXT NOT NULL,
+                step       TEXT NOT NULL,
+                duration_s REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS step_samples_key ON step_samples (script, step)")
+
+    def record_samples(self, script: str, samples, window: int = BUDGET_WINDOW) -> None:
+        """Guarda duraciones [(paso, segundos)] y conserva solo las `window` más recientes de cada paso."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany("INSERT INTO step_samples (script, step, duration_s) VALUES (?, ?, ?)",
+                                   [(script, step, duration) for step, duration in samples])
+            for step in {step for step, _ in samples}:
+                self._conn.execute(
+                    "DELETE FROM step_samples WHERE script = ? AND step = ? AND rowid NOT IN "
+                    "(SELECT rowid FROM step_samples WHERE script = ? AND step = ? ORDER BY rowid DESC LIMIT ?)",
+                    (script, step, script, step, window))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def samples(self, script: str) -> dict:
+        """{paso: [duraciones]} de un script."""
+        by_step = {}
+        for step, duration in self._conn.execute(
+                "SELECT step, duration_s FROM step_samples WHERE script = ? ORDER BY rowid", (script,)):
+            by_step.setdefault(step, []).append(duration)
+        return by_step
+
+    def apply(self, observations, publish=None) -> list:
+        """
+        Aplica en una transacción una lista de (nombre, labels, valor) y
+        devuelve todas las series [(nombre, labels, valor)].
+
+        Histogramas: el valor se observa; contadores: se suma; gauges: se fija.
+        `publish(series)` se llama antes del COMMIT, de modo que dos procesos
+        nunca publican sus instantáneas en orden inverso.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for name, labels, value in observations:
+                key = json.dumps(labels, sort_keys=True, ensure_ascii=False)
+                kind = FAMILIES[name][0]
+                row = self._conn.execute("SELECT value FROM series WHERE name = ? AND labels = ?",
+                                         (name, key)).fetchone()
+                current = json.loads(row[0]) if row else None
+                if kind == "histogram":
+                    current = current or {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+                    for i, bound in enumerate(BUCKETS):
+                        if value <= bound:
+                            current["buckets"][i] += 1
+                    current["sum"] += value
+                    current["count"] += 1
+                elif kind == "counter":
+                    current = (current or 0) + value
+                else:
+                    current = value
+                self._conn.execute("INSERT OR REPLACE INTO series (name, labels, value) VALUES (?, ?, ?)",
+                                   (name, key, json.dumps(current)))
+            rows = self._conn.execute("SELECT name, labels, value FROM series ORDER BY name, labels").fetchall()
+            series = [(name, json.loads(labels), json.loads(value)) for name, labels, value in rows]
+            if publish:
+                publish(series)
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return series
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict, **extra) -> str:
+    items = list(labels.items()) + list(extra.items())
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}" if items else ""
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_textfile(series) -> str:
+    """Formato de exposición de Prometheus (text/plain 0.0.4) de todas las series."""
+    by_name = {}
+    for name, labels, value in series:
+        by_name.setdefault(name, []).append((labels, value))
+    lines = []
+    for name, rows in by_name.items():
+        kind, help_text = FAMILIES[name]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in rows:
+            if kind == "histogram":
+                for bound, count in zip(BUCKETS, value["buckets"]):
+                    lines.append(f"{name}_bucket{_labels(labels, le=bound)} {count}")
+                lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {value['count']}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(round(value['sum'], 3))}")
+                lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+            else:
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(content: str, textfile_dir: str = METRICS_TEXTFILE_DIR) -> str:
+    """Escritura atómica (tmp + rename): node_exporter nunca lee un fichero a medias."""
+    os.makedirs(textfile_dir, exist_ok=True)
+    path = os.path.join(textfile_dir, TEXTFILE_NAME)
+    fd, tmp_path = tempfile.mkstemp(dir=textfile_dir, prefix=".gsit_checks.")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_observations(result, finished_at: float) -> list:
+    """
+    Observaciones de una ejecución: total y veredicto, y duración/espera/resultado
+    de cada paso. Todas llevan `mode` (browser, probe o resuelta) para no mezclar
+    las ejecuciones sin navegador con las latencias reales.
+    """
+    script = {"script": result.script or "desconocido", "mode": result.mode}
+    observations = [
+        ("gsit_check_duration_seconds", script, result.total_s),
+        ("gsit_check_runs_total", dict(script, verdict=result.verdict or "desconocido"), 1),
+        ("gsit_check_last_run_timestamp_seconds", script, round(finished_at, 3)),
+        ("gsit_check_last_duration_seconds", script, result.total_s),
+    ]
+    for step in result.steps:
+        labels = dict(script, step=step.name)
+        observations += [
+            ("gsit_check_step_duration_seconds", labels, step.duration_s),
+            ("gsit_check_step_wait_seconds", labels, step.wait_s),
+            ("gsit_check_steps_total", dict(labels, outcome=step.outcome), 1),
+            ("gsit_check_last_step_duration_seconds", labels, step.duration_s),
+        ]
+    return observations
+
+
+def export_run_metrics(result, db_path: str = METRICS_DB, textfile_dir: str = METRICS_TEXTFILE_DIR) -> str:
+    """
+    Suma la ejecución a las series acumuladas y regenera el textfile de
+    Prometheus. Con histogram_quantile() se obtienen p50/p95 por paso y servicio.
+
+    :return: Ruta del fichero .prom escrito.
+    """
+    written = []
+    with _lock:
+        store = MetricsStore(db_path)
+        try:
+            # Solo los pasos correctos de una comprobación con navegador alimentan los
+            # presupuestos: un timeout no es una latencia y probe/resuelta no abren Firefox
+            if result.mode == "browser":
+                store.record_samples(result.script or "desconocido",
+                                     [(step.name, step.duration_s) for step in result.steps if step.outcome == "ok"])
+            store.apply(run_observations(result, time.time()),
+                        publish=lambda series: written.append(write_textfile(render_textfile(series), textfile_dir)))
+        finally:
+            store.close()
+    return written[0]
+
+
+def percentile(values, q: float) -> float:
+    """Percentil por rango más cercano (q entre 0 y 1)."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def learned_budgets(script: str, db_path: str = METRICS_DB) -> dict:
+    """
+    Presupuesto de tiempo (segundos) de cada paso del script: percentil
+    BUDGET_PERCENTILE de sus últimas duraciones correctas por BUDGET_FACTOR,
+    acotado a [BUDGET_MIN, BUDGET_MAX]. Los pasos con menos de
+    BUDGET_MIN_SAMPLES muestras no aparecen (se usan los valores por defecto).
+    """
+    if not BUDGET_ENABLED or not script or not os.path.exists(db_path):
+        return {}
+    with _lock:
+        store = MetricsStore(db_path)
+        try:
+            samples = store.samples(script)
+        finally:
+            store.close()
+    return {
+        step: round(min(BUDGET_MAX, max(BUDGET_MIN, percentile(values, BUDGET_PERCENTILE) * BUDGET_FACTOR)), 3)
+        for step, values in samples.items() if len(values) >= BUDGET_MIN_SAMPLES
+    }
@@ -0,0 +1,330 @@
+# src/dispatcher/plugin.py
+import os
+import sys
+import time
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing import List, Optional
+from browser.screenshots import RunScreenshots
+from dispatcher.loader import load_plugin, load_check_config
+from dispatcher.mailer import adopt_entries, disable_sender, kick_outbox
+from dispatcher.metrics import BUDGET_MIN, export_run_metrics, learned_budgets
+from dispatcher.result import Result, StepTiming, save_result
+
+
+WORKSPACE = os.getenv("WORKSPACE", os.getcwd())
+DEFAULT_PROFILE = os.path.join(WORKSPACE, "profiles", "selenium_cert")
+
+
+@dataclass
+class RunContext:
+    """
+    Todo lo que una comprobación necesita para ejecutarse: datos de la alerta,
+    perfil de Firefox y carpetas de la ejecución (runs/<ALERT_ID>).
+    """
+    alert_id: str
+    script: str = ""
+    alert_name: str = ""
+    alert_type: str = ""
+    from_email: str = ""
+    subject: str = ""
+    body: str = ""
+    profile: str = DEFAULT_PROFILE
+    retry: int = 0
+    max_retries: int = 1
+    verdict: Optional[str] = field(default=None, init=False)
+    steps: List[StepTiming] = field(default_factory=list, init=False)
+    screenshots: List[str] = field(default_factory=list, init=False)
+    failing_step: Optional[str] = field(default=None, init=False)
+    current_step: Optional[str] = field(default=None, init=False)
+    mode: str = field(default="browser", init=False)
+    started_at: str = field(default="", init=False)
+    _started: float = field(default=0.0, init=False, repr=False)
+    _timing: Optional[StepTiming] = field(default=None, init=False, repr=False)
+    _deadline: Optional[float] = field(default=None, init=False, repr=False)
+    _budgets: Optional[dict] = field(default=None, init=False, repr=False)
+    _shots: Optional[RunScreenshots] = field(default=None, init=False, repr=False)
+
+    @property
+    def run_dir(self) -> str:
+        return os.path.join(WORKSPACE, "runs", self.alert_id)
+
+    @property
+    def logs_dir(self) -> str:
+        return os.path.join(self.run_dir, "logs")
+
+    @property
+    def screenshots_dir(self) -> str:
+        return os.path.join(self.run_dir, "screenshots")
+
+    @property
+    def check_config(self) -> dict:
+        """Configuración de la comprobación en config/checks.json."""
+        return load_check_config(self.script) if self.script else {}
+
+    @classmethod
+    def from_env(cls, script: str, default_name: str = "") -> "RunContext":
+        """Contexto para ejecutar un script suelto: argv [perfil, alerta, remitente, asunto, cuerpo] o entorno."""
+        argv = sys.argv
+        return cls(
+            alert_id=os.getenv("ALERT_ID", datetime.now().strftime("%Y%m%d_%H%M%S")),
+            script=script,
+            alert_name=argv[2] if len(argv) > 2 else os.getenv("ALERT_NAME", default_name),
+            alert_type=os.getenv("ALERT_TYPE", "").upper(),
+            from_email=argv[3] if len(argv) > 3 else os.getenv("EMAIL_FROM", ""),
+            subject=argv[4] if len(argv) > 4 else os.getenv("EMAIL_SUBJECT", ""),
+            body=argv[5] if len(argv) > 5 else os.getenv("EMAIL_BODY", ""),
+            profile=argv[1] if len(argv) > 1 else DEFAULT_PROFILE,
+        ).prepare()
+
+    def prepare(self) -> "RunContext":
+        """Crea las carpetas de logs y capturas de la ejecución y arranca el cronómetro."""
+        os.makedirs(self.logs_dir, exist_ok=True)
+        os.makedirs(self.screenshots_dir, exist_ok=True)
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self._started = time.monotonic()
+        return self
+
+    @contextmanager
+    def step(self, name: str):
+        """
+        Cronometra un paso de la comprobación y lo añade a `steps`.
+
+        Si el paso lanza una excepción o marca alarma_confirmada mientras está
+        abierto, queda registrado como paso fallido.
+        """
+        previous, self.current_step = self.current_step, name
+        previous_timing, previous_deadline = self._timing, self._deadline
+        start = time.monotonic()
+        timing = StepTiming(name=name, duration_s=0.0, started_at=_now_iso(), budget_s=self.step_budget(name))
+        self._timing = timing
+        if timing.budget_s is not None:
+            self._deadline = start + timing.budget_s
+        try:
+            yield timing
+        except BaseException as e:
+            timing.outcome, timing.error = "error", f"{type(e).__name__}: {e}"
+            if self.failing_step is None:
+                self.failing_step = name
+            raise
+        finally:
+            timing.duration_s = round(time.monotonic() - start, 3)
+            timing.ended_at = _now_iso()
+            timing.wait_s = round(timing.wait_s, 3)
+            if timing.budget_s is not None and timing.duration_s > timing.budget_s:
+                self.log("warn", f"Paso '{name}' por encima de su presupuesto aprendido: "
+                                 f"{timing.duration_s}s > {timing.budget_s}s")
+            if timing.outcome == "ok" and self.failing_step == name:
+                timing.outcome = "failed"
+            self.steps.append(timing)
+            self.current_step = previous
+            self._timing, self._deadline = previous_timing, previous_deadline
+            if previous_timing is not None:
+                previous_timing.wait_s += timing.wait_s
+
+    def step_budget(self, name: str) -> Optional[float]:
+        """Presupuesto del paso aprendido de sus latencias históricas (None si no hay histórico suficiente)."""
+        if self._budgets is None:
+            try:
+                self._budgets = learned_budgets(self.script)
+            except Exception as e:
+                self.log("warn", f"No se pudieron cargar los presupuestos de espera: {e}")
+                self._budgets = {}
+        return self._budgets.get(name)
+
+    def wait_budget(self, default: float) -> float:
+        """
+        Timeout para una espera del paso en curso: lo que le queda a su
+        presupuesto aprendido o, sin histórico, `default`. El presupuesto solo
+        acorta la espera: nunca da más que `default`, y con el presupuesto
+        agotado sigue dando al menos BUDGET_MIN (o `default` si es menor), así
+        que pasarse del presupuesto queda como aviso en el log y no como fallo.
+        """
+        if self._deadline is None:
+            return default
+        return min(default, max(self._deadline - time.monotonic(), BUDGET_MIN))
+
+    def record_wait(self, seconds: float) -> None:
+        """Suma `seconds` al tiempo de espera del paso en curso (si hay alguno abierto)."""
+        if self._timing is not None:
+            self._timing.wait_s += seconds
+
+    @contextmanager
+    def waiting(self):
+        """Cronometra una espera (WebDriverWait, loaders, pausas) como wait_s del paso en curso."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_wait(time.monotonic() - start)
+
+    def log(self, level: str, message: str) -> None:
+        """
+        Registra un mensaje en consola y en el archivo de log de la ejecución.
+
+        :param level: Nivel del log (info, warn, error).
+        :param message: Mensaje a registrar.
+        """
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        line = f"[{timestamp}] [{level.upper()}] {message}"
+        print(f"[{self.alert_id}] {line}")
+        with open(os.path.join(self.logs_dir, "execution.log"), "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def save_screenshot(self, driver, name: str, success: bool = False) -> Optional[str]:
+        """
+        Captura la pantalla y la guarda en segundo plano en la carpeta de
+        screenshots: resolución completa en los fallos y miniatura (o nada)
+        en los pasos correctos (`success=True`), según SCREENSHOT_ON_*.
+
+        :return: Ruta de la captura (la del fotograma anterior si es idéntico),
+                 o None si la política no guarda captura. Antes de leer el
+                 fichero hay que llamar a wait_screenshots().
+        """
+        if self._shots is None:
+            self._shots = RunScreenshots(self.screenshots_dir, log=self.log)
+        filename = self._shots.capture(driver, name, success)
+        if filename and filename not in self.screenshots:
+            self.screenshots.append(filename)
+            self.log("info", f"Captura en cola: {filename}")
+        return filename
+
+    def wait_screenshots(self) -> List[str]:
+        """Espera a que se escriban las capturas pendientes; devuelve las que existen en disco."""
+        if self._shots is not None:
+            written = set(self._shots.wait())
+            self.screenshots = [path for path in self.screenshots if path in written]
+        return list(self.screenshots)
+
+    def write_status(self, status_value: str) -> None:
+        """
+        Fija el veredicto de la ejecución; se publica en runs/<ALERT_ID>/result.json
+        al terminar. Una alarma_confirmada marca como fallido el paso en curso.
+
+        :param status_value: Valor del estado (falso_positivo, alarma_confirmada, etc.).
+        """
+        self.log("info", f"Escribiendo status: {status_value}")
+        self.verdict = status_value
+        if status_value == "alarma_confirmada" and self.failing_step is None:
+            self.failing_step = self.current_step
+
+    def result(self, detail: str = "") -> Result:
+        """Registro completo de la ejecución: veredicto, pasos, capturas y tiempo total."""
+        self.wait_screenshots()
+        return Result(
+            verdict=self.verdict,
+            detail=detail,
+            alert_id=self.alert_id,
+            script=self.script,
+            steps=list(self.steps),
+            failing_step=self.failing_step,
+            screenshots=list(self.screenshots),
+            started_at=self.started_at,
+            total_s=round(time.monotonic() - self._started, 3) if self._started else 0.0,
+            mode=self.mode,
+        )
+
+    def write_result(self, result: Result) -> str:
+        """Publica el resultado en runs/<ALERT_ID>/result.json (escritura atómica)."""
+        path = save_result(result, self.run_dir)
+        self.log("info", f"Resultado guardado en: {path}")
+        try:
+            export_run_metrics(result)
+        except Exception as e:
+            self.log("warn", f"No se pudieron exportar las métricas: {e}")
+        return path
+
+
+def _now_iso() -> str:
+    return datetime.now().isoformat(timespec="milliseconds")
+
+
+def _run_in_thread(run, context: RunContext, timeout: float) -> Result:
+    """
+    Timeout en modo inprocess, de mejor esfuerzo: un hilo no se puede matar,
+    así que al vencer el plazo se devuelve el error pero el script sigue
+    ejecutándose en segundo plano (y con su Firefox) hasta que termine solo.
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = run(context)
+        except BaseException as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=target, name=f"check-{context.alert_id}", daemon=True)
+    worker.start()
+    worker.join(timeout)
+    if worker.is_alive():
+        context.log("warn", f"Timeout en modo inprocess: el script sigue ejecutándose en segundo plano "
+                            "(usar --isolation process para cortarlo)")
+        raise TimeoutError(f"La comprobación superó el tiempo máximo de {timeout}s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def _process_entry(script_name: str, context: RunContext, conn) -> None:
+    # El hijo no debe tocar los Firefox del pool del padre (heredados por fork)
+    pool_module = sys.modules.get("browser.pool")
+    if pool_module is not None:
+        pool_module.forget_pool()
+    # El hijo puede morir en cuanto entrega el resultado: solo encola correo, lo envía el padre
+    disable_sender()
+    try:
+        conn.send(("ok", load_plugin(script_name).run(context)))
+    except BaseException as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def _run_in_process(script_name: str, context: RunContext, timeout: Optional[float]) -> Result:
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    mp = multiprocessing.get_context(method)
+    parent_conn, child_conn = mp.Pipe(duplex=False)
+    proc = mp.Process(target=_process_entry, args=(script_name, context, child_conn), daemon=True)
+    proc.start()
+    child_conn.close()
+    try:
+        if not parent_conn.poll(timeout):
+            raise TimeoutError(f"La comprobación superó el tiempo máximo de {timeout}s")
+        kind, payload = parent_conn.recv()
+    except EOFError:
+        raise RuntimeError(f"El proceso de la comprobación terminó sin resultado (código {proc.exitcode})")
+    finally:
+        if proc.is_alive():
+            proc.terminate()
+        proc.join(5)
+        # Lo que encoló el hijo lo envía (y lo espera al salir) este proceso
+        adopt_entries(proc.pid)
+    if kind == "error":
+        raise RuntimeError(payload)
+    return payload
+
+
+def execute_plugin(script_name: str, context: RunContext, isolation: str = "inprocess",
+                   timeout: Optional[float] = None) -> Result:
+    """
+    Ejecuta la función `run(context)` del script registrado.
+
+    :param isolation: "inprocess" (por defecto, reutiliza imports y pool de Firefox)
+                      o "process" (proceso hijo: aísla cuelgues y fallos graves).
+    :param timeout: Segundos máximos; None = sin límite. Con "process" el hijo
+                    se termina al vencer; con "inprocess" es de mejor esfuerzo
+                    (el hilo del script no se puede detener, ver _run_in_thread).
+    """
+    try:
+        if isolation == "process":
+            return _run_in_process(script_name, context, timeout)
+        run = load_plugin(script_name).run
+        if timeout:
+            return _run_in_thread(run, context, timeout)
+        return run(context)
+    finally:
+        # Correo encolado por el script (o pendiente de antes): se envía en segundo plano
+        kick_outbox()
@@ -3,6 +3,8 @@
 
 # Mapea nombres de script (clave pública) a la ruta relativa del script real.
 # Añade aquí nuevas automatizaciones cuando las implementes.
+# Cada script debe exponer run(context: RunContext) -> Result (ver dispatcher/plugin.py);
+# runner.py lo importa y lo invoca en el mismo proceso.
 
 
 SCRIPT_REGISTRY = {
@@ -0,0 +1,63 @@
+# src/dispatcher/result.py
+import os
+import json
+import tempfile
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+
+
+RESULT_FILENAME = "result.json"
+
+
+@dataclass
+class StepTiming:
+    """Duración, resultado y tiempo en esperas de un paso de la comprobación."""
+    name: str
+    duration_s: float
+    outcome: str = "ok"          # ok | failed | error
+    error: str = ""
+    started_at: str = ""
+    ended_at: str = ""
+    wait_s: float = 0.0          # parte de duration_s esperando a la página (waits, sleeps)
+    budget_s: Optional[float] = None  # presupuesto aprendido del histórico (None = valores por defecto)
+
+
+@dataclass
+class Result:
+    """
+    Registro de una comprobación: veredicto (falso_positivo, alarma_confirmada
+    o resuelta), tiempos por paso, paso fallido, capturas y tiempo total.
+    """
+    verdict: Optional[str]
+    detail: str = ""
+    alert_id: str = ""
+    script: str = ""
+    steps: List[StepTiming] = field(default_factory=list)
+    failing_step: Optional[str] = None
+    screenshots: List[str] = field(default_factory=list)
+    started_at: str = ""
+    total_s: float = 0.0
+    mode: str = "browser"        # browser | probe (la sonda HTTP fijó el veredicto) | resuelta (sin comprobación)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def save_result(result: Result, run_dir: str) -> str:
+    """Escribe runs/<ALERT_ID>/result.json de forma atómica (tmp + rename)."""
+    os.makedirs(run_dir, exist_ok=True)
+    path = os.path.join(run_dir, RESULT_FILENAME)
+    fd, tmp_path = tempfile.mkstemp(dir=run_dir, prefix=".result.")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(result.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_result(run_dir: str) -> Optional[dict]:
+    """Lee result.json de una ejecución; None si no existe o está corrupto."""
+    try:
+        with open(os.path.join(run_dir, RESULT_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
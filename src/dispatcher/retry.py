@@ -0,0 +1,208 @@
+# src/dispatcher/retry.py
+import os
+import sys
+import json
+import time
+import heapq
+import logging
+import sqlite3
+import threading
+from typing import Optional
+from dispatcher.loader import load_check_config
+
+
+RETRY_BACKOFF = int(os.getenv("RETRY_BACKOFF", "300"))       # segundos hasta el reintento
+RETRY_FAILED_DELAY = int(os.getenv("RETRY_FAILED_DELAY", "60"))  # si el relanzamiento falla
+RETRY_POLL = int(os.getenv("RETRY_POLL", "30"))  # relectura del almacén (reintentos de otros procesos)
+
+# Parámetros del job de Jenkins que se guardan para relanzar la comprobación
+JOB_PARAMS = ("SCRIPT_NAME", "RETRY_COUNT", "ALERT_NAME", "ALERT_TYPE", "ALERT_ID",
+              "EMAIL_FROM", "EMAIL_SUBJECT", "EMAIL_BODY", "ALERT_ENVELOPE", "MAX_RETRIES")
+
+
+def retry_store_path() -> str:
+    """
+    Ruta del almacén de reintentos: RETRY_STORE (o STATE_DIR/retries.db) leído
+    al usarlo, no al importar. Jenkins y el listener deben ver el mismo.
+    """
+    state_dir = os.getenv("STATE_DIR", os.path.join(os.getenv("WORKSPACE", os.getcwd()), "state"))
+    return os.getenv("RETRY_STORE", os.path.join(state_dir, "retries.db"))
+
+
+def retry_delay(script_name: str, attempt: int) -> int:
+    """
+    Espera antes del reintento `attempt` (1, 2, ...). Se configura por script en
+    config/checks.json con `retry_backoff`: segundos, o lista de segundos por intento.
+    """
+    backoff = load_check_config(script_name).get("retry_backoff", RETRY_BACKOFF) if script_name else RETRY_BACKOFF
+    if isinstance(backoff, list):
+        return int(backoff[min(max(attempt, 1), len(backoff)) - 1]) if backoff else RETRY_BACKOFF
+    return int(backoff)
+
+
+class RetryStore:
+    """Reintentos pendientes en SQLite (uno por ALERT_ID): sobreviven a reinicios."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or retry_store_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS retries (
+                alert_id TEXT PRIMARY KEY,
+                params   TEXT NOT NULL,
+                due_at   REAL NOT NULL
+            )""")
+
+    def put(self, alert_id: str, params: dict, due_at: float) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO retries (alert_id, params, due_at) VALUES (?, ?, ?)",
+                               (alert_id, json.dumps(params, ensure_ascii=False), due_at))
+
+    def take(self, alert_id: str, due_at: float):
+        """
+        Retira el reintento si sigue programado para `due_at` y devuelve sus
+        params; None si otro proceso ya lo lanzó o se reprogramó.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT params FROM retries WHERE alert_id = ? AND due_at = ?",
+                                         (alert_id, due_at)).fetchone()
+                if row:
+                    self._conn.execute("DELETE FROM retries WHERE alert_id = ?", (alert_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return json.loads(row[0]) if row else None
+
+    def pending(self) -> list:
+        """Lista de (due_at, alert_id) de todos los reintentos guardados."""
+        with self._lock:
+            return [(due, alert_id) for alert_id, due in
+                    self._conn.execute("SELECT alert_id, due_at FROM retries")]
+
+
+class RetryScheduler:
+    """
+    Relanza comprobaciones de falsos positivos pasado su backoff, sin ocupar
+    un ejecutor de Jenkins mientras tanto.
+
+    Los reintentos viven en un RetryStore; en memoria solo se mantiene un heap
+    (due_at, alert_id) que un hilo consume, y que cada RETRY_POLL segundos se
+    completa con lo que otros procesos (Jenkins) hayan guardado.
+    `fire(params) -> bool` relanza la comprobación; si falla, se vuelve a
+    intentar tras RETRY_FAILED_DELAY.
+    """
+
+    def __init__(self, store: RetryStore, fire, poll: float = RETRY_POLL):
+        self.store = store
+        self._fire = fire
+        self._poll = poll
+        self._heap = []
+        self._known = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def _push(self, entry) -> None:
+        if entry not in self._known:
+            self._known.add(entry)
+            heapq.heappush(self._heap, entry)
+
+    def schedule(self, params: dict, delay: float) -> float:
+        """Guarda (o reemplaza) el reintento de params["ALERT_ID"]; devuelve su due_at."""
+        due_at = time.time() + delay
+        self.store.put(params["ALERT_ID"], params, due_at)
+        with self._cond:
+            self._push((due_at, params["ALERT_ID"]))
+            self._cond.notify()
+        return due_at
+
+    def _fire_entry(self, due_at: float, alert_id: str) -> None:
+        params = self.store.take(alert_id, due_at)
+        if params is None:
+            return  # reprogramado o ya lanzado: entrada obsoleta del heap
+        logging.info(f"🔁 Reintento de {alert_id} (intento {params.get('RETRY_COUNT')})")
+        try:
+            ok = self._fire(params)
+        except Exception as e:
+            logging.error(f"[{alert_id}] Fallo al relanzar la comprobación: {e}")
+            ok = False
+        if not ok:
+            self.schedule(params, RETRY_FAILED_DELAY)
+
+    def run_due(self) -> int:
+        """Lanza ya los reintentos vencidos del almacén (modo ejecución única)."""
+        now = time.time()
+        due = sorted(entry for entry in self.store.pending() if entry[0] <= now)
+        for due_at, alert_id in due:
+            self._fire_entry(due_at, alert_id)
+        return len(due)
+
+    def start(self) -> "RetryScheduler":
+        """Carga los reintentos guardados y arranca el hilo del planificador."""
+        self._reload()
+        self._thread = threading.Thread(target=self._loop, name="retry-scheduler", daemon=True)
+        self._thread.start()
+        logging.info(f"Planificador de reintentos activo ({len(self._heap)} pendientes)")
+        return self
+
+    def _reload(self) -> None:
+        pending = self.store.pending()
+        with self._cond:
+            for entry in pending:
+                self._push(entry)
+
+    def _loop(self) -> None:
+        next_reload = time.monotonic() + self._poll
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.time()):
+                    until_due = self._heap[0][0] - time.time() if self._heap else self._poll
+                    until_reload = next_reload - time.monotonic()
+                    if until_reload <= 0:
+                        break
+                    self._cond.wait(min(until_due, until_reload))
+                if self._stopped:
+                    return
+                entry = heapq.heappop(self._heap) if self._heap and self._heap[0][0] <= time.time() else None
+                if entry:
+                    self._known.discard(entry)
+            if entry:
+                self._fire_entry(*entry)
+            if time.monotonic() >= next_reload:
+                self._reload()
+                next_reload = time.monotonic() + self._poll
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+
+
+def schedule_from_env() -> float:
+    """
+    Programa el reintento del build actual a partir de sus parámetros en el
+    entorno (lo usa el Jenkinsfile). RETRY_COUNT ya debe ser el del siguiente intento.
+    """
+    params = {name: os.getenv(name, "") for name in JOB_PARAMS}
+    if not params["ALERT_ID"]:
+        raise ValueError("ALERT_ID es obligatorio para programar un reintento")
+    delay = retry_delay(params["SCRIPT_NAME"], int(params["RETRY_COUNT"] or 1))
+    RetryStore().put(params["ALERT_ID"], params, time.time() + delay)
+    return delay
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s",
+                        datefmt="%Y-%m-%d %H:%M:%S")
+    if sys.argv[1:] != ["schedule"]:
+        sys.exit("Uso: python -m dispatcher.retry schedule")
+    seconds = schedule_from_env()
+    logging.info(f"⏳ Reintento de {os.getenv('ALERT_ID')} programado en {seconds}s ({retry_store_path()})")
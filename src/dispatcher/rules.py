@@ -0,0 +1,167 @@
+# src/dispatcher/rules.py
+import re
+import json
+
+
+# Campo de la regla -> campo del correo sobre el que se evalúa
+RULE_FIELDS = {
+    "from": "from",
+    "subject_contains": "subject",
+    "body_contains": "body",
+}
+
+# Orden de preferencia para indexar cada regla (el campo más selectivo primero)
+ANCHOR_ORDER = ("body", "subject", "from")
+HEADER_FIELDS = ("subject", "from")
+
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """
+    Normaliza texto eliminando emojis, caracteres especiales y espacios extra.
+    """
+    if not isinstance(text, str):
+        return ""
+    # Eliminar emojis y caracteres no alfanuméricos (excepto espacios)
+    text = _NON_WORD_RE.sub(" ", text)
+    # Pasar a minúsculas y colapsar espacios
+    return _SPACES_RE.sub(" ", text.strip().lower())
+
+
+def rule_conditions(name: str, data: dict, source: str = "") -> dict:
+    """Condiciones normalizadas de una regla {campo del correo: subcadena}.
+
+
+    Lanza ValueError si algún valor queda vacío al normalizarlo (p. ej. solo
+    emojis o signos): como subcadena vacía la regla no coincidiría nunca.
+    """
+    conditions = {}
+    for key, field in RULE_FIELDS.items():
+        if key not in data:
+            continue
+        conditions[field] = normalize_text(data[key])
+        if not conditions[field]:
+            where = f" de {source}" if source else ""
+            raise ValueError(f"La regla '{name}'{where} tiene '{key}' vacío tras normalizar: {data[key]!r}")
+    return conditions
+
+
+def load_alert_rules(path: str) -> dict:
+    """Carga las reglas de alerta desde un JSON {nombre: {from, subject_contains, body_contains, script}}.
+
+
+    Lanza ValueError si alguna regla no declara su script o tiene una condición vacía.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        rules = json.load(f)
+    for name, data in rules.items():
+        if not data.get("script"):
+            raise ValueError(f"La regla '{name}' de {path} no define 'script'")
+        rule_conditions(name, data, path)
+    return rules
+
+
+def _trie_regex(words) -> str:
+    """Construye una alternancia en forma de trie: a igual posición gana la palabra más larga."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        alternation = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Si aquí termina una palabra, el resto es opcional (greedy → prefiere la más larga)
+        return f"(?:{alternation})?" if "" in node else alternation
+
+    return build(trie)
+
+
+class NeedleSet:
+    """Conjunto de subcadenas compilado en una única regex que las localiza todas en una pasada."""
+
+    def __init__(self, needles):
+        self.needles = sorted({n for n in needles if n})
+        self.regex = re.compile(f"(?=({_trie_regex(self.needles)}))") if self.needles else None
+        # Si aparece una subcadena, aparecen también todas las que contiene
+        self.implied = {n: frozenset(m for m in self.needles if m in n) for n in self.needles}
+
+    def find(self, text: str) -> set:
+        found = set()
+        if self.regex is None or not text:
+            return found
+        for match in self.regex.finditer(text):
+            hit = match.group(1)
+            if hit not in found:
+                found |= self.implied[hit]
+        return found
+
+
+class RuleMatcher:
+    """
+    Motor de reglas compilado una sola vez.
+
+    Cada campo (from/subject/body) se recorre una única vez con su NeedleSet;
+    las reglas se indexan por su subcadena más selectiva, de modo que el coste
+    por correo no crece con el número de reglas sino con las coincidencias.
+    """
+
+    def __init__(self, rules: dict):
+        self.rules = [(name, data, rule_conditions(name, data)) for name, data in rules.items()]
+        self.needle_sets = {
+            field: NeedleSet(cond[field] for _, _, cond in self.rules if field in cond)
+            for field in RULE_FIELDS.values()
+        }
+        self._full_index = self._build_index(ANCHOR_ORDER)
+        self._header_index = self._build_index(HEADER_FIELDS)
+
+    def _build_index(self, fields):
+        """Indexa cada regla por (campo, subcadena) del primer campo disponible en `fields`."""
+        by_needle = {}
+        unconditional = []
+        for pos, (_, _, conditions) in enumerate(self.rules):
+            anchor = next((f for f in fields if f in conditions), None)
+            if anchor is None:
+                unconditional.append(pos)
+            else:
+                by_needle.setdefault((anchor, conditions[anchor]), []).append(pos)
+        return by_needle, unconditional, fields
+
+    def _first_match(self, index, found):
+        by_needle, unconditional, fields = index
+        candidates = set(unconditional)
+        for field, needles in found.items():
+            for needle in needles:
+                candidates.update(by_needle.get((field, needle), ()))
+        for pos in sorted(candidates):
+            conditions = self.rules[pos][2]
+            if all(conditions[f] in found[f] for f in fields if f in conditions):
+                return pos
+        return None
+
+    def match(self, from_norm: str, subject_norm: str, body_norm: str):
+        """Devuelve (nombre, regla) de la primera regla que coincide, o (None, None). Espera textos normalizados."""
+        found = {
+            "from": self.needle_sets["from"].find(from_norm),
+            "subject": self.needle_sets["subject"].find(subject_norm),
+            "body": self.needle_sets["body"].find(body_norm),
+        }
+        pos = self._first_match(self._full_index, found)
+        if pos is None:
+            return None, None
+        name, data, _ = self.rules[pos]
+        return name, data
+
+    def prefilter(self, from_norm: str, subject_norm: str) -> bool:
+        """Indica si algún par remitente/asunto coincide (sin mirar el cuerpo). Espera textos normalizados."""
+        found = {
+            "from": self.needle_sets["from"].find(from_norm),
+            "subject": self.needle_sets["subject"].find(subject_norm),
+        }
+        return self._first_match(self._header_index, found) is not None
@@ -1,13 +1,25 @@
 import os
-import re
-import requests
+import sys
+import time
+import socket
+import json
+import argparse
+import tempfile
 import logging
 from dotenv import load_dotenv
 from imapclient import IMAPClient
+from imapclient.exceptions import IMAPClientError
 from email import message_from_bytes
 from email.header import decode_header, make_header
-from bs4 import BeautifulSoup
-from datetime import datetime
+from dispatcher.rules import RuleMatcher, load_alert_rules, normalize_text
+from dispatcher.jenkins import JenkinsClient
+from dispatcher.ledger import IngestionLedger
+from dispatcher.retry import RetryScheduler, RetryStore
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+  sys.path.insert(0, ROOT_DIR)
+from utils.alert_envelope import AlertEnvelope, message_text
 
 # ============================
 # Configuración de logging
@@ -34,28 +46,32 @@ JENKINS_URL = os.getenv("JENKINS_URL")
 JENKINS_USER = os.getenv("JENKINS_USER")
 JENKINS_TOKEN = os.getenv("JENKINS_TOKEN")
 JOB_NAME = os.getenv("JOB_NAME_CUSTOM", "GSIT_Alertas_Area_Privada")
+# Cliente compartido: sesión persistente, crumb cacheado y lanzamientos en segundo plano
+JENKINS = JenkinsClient(JENKINS_URL, JOB_NAME, JENKINS_USER, JENKINS_TOKEN)
 
-# Alertas configuradas
-ALERTS = {
-  "Alerta Acces Frontal": {
-      "from": "rpinheiro@viewnext.com",
-      "subject_contains": "ELS MEUS DOCUMENTS",
-      "body_contains": "ACCES_FRONTAL_EMD",
-      "script": "acces_frontal_emd"
-  },
-  "Alerta Frameworks": {
-      "from": "rpinheiro@viewnext.com",
-      "subject_contains": "FRAMEWORKS EFORMULARIS",
-      "body_contains": "01_CARREGA_URL_WEFOSJX26",
-      "script": "01_carrega_url_wsdl"
-  },
-  "Area Privada": {
-      "from": "rpinheiro@viewnext.com",
-      "subject_contains": "AREA PRIVADA",
-      "body_contains": "CARPETA_CIUTADANA-CONF",
-      "script": "area_privada"
-  }
-}
+# Modo listener (IMAP IDLE)
+IDLE_CHECK_TIMEOUT = int(os.getenv("IMAP_IDLE_CHECK_TIMEOUT", "30"))  # segundos por espera idle_check
+IDLE_RENEW_SECONDS = int(os.getenv("IMAP_IDLE_RENEW", "600"))         # RFC 2177: renovar IDLE antes de 29 min
+POLL_INTERVAL = int(os.getenv("IMAP_POLL_INTERVAL", "30"))             # fallback si el servidor no soporta IDLE
+RECONNECT_BACKOFF_MIN = int(os.getenv("IMAP_RECONNECT_MIN", "1"))
+RECONNECT_BACKOFF_MAX = int(os.getenv("IMAP_RECONNECT_MAX", "300"))
+
+# Checkpoint incremental (UIDVALIDITY + último UID procesado)
+STATE_DIR = os.getenv("STATE_DIR", os.path.join(WORKSPACE, "state"))
+CHECKPOINT_PATH = os.path.join(STATE_DIR, "imap_checkpoint.json")
+# Alertas ya despachadas (Message-ID / alerta + ALERT_ID + tipo) para descartar duplicados
+LEDGER = IngestionLedger(os.path.join(STATE_DIR, "ingest_ledger.db"))
+# Reintentos de falsos positivos programados por Jenkins (RETRY_STORE compartido),
+# abiertos al primer uso: ver retry_scheduler()
+_RETRIES = None
+HEADER_FIELDS = "BODY.PEEK[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)]"
+# El servidor puede devolver la clave con otras mayúsculas o con los campos reordenados
+HEADER_KEY_PREFIX = b"BODY[HEADER.FIELDS"
+
+# Alertas configuradas (config/alerts.json), compiladas una sola vez
+ALERTS_CONFIG = os.getenv("ALERTS_CONFIG", os.path.join(WORKSPACE, "config", "alerts.json"))
+ALERTS = load_alert_rules(ALERTS_CONFIG)
+ALERT_MATCHER = RuleMatcher(ALERTS)
 
 # ============================
 # Funciones auxiliares
@@ -67,95 +83,46 @@ def decode_mime_words(s):
   except:
       return s
 
-def normalize_text(text):
-  """
-  Normaliza texto eliminando emojis, caracteres especiales y espacios extra.
-  """
-  if not isinstance(text, str):
-      return ""
-  # Eliminar emojis y caracteres no alfanuméricos (excepto espacios)
-  text = re.sub(r"[^\w\s]", " ", text)
-  # Pasar a minúsculas y colapsar espacios
-  return re.sub(r"\s+", " ", text.strip().lower())
-
-def parse_email_body(email_message):
-  body = ""
-  if email_message.is_multipart():
-      for part in email_message.walk():
-          content_type = part.get_content_type()
-          if content_type in ("text/plain", "text/html"):
-              payload = part.get_payload(decode=True)
-              if not payload:
-                  continue
-              body = payload.decode(errors="ignore")
-              if content_type == "text/html":
-                  body = BeautifulSoup(body, "html.parser").get_text()
-              break
-  else:
-      payload = email_message.get_payload(decode=True)
-      if payload:
-          body = payload.decode(errors="ignore")
-  return body
-
-def extract_alert_id(body):
-  # Buscar patrón Recepció: dd/mm/yyyy HH:MM:SS
-  match = re.search(r"Recepci[oó]:\s*(\d{2}/\d{2}/\d{4}\s+\d{2}:\d{2}:\d{2})", body)
-  if match:
-      fecha_hora = match.group(1)
-      try:
-          dt = datetime.strptime(fecha_hora, "%d/%m/%Y %H:%M:%S")
-          return dt.strftime("%Y%m%d_%H%M%S")
-      except ValueError:
-          logging.error(f"Formato de fecha/hora inválido en Recepció: {fecha_hora}")
-          return None
-  logging.error("No se encontró campo 'Recepció:' en el correo")
-  return None
+def detect_alert(envelope, body):
+  """
+  Identifica la alerta configurada a partir del sobre ya parseado.
 
-def detect_alert(from_email, subject, body):
-  from_norm = normalize_text(from_email)
-  subject_norm = normalize_text(subject)
+  :return: Tupla (alert_name, script, alert_type, alert_id).
+  """
+  from_norm = normalize_text(envelope.from_email)
+  subject_norm = normalize_text(envelope.subject)
   body_norm = normalize_text(body)
-
-  # Patrones más flexibles: permiten guiones, espacios o nada después
-  activa_pattern = re.compile(r"alerta\s*activa[\s\-]*", re.IGNORECASE)
-  resuelta_pattern = re.compile(r"alerta\s*resuelta[\s\-]*", re.IGNORECASE)
-
-  alert_type = None
-  if activa_pattern.search(subject_norm) or activa_pattern.search(body_norm):
-      alert_type = "ACTIVA"
-  elif resuelta_pattern.search(subject_norm) or resuelta_pattern.search(body_norm):
-      alert_type = "RESUELTA"
+  alert_type = envelope.alert_type or None
 
   # Logs de depuración
-  logging.info(f"[DEBUG] Asunto original: {subject}")
+  logging.info(f"[DEBUG] Asunto original: {envelope.subject}")
   logging.info(f"[DEBUG] Asunto normalizado: {subject_norm}")
   logging.info(f"[DEBUG] Cuerpo normalizado (primeros 200 chars): {body_norm[:200]}")
   logging.info(f"[DEBUG] alert_type detectado: {alert_type}")
 
-  alert_id = extract_alert_id(body)
+  alert_id = envelope.alert_id
   if not alert_id:
+      logging.error("No se encontró campo 'Recepció:' (dd/mm/aaaa hh:mm:ss) en el correo")
       return None, None, alert_type, None  # Error técnico si no hay ID
 
-  for alert_name, data in ALERTS.items():
-      match = True
-      if "from" in data and normalize_text(data["from"]) not in from_norm:
-          match = False
-      if "subject_contains" in data and normalize_text(data["subject_contains"]) not in subject_norm:
-          match = False
-      if "body_contains" in data and normalize_text(data["body_contains"]) not in body_norm:
-          match = False
-      if match:
-          logging.info(f"✅ Alerta detectada: {alert_name} | Tipo: {alert_type} | ID: {alert_id}")
-          return alert_name, data["script"], alert_type, alert_id
+  alert_name, data = ALERT_MATCHER.match(from_norm, subject_norm, body_norm)
+  if alert_name:
+      logging.info(f"✅ Alerta detectada: {alert_name} | Tipo: {alert_type} | ID: {alert_id}")
+      return alert_name, data["script"], alert_type, alert_id
 
   return None, None, alert_type, alert_id
 
-def trigger_jenkins_job(script_name, alert_name, alert_type, alert_id, from_email, subject, body):
+def trigger_jenkins_job(script_name, alert_name, alert_type, alert_id, from_email, subject, body, envelope=None):
+  """
+  Encola el lanzamiento del job en Jenkins sin esperar la respuesta, para que
+  el buzón se siga procesando mientras tanto.
+
+  :return: Future[bool] con el resultado del lanzamiento, o None si falta ALERT_ID.
+  """
   if not alert_id:
       logging.error("❌ ALERT_ID no encontrado, no se puede lanzar el job en Jenkins")
-      return False
+      return None
 
-  url = f"{JENKINS_URL}/job/{JOB_NAME}/buildWithParameters"
   body_param = body if len(body) <= 8000 else body[:8000] + "\n...(truncated)..."
 
   params = {
@@ -165,51 +132,260 @@ def trigger_jenkins_job(script_name, alert_name, alert_type, alert_id, from_emai
       "ALERT_ID": alert_id,
       "EMAIL_FROM": from_email or "",
       "EMAIL_SUBJECT": subject or "",
-      "EMAIL_BODY": body_param
+      "EMAIL_BODY": body_param,
+      "ALERT_ENVELOPE": envelope.to_json() if envelope else ""
   }
 
   logging.info(f"Lanzando Job Jenkins con params: {params}")
+  return JENKINS.trigger(params)
 
+def dispatch_alert(envelope, script_name, alert_name, body):
+  """
+  Lanza la verificación salvo que el registro de ingesta indique que ya se
+  despachó. Si el lanzamiento falla, la alerta se libera del registro.
+  """
+  message_id, alert_id, alert_type = envelope.message_id, envelope.alert_id, envelope.alert_type
+  if not LEDGER.claim(message_id, alert_id, alert_type, alert_name):
+      logging.info(f"⏩ Alerta duplicada, ya despachada: {alert_id} | Tipo: {alert_type} | Message-ID: {message_id}")
+      return None
+
+  logging.info(f"📤 Enviando a Jenkins: {alert_name} | Tipo: {alert_type} | ID: {alert_id}")
+  future = trigger_jenkins_job(script_name, alert_name, alert_type, alert_id,
+                               envelope.from_email, envelope.subject, body, envelope)
+
+  def release_on_failure(done):
+      if not done.result():
+          LEDGER.release(message_id, alert_id, alert_type, alert_name)
+  future.add_done_callback(release_on_failure)
+  return future
+
+def load_checkpoint(uidvalidity):
+  """
+  Devuelve el último UID procesado para este UIDVALIDITY.
+  Si el buzón se ha reconstruido (UIDVALIDITY distinto) se empieza de cero.
+  """
   try:
-      resp = requests.post(url, params=params, auth=(JENKINS_USER, JENKINS_TOKEN), timeout=30)
-      if resp.status_code in (200, 201, 202):
-          logging.info("✅ Jenkins job lanzado correctamente.")
-          return True
+      with open(CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+          data = json.load(f)
+  except (OSError, ValueError):
+      return 0
+  if data.get("uidvalidity") != uidvalidity:
+      logging.warning("UIDVALIDITY ha cambiado, se descarta el checkpoint IMAP.")
+      return 0
+  return int(data.get("last_uid", 0))
+
+def save_checkpoint(uidvalidity, last_uid):
+  """Persiste el checkpoint de forma atómica (tmp + rename)."""
+  os.makedirs(STATE_DIR, exist_ok=True)
+  fd, tmp_path = tempfile.mkstemp(dir=STATE_DIR, prefix=".imap_checkpoint.")
+  with os.fdopen(fd, "w", encoding="utf-8") as f:
+      json.dump({"uidvalidity": uidvalidity, "last_uid": last_uid}, f)
+  os.replace(tmp_path, CHECKPOINT_PATH)
+
+def header_part(fetched):
+  """Cabeceras de la respuesta FETCH de un mensaje, o None si el servidor no las devolvió."""
+  for key, value in fetched.items():
+      if isinstance(key, bytes) and key.upper().startswith(HEADER_KEY_PREFIX):
+          return value
+  return None
+
+def is_candidate(from_email, subject):
+  """Prefiltro por cabeceras: ¿algún remitente/asunto de ALERTS coincide?"""
+  return ALERT_MATCHER.prefilter(normalize_text(from_email), normalize_text(subject))
+
+def open_mailbox():
+  """
+  Abre una sesión IMAP autenticada con INBOX seleccionado.
+
+  :return: Tupla (server, uidvalidity).
+  """
+  server = IMAPClient(IMAP_SERVER, port=IMAP_PORT, ssl=True)
+  try:
+      server.login(EMAIL_USER, EMAIL_PASS)
+      folder_info = server.select_folder("INBOX")
+  except Exception:
+      server.shutdown()
+      raise
+  return server, folder_info.get(b"UIDVALIDITY")
+
+def process_unseen(server, uidvalidity):
+  """
+  Procesa los correos no leídos posteriores al checkpoint.
+
+  Primero descarga solo las cabeceras From/Subject/Message-ID y descarta
+  lo que no encaja con ninguna alerta; el cuerpo completo se pide
+  únicamente para los candidatos.
+  """
+  last_uid = load_checkpoint(uidvalidity)
+  criteria = ["UNSEEN", "UID", f"{last_uid + 1}:*"] if last_uid else ["UNSEEN"]
+  # "n:*" siempre devuelve al menos el último UID, aunque sea < n
+  messages = sorted(uid for uid in server.search(criteria) if uid > last_uid)
+  logging.info(f"Correos no leídos nuevos: {len(messages)} (checkpoint UID {last_uid})")
+  if not messages:
+      return
+
+  headers = server.fetch(messages, [HEADER_FIELDS])
+  candidates = {}
+  for i, uid in enumerate(messages):
+      raw_headers = header_part(headers.get(uid, {}))
+      if raw_headers is None:
+          # Sin cabeceras no se puede decidir: ni se marca como leído ni se avanza el checkpoint
+          logging.error(f"❌ El servidor no devolvió las cabeceras del UID {uid}; se reintentará desde ahí.")
+          messages = messages[:i]
+          break
+      header_msg = message_from_bytes(raw_headers)
+      from_email = header_msg.get('From', '').lower()
+      subject = decode_mime_words(header_msg.get('Subject', ''))
+      if is_candidate(from_email, subject):
+          candidates[uid] = (from_email, subject, header_msg.get('Message-ID', '').strip())
       else:
-          logging.error(f"Jenkins respondió: {resp.status_code} - {resp.text}")
-          return False
-  except Exception as e:
-      logging.error(f"Fallo al llamar a Jenkins: {e}")
-      return False
+          logging.info(f"Descartado por cabeceras: {from_email} | Asunto: {subject}")
 
-def check_email():
+  logging.info(f"Candidatos tras prefiltro: {len(candidates)} / {len(messages)}")
+  bodies = server.fetch(list(candidates), ['BODY.PEEK[]']) if candidates else {}
+
+  processed_uid = last_uid
   try:
-      with IMAPClient(IMAP_SERVER, port=IMAP_PORT, ssl=True) as server:
-          server.login(EMAIL_USER, EMAIL_PASS)
-          server.select_folder("INBOX")
-          messages = server.search(["UNSEEN"])
-          logging.info(f"Correos no leídos: {len(messages)}")
-
-          for msgid, data in server.fetch(messages, ['RFC822']).items():
-              email_message = message_from_bytes(data[b'RFC822'])
-              from_email = email_message.get('From', '').lower()
-              subject_raw = email_message.get('Subject', '')
-              subject = decode_mime_words(subject_raw)
+      for uid in messages:
+          if uid in candidates:
+              from_email, subject, message_id = candidates[uid]
+              email_message = message_from_bytes(bodies.get(uid, {}).get(b'BODY[]', b""))
               logging.info(f"Revisando correo de {from_email} | Asunto: {subject}")
-              body = parse_email_body(email_message)
-              alert_name, script_to_run, alert_type, alert_id = detect_alert(from_email, subject, body)
-
-              # Marcar como leído
-              server.add_flags(msgid, ['\\Seen'])
+              body = message_text(email_message)
+              envelope = AlertEnvelope.from_text(body, from_email, subject, message_id)
+              alert_name, script_to_run, alert_type, alert_id = detect_alert(envelope, body)
 
               if script_to_run and alert_id:
-                  logging.info(f"📤 Enviando a Jenkins: {alert_name} | Tipo: {alert_type} | ID: {alert_id}")
-                  trigger_jenkins_job(script_to_run, alert_name, alert_type, alert_id, from_email, subject, body)
+                  dispatch_alert(envelope, script_to_run, alert_name, body)
               else:
                   logging.error("❌ No coincide con ninguna alerta configurada o falta ALERT_ID.")
+          processed_uid = uid
+  finally:
+      # Marcar como leído en bloque y avanzar el checkpoint hasta lo procesado
+      done = [uid for uid in messages if uid <= processed_uid]
+      if done:
+          server.add_flags(done, ['\\Seen'])
+      if processed_uid > last_uid:
+          save_checkpoint(uidvalidity, processed_uid)
+
+def retry_scheduler():
+  """
+  Planificador de reintentos sobre el RETRY_STORE vigente, creado al primer uso.
+  Registra la ruta: si no coincide con la del Jenkinsfile, los reintentos que
+  programa Jenkins no se lanzan nunca.
+  """
+  global _RETRIES
+  if _RETRIES is None:
+      store = RetryStore()
+      if os.getenv("RETRY_STORE"):
+          logging.info(f"🔁 Reintentos en {store.path}")
+      else:
+          logging.warning(f"RETRY_STORE no definido: reintentos en {store.path}. "
+                          "Debe ser el mismo RETRY_STORE que usa Jenkins para programarlos")
+      _RETRIES = RetryScheduler(store, fire=lambda params: JENKINS.trigger(params).result())
+  return _RETRIES
+
+def check_email():
+  """Ejecución única (Jenkins): conecta, procesa los no leídos y sale."""
+  try:
+      launched = retry_scheduler().run_due()
+      if launched:
+          logging.info(f"🔁 {launched} reintentos vencidos relanzados")
+      server, uidvalidity = open_mailbox()
+      with server:
+          process_unseen(server, uidvalidity)
   except Exception as e:
       logging.error(f"Error en check_email: {e}")
+  finally:
+      # Los lanzamientos van en segundo plano: esperar a que terminen antes de salir
+      JENKINS.drain()
+
+def has_new_messages(responses):
+  """Indica si las respuestas de IDLE anuncian correo nuevo (EXISTS/RECENT)."""
+  for resp in responses:
+      if isinstance(resp, tuple) and len(resp) > 1 and resp[1] in (b"EXISTS", b"RECENT"):
+          return True
+  return False
+
+def wait_for_new_mail(server):
+  """
+  Bloquea en IMAP IDLE hasta que el servidor notifique correo nuevo
+  o venza el periodo de renovación. Devuelve True si hay correo nuevo.
+  """
+  server.idle()
+  started = time.monotonic()
+  try:
+      while time.monotonic() - started < IDLE_RENEW_SECONDS:
+          responses = server.idle_check(timeout=IDLE_CHECK_TIMEOUT)
+          if has_new_messages(responses):
+              return True
+      return False
+  finally:
+      server.idle_done()
+
+def start_excel_materializer():
+  """Regenera el Excel compartido en segundo plano (lo que la limitación de frecuencia deja pendiente)."""
+  try:
+      from utils.excel_manager import start_materializer
+  except ImportError as e:
+      logging.warning(f"Sin regeneración periódica del Excel: {e}")
+      return
+  start_materializer()
+
+def listen_forever():
+  """
+  Modo listener: mantiene una sesión IMAP autenticada y procesa los
+  correos en cuanto el servidor los notifica por IDLE. Reconecta con
+  backoff exponencial ante caídas de red o del servidor. En paralelo
+  relanza los reintentos de falsos positivos cuando vencen y regenera
+  el Excel compartido.
+  """
+  retry_scheduler().start()
+  start_excel_materializer()
+  backoff = RECONNECT_BACKOFF_MIN
+  while True:
+      try:
+          server, uidvalidity = open_mailbox()
+          with server:
+              logging.info("🔌 Sesión IMAP establecida, escuchando INBOX…")
+              backoff = RECONNECT_BACKOFF_MIN
+              idle_supported = server.has_capability("IDLE")
+              if not idle_supported:
+                  logging.warning(f"El servidor no soporta IDLE, sondeo cada {POLL_INTERVAL}s")
+
+              # Vaciar pendientes antes de la primera espera
+              process_unseen(server, uidvalidity)
+              while True:
+                  if idle_supported:
+                      if wait_for_new_mail(server):
+                          process_unseen(server, uidvalidity)
+                  else:
+                      time.sleep(POLL_INTERVAL)
+                      server.noop()
+                      process_unseen(server, uidvalidity)
+      except KeyboardInterrupt:
+          logging.info("Listener detenido.")
+          return
+      except (IMAPClientError, socket.error, OSError) as e:
+          logging.error(f"Conexión IMAP perdida: {e}. Reintentando en {backoff}s")
+      except Exception as e:
+          logging.error(f"Error en listener: {e}. Reintentando en {backoff}s")
+      try:
+          time.sleep(backoff)
+      except KeyboardInterrupt:
+          logging.info("Listener detenido.")
+          return
+      backoff = min(backoff * 2, RECONNECT_BACKOFF_MAX)
 
 if __name__ == "__main__":
-  logging.info("Listener de correo ejecutado desde Jenkins…")
-  check_email()
+  parser = argparse.ArgumentParser(description="Listener IMAP de alertas")
+  parser.add_argument("--listen", action="store_true",
+                      help="Modo persistente con IMAP IDLE en lugar de una ejecución única")
+  args = parser.parse_args()
+
+  if args.listen:
+      logging.info("Listener de correo en modo persistente (IMAP IDLE)…")
+      listen_forever()
+  else:
+      logging.info("Listener de correo ejecutado desde Jenkins…")
+      check_email()
@@ -1,136 +1,238 @@
 import argparse
-import subprocess
 import sys
 import os
+import json
 import logging
 import shutil
-from dispatcher.loader import load_script_path
+from concurrent.futures import wait
+from dispatcher.plugin import RunContext, execute_plugin
+from dispatcher.http_probe import PROBE_ENABLED, run_probe
+from dispatcher.loader import load_plugin
+from dispatcher.executor import AlertExecutor, MAX_WORKERS, PER_TARGET_LIMIT
 
 logging.basicConfig(
   level=logging.INFO,
-  format="%(asctime)s [%(levelname)s] %(message)s",
+  format="%(asctime)s [%(levelname)s] %(threadName)s %(message)s",
   datefmt="%Y-%m-%d %H:%M:%S"
 )
 
 WORKSPACE = os.getenv("WORKSPACE", os.getcwd())
+CHECK_TIMEOUT = int(os.getenv("CHECK_TIMEOUT", "0"))  # 0 = sin límite
+DEFAULT_PROFILE = os.path.join(WORKSPACE, "profiles", "selenium_cert")
+KNOWN_STATUSES = ("falso_positivo", "alarma_confirmada", "resuelta")
 
-def main():
-  parser = argparse.ArgumentParser(description="Dispatcher de scripts de automatización")
-  parser.add_argument("--script", required=True, help="Nombre del script a ejecutar (según registry)")
-  parser.add_argument("--profile", default=os.path.join(WORKSPACE, "profiles", "selenium_cert"),
-                      help="Ruta al perfil de selenium (opcional)")
-  parser.add_argument("--alert-name", help="Nombre de la alerta detectada")
-  parser.add_argument("--from-email", help="Remitente del correo")
-  parser.add_argument("--subject", help="Asunto del correo")
-  parser.add_argument("--body", help="Cuerpo del correo (opcional, puede venir de variable de entorno)")
-  parser.add_argument("--retry", type=int, default=0, help="Número de reintentos ejecutados")
-  parser.add_argument("--max-retries", type=int, default=1, help="Número máximo de reintentos permitidos")
-
-  args = parser.parse_args()
+def run_check(context, isolation="inprocess", timeout=None):
+  """
+  Ejecuta una comprobación con todo su estado aislado en runs/<ALERT_ID>.
+  Es seguro llamarla desde varios hilos para ALERT_ID distintos.
 
-  alert_name = args.alert_name or os.getenv("ALERT_NAME", "")
-  from_email = args.from_email or os.getenv("EMAIL_FROM", "")
-  subject = args.subject or os.getenv("EMAIL_SUBJECT", "")
-  body = args.body or os.getenv("EMAIL_BODY", "")
-  alert_id = os.getenv("ALERT_ID", "no_id")
-  alert_type = os.getenv("ALERT_TYPE", "").upper()
+  El registro completo (veredicto, pasos, capturas, tiempos) queda en
+  runs/<ALERT_ID>/result.json, que es lo que leen Jenkins y las notificaciones.
 
-  logging.info(f"Script: {args.script}")
-  logging.info(f"Perfil Selenium: {args.profile}")
-  logging.info(f"Alerta: {alert_name}")
-  logging.info(f"Tipo de alerta: {alert_type}")
-  logging.info(f"Retry actual: {args.retry} / Máx: {args.max_retries}")
-  logging.info(f"ALERT_ID: {alert_id}")
-
-  run_dir = os.path.join(WORKSPACE, "runs", alert_id)
-  status_file_workspace = os.path.join(WORKSPACE, "status.txt")
+  :return: Result con el veredicto (verdict None si la comprobación no lo dio).
+  """
+  alert_id = context.alert_id
+  logging.info(f"[{alert_id}] Script: {context.script} | Alerta: {context.alert_name} | Tipo: {context.alert_type}")
+  logging.info(f"[{alert_id}] Perfil Selenium: {context.profile} | Retry: {context.retry} / Máx: {context.max_retries}")
 
   # 🔹 Limpieza SIEMPRE antes de ejecutar
-  if os.path.exists(run_dir):
-      logging.warning(f"Carpeta de ejecución existente para ALERT_ID {alert_id}, limpiando...")
-      shutil.rmtree(run_dir)
-  if os.path.exists(status_file_workspace):
-      logging.warning("status.txt existente en workspace, eliminando...")
-      os.remove(status_file_workspace)
-
-  logs_dir = os.path.join(run_dir, "logs")
-  screenshots_dir = os.path.join(run_dir, "screenshots")
-  os.makedirs(logs_dir, exist_ok=True)
-  os.makedirs(screenshots_dir, exist_ok=True)
-
-  # Guardar ALERT_ID real para Jenkins
-  with open(os.path.join(WORKSPACE, "current_alert_id.txt"), "w") as f:
-      f.write(alert_id)
+  if os.path.exists(context.run_dir):
+      logging.warning(f"[{alert_id}] Carpeta de ejecución existente, limpiando...")
+      shutil.rmtree(context.run_dir, ignore_errors=True)
+  context.prepare()
 
   # 🚫 Si es RESUELTA, no ejecutar Selenium
-  if alert_type == "RESUELTA":
-      logging.info("🔹 ALERTA RESUELTA detectada → No se ejecuta Selenium, solo se continuará con correo/Slack.")
-
-      # 🧹 Limpieza de vestigios de status.txt anteriores
-      old_status_logs = os.path.join(WORKSPACE, "runs", alert_id, "logs", "status.txt")
-      if os.path.exists(old_status_logs):
-          logging.warning(f"Eliminando status.txt viejo en: {old_status_logs}")
-          try:
-              os.remove(old_status_logs)
-          except Exception as e:
-              logging.error(f"No se pudo eliminar {old_status_logs}: {e}")
-
-      # 🧹 Limpieza de carpeta de ejecución anterior
-      old_run_dir = os.path.join(WORKSPACE, "runs", alert_id)
-      if os.path.exists(old_run_dir):
-          logging.warning(f"Eliminando carpeta de ejecución anterior: {old_run_dir}")
-          try:
-              shutil.rmtree(old_run_dir)
-          except Exception as e:
-              logging.error(f"No se pudo eliminar {old_run_dir}: {e}")
-
-      # ✅ Escribir estado correcto
-      with open(status_file_workspace, "w") as f:
-          f.write("resuelta")
-
-      logging.info("Estado 'resuelta' escrito en status.txt del workspace.")
-      sys.exit(0)
+  if context.alert_type == "RESUELTA":
+      logging.info(f"[{alert_id}] 🔹 ALERTA RESUELTA → No se ejecuta Selenium, solo se continuará con correo/Slack.")
+      context.mode = "resuelta"
+      context.write_status("resuelta")
+      result = context.result()
+      context.write_result(result)
+      return result
+
+  # Script no registrado, inexistente o sin run(): error de configuración, no un
+  # veredicto. Solo estos ValueError llegan a main (exit 2); un fallo al importar
+  # el script se repite en execute_plugin y se registra como cualquier otro
+  try:
+      load_plugin(context.script)
+  except ValueError:
+      raise
+  except Exception:
+      pass
+
+  # ⚡ Sonda HTTP previa: si la señal es inequívoca no hace falta abrir Firefox
+  if settle_with_probe(context):
+      result = context.result()
+      context.write_result(result)
+      return result
 
   # --- Ejecución normal para ACTIVA ---
   try:
-      script_relpath = load_script_path(args.script)
+      result = execute_plugin(context.script, context, isolation=isolation, timeout=timeout)
+      logging.info(f"[{alert_id}] Comprobación finalizada ({isolation}) en {result.total_s}s")
   except Exception as e:
-      logging.error(e)
-      sys.exit(2)
+      # Cualquier error de run() (también ValueError) deja result.json: si el script
+      # no llegó a dar veredicto, la comprobación no pudo descartar la alarma
+      logging.error(f"[{alert_id}] Fallo al ejecutar el script: {e}")
+      if context.verdict is None:
+          context.write_status("alarma_confirmada")
+      result = context.result(detail=str(e))
+  context.write_result(result)
+  return result
+
+def settle_with_probe(context):
+  """
+  Ejecuta la sonda HTTP del script (`probe` en config/checks.json) como paso
+  sonda_http. Si la señal es inequívoca fija el veredicto y devuelve True;
+  si no está configurada o no es concluyente, la comprobación sigue en el navegador.
+  Una alarma confirmada por la sonda se notifica con el hook on_probe_alarm del
+  script, si lo tiene (el mismo aviso que enviaría tras el navegador, sin captura).
+  """
+  config = context.check_config.get("probe")
+  if not PROBE_ENABLED or not config:
+      return False
+  with context.step("sonda_http"):
+      try:
+          probe = run_probe(config)
+      except Exception as e:
+          context.log("warn", f"Sonda HTTP fallida ({e}) → comprobación con navegador")
+          return False
+      if probe.verdict is None:
+          context.log("info", f"Sonda HTTP no concluyente ({probe.reason}) → comprobación con navegador")
+          return False
+      context.log("info", f"Sonda HTTP {probe.outcome}: {probe.reason} ({probe.elapsed_ms} ms) → {probe.verdict}")
+      context.write_status(probe.verdict)
+      if probe.verdict == "alarma_confirmada":
+          notify_probe_alarm(context, probe.reason)
+  context.mode = "probe"
+  return True
+
+def notify_probe_alarm(context, reason):
+  """Llama a on_probe_alarm(ctx, reason) del script; un fallo solo se registra."""
+  try:
+      hook = getattr(load_plugin(context.script), "on_probe_alarm", None)
+      if hook:
+          hook(context, f"Sonda HTTP: {reason}")
+  except Exception as e:
+      context.log("warn", f"No se pudo notificar la alarma de la sonda: {e}")
+
+def context_from_job(job, profile):
+  """Construye el RunContext de una línea JSON de la cola de alertas."""
+  return RunContext(
+      alert_id=job["alert_id"],
+      script=job["script"],
+      alert_name=job.get("alert_name", ""),
+      alert_type=job.get("alert_type", "").upper(),
+      from_email=job.get("from_email", ""),
+      subject=job.get("subject", ""),
+      body=job.get("body", ""),
+      profile=job.get("profile", profile),
+      retry=int(job.get("retry", 0)),
+      max_retries=int(job.get("max_retries", 1)),
+  )
+
+def run_queue(queue_path, args):
+  """
+  Modo concurrente: ejecuta todas las alertas de un fichero JSON Lines
+  (o stdin con "-") en un pool acotado de workers.
+  """
+  from browser.pool import configure_pool, shutdown_pool
+
+  stream = sys.stdin if queue_path == "-" else open(queue_path, "r", encoding="utf-8")
+  with stream:
+      jobs = [json.loads(line) for line in stream if line.strip()]
+  logging.info(f"{len(jobs)} alertas en cola | workers: {args.workers} | por objetivo: {args.per_target}")
+
+  # El pool solo sirve en este modo: un build de Jenkins (--script) es un proceso por
+  # alerta y siempre arranca Firefox en frío
+  pool_size = args.pool_size
+  if pool_size is None:
+      pool_size = int(os.getenv("BROWSER_POOL_SIZE", args.workers))
+  logging.info(f"Firefox precalentados: {pool_size}")
+  configure_pool(args.profile, pool_size)
+  executor = AlertExecutor(
+      lambda ctx: run_check(ctx, args.isolation, args.timeout or None),
+      max_workers=args.workers,
+      per_target_limit=args.per_target,
+  )
+  futures = {}
+  try:
+      for job in jobs:
+          context = context_from_job(job, args.profile)
+          futures[context.alert_id] = executor.submit(context.script, context.alert_id, context)
+      wait(list(futures.values()))
+  finally:
+      executor.shutdown()
+      shutdown_pool()
+
+  exit_code = 0
+  for alert_id, future in futures.items():
+      try:
+          status = future.result().verdict
+      except Exception as e:
+          status = None
+          logging.error(f"[{alert_id}] {e}")
+      logging.info(f"[{alert_id}] => {status}")
+      if status not in KNOWN_STATUSES:
+          exit_code = 2
+  sys.exit(exit_code)
 
-  script_abspath = os.path.join(WORKSPACE, script_relpath)
-  if not os.path.exists(script_abspath):
-      logging.error(f"Script no encontrado en: {script_abspath}")
-      sys.exit(2)
+def main():
+  parser = argparse.ArgumentParser(description="Dispatcher de scripts de automatización")
+  parser.add_argument("--script", help="Nombre del script a ejecutar (según registry)")
+  parser.add_argument("--profile", default=DEFAULT_PROFILE,
+                      help="Ruta al perfil de selenium (opcional)")
+  parser.add_argument("--alert-name", help="Nombre de la alerta detectada")
+  parser.add_argument("--from-email", help="Remitente del correo")
+  parser.add_argument("--subject", help="Asunto del correo")
+  parser.add_argument("--body", help="Cuerpo del correo (opcional, puede venir de variable de entorno)")
+  parser.add_argument("--retry", type=int, default=0, help="Número de reintentos ejecutados")
+  parser.add_argument("--max-retries", type=int, default=1, help="Número máximo de reintentos permitidos")
+  parser.add_argument("--isolation", choices=["inprocess", "process"], default=os.getenv("CHECK_ISOLATION", "inprocess"),
+                      help="inprocess: ejecuta el plugin en este intérprete; process: proceso hijo aislado")
+  parser.add_argument("--timeout", type=int, default=CHECK_TIMEOUT,
+                      help="Tiempo máximo de la comprobación en segundos (0 = sin límite); en inprocess "
+                           "es de mejor esfuerzo: el script no se detiene, solo se deja de esperar")
+  parser.add_argument("--queue", help="Fichero JSON Lines de alertas (o '-' para stdin) a ejecutar en paralelo")
+  parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="Comprobaciones simultáneas en modo --queue")
+  parser.add_argument("--per-target", type=int, default=PER_TARGET_LIMIT,
+                      help="Comprobaciones simultáneas por script objetivo en modo --queue")
+  parser.add_argument("--pool-size", type=int,
+                      help="Firefox precalentados en modo --queue (por defecto BROWSER_POOL_SIZE o uno por worker; 0 = en frío)")
 
-  log_file = os.path.join(logs_dir, "execution.log")
+  args = parser.parse_args()
 
-  cmd = [sys.executable, script_abspath, args.profile, alert_name, from_email, subject, body]
+  if args.queue:
+      run_queue(args.queue, args)
+  if not args.script:
+      parser.error("--script es obligatorio salvo en modo --queue")
+
+  context = RunContext(
+      alert_id=os.getenv("ALERT_ID", "no_id"),
+      script=args.script,
+      alert_name=args.alert_name or os.getenv("ALERT_NAME", ""),
+      alert_type=os.getenv("ALERT_TYPE", "").upper(),
+      from_email=args.from_email or os.getenv("EMAIL_FROM", ""),
+      subject=args.subject or os.getenv("EMAIL_SUBJECT", ""),
+      body=args.body or os.getenv("EMAIL_BODY", ""),
+      profile=args.profile,
+      retry=args.retry,
+      max_retries=args.max_retries,
+  )
 
   try:
-      with open(log_file, "w") as lf:
-          proc = subprocess.run(cmd, stdout=lf, stderr=lf, check=False)
-      rc = proc.returncode
-      logging.info(f"Proceso finalizado con código: {rc}")
-  except Exception as e:
-      logging.error(f"Fallo al ejecutar el script: {e}")
-      sys.exit(2)
-
-  status = None
-  if os.path.exists(status_file_workspace):
-      try:
-          with open(status_file_workspace, "r") as f:
-              status = f.read().strip()
-      except Exception as e:
-          logging.warning(f"No se pudo leer status.txt: {e}")
-  else:
-      logging.error("status.txt no encontrado en workspace")
+      result = run_check(context, args.isolation, args.timeout or None)
+  except ValueError as e:
+      logging.error(e)
       sys.exit(2)
 
+  status = result.verdict
   if status:
-      logging.info(f"status.txt => {status}")
+      logging.info(f"status => {status}")
+      if result.failing_step:
+          logging.info(f"Paso fallido: {result.failing_step}")
   else:
-      logging.error("status.txt vacío")
+      logging.error("La comprobación no devolvió estado")
       sys.exit(2)
 
   if status == "falso_positivo":
@@ -1,14 +1,16 @@
 import os
 import sys
-import time
-from datetime import datetime
+from contextlib import ExitStack
 from dotenv import load_dotenv
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.firefox.service import Service
 from selenium.common.exceptions import NoSuchElementException
-from webdriver_manager.firefox import GeckoDriverManager
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+   sys.path.insert(0, SRC_DIR)
+from browser.pool import lease_driver
+from browser.waits import wait_for_loaders, wait_until
+from dispatcher.plugin import RunContext, Result
 
 # =========================
 # Cargar .env
@@ -18,112 +20,59 @@ if os.path.exists(ENV_PATH):
    load_dotenv(dotenv_path=ENV_PATH)
 
 WORKSPACE = os.getenv("WORKSPACE", os.getcwd())
-ALERT_ID = os.getenv("ALERT_ID", datetime.now().strftime("%Y%m%d_%H%M%S"))
-ALERT_NAME = sys.argv[2] if len(sys.argv) > 2 else os.getenv("ALERT_NAME", "")
-FROM_EMAIL = sys.argv[3] if len(sys.argv) > 3 else os.getenv("EMAIL_FROM", "")
-EMAIL_SUBJECT = sys.argv[4] if len(sys.argv) > 4 else os.getenv("EMAIL_SUBJECT", "")
-EMAIL_BODY = sys.argv[5] if len(sys.argv) > 5 else os.getenv("EMAIL_BODY", "")
-
-# =========================
-# Carpetas
-# =========================
-run_dir = os.path.join(WORKSPACE, "runs", ALERT_ID)
-screenshots_dir = os.path.join(run_dir, "screenshots")
-logs_dir = os.path.join(run_dir, "logs")
-os.makedirs(screenshots_dir, exist_ok=True)
-os.makedirs(logs_dir, exist_ok=True)
-
-# Guardar ALERT_ID real para Jenkins
-with open(os.path.join(WORKSPACE, "current_alert_id.txt"), "w") as f:
-   f.write(ALERT_ID)
-
-# =========================
-# Logging
-# =========================
-def log(level: str, message: str) -> None:
-   timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-   line = f"[{timestamp}] [{level.upper()}] {message}"
-   print(line)
-   with open(os.path.join(logs_dir, "execution.log"), "a", encoding="utf-8") as f:
-       f.write(line + "\n")
-
-def save_screenshot(driver, name: str) -> str:
-   filename = os.path.join(screenshots_dir, f"{name}.png")
-   driver.save_screenshot(filename)
-   log("info", f"Captura guardada en: {filename}")
-   return filename
-
-def write_status(status_value):
-   log("info", f"Escribiendo status: {status_value}")
-   with open(os.path.join(logs_dir, "status.txt"), "w") as f:
-       f.write(status_value)
-   with open(os.path.join(WORKSPACE, "status.txt"), "w") as f:
-       f.write(status_value)
-
-# =========================
-# Driver
-# =========================
-def setup_driver() -> webdriver.Firefox:
-   profile_path = os.path.join(WORKSPACE, "profiles", "selenium_cert")
-   if not os.path.exists(profile_path):
-       log("error", f"Perfil Selenium no encontrado en: {profile_path}")
-       sys.exit(2)
-
-   log("info", f"Usando perfil de Firefox: {profile_path}")
-   options = Options()
-   options.add_argument("--headless")
-   options.add_argument("--no-sandbox")
-   options.add_argument("--disable-dev-shm-usage")
-   options.add_argument("--disable-gpu")
-   options.add_argument("--window-size=1920,1080")
-   options.profile = webdriver.FirefoxProfile(profile_path)
-
-   service = Service(GeckoDriverManager().install())
-   driver = webdriver.Firefox(service=service, options=options)
-   driver.set_page_load_timeout(60)
-   return driver
 
 # =========================
 # Flujo principal
 # =========================
-def run_automation():
-   driver = None
+def run_flow(ctx, driver) -> bool:
    try:
-       driver = setup_driver()
-       log("info", "Abriendo Google...")
-       driver.get("https://www.google.com")
-       time.sleep(2)
+       with ctx.step("abrir_url"):
+           ctx.log("info", "Abriendo Google...")
+           driver.get("https://www.google.com")
+           wait_until(ctx, driver, ctx.wait_budget(30), lambda d: d.execute_script("return document.readyState") == "complete")
+           wait_for_loaders(ctx, driver, ctx.wait_budget(10))
 
-       try:
-           logo = driver.find_element(By.ID, "hplogo")
-       except NoSuchElementException:
+       with ctx.step("buscar_logo"):
            try:
-               logo = driver.find_element(By.XPATH, "//img[@alt='Google']")
+               logo = driver.find_element(By.ID, "hplogo")
            except NoSuchElementException:
-               logo = None
+               try:
+                   logo = driver.find_element(By.XPATH, "//img[@alt='Google']")
+               except NoSuchElementException:
+                   logo = None
 
        if logo:
-           log("info", "Logo encontrado → alarma_confirmada")
-           save_screenshot(driver, "google_logo")
-           write_status("alarma_confirmada")
+           ctx.log("info", "Logo encontrado → alarma_confirmada")
+           ctx.save_screenshot(driver, "google_logo")
+           ctx.write_status("alarma_confirmada")
            return False
        else:
-           log("info", "Logo NO encontrado → falso_positivo")
-           save_screenshot(driver, "logo_no_encontrado")
-           write_status("falso_positivo")
+           ctx.log("info", "Logo NO encontrado → falso_positivo")
+           ctx.save_screenshot(driver, "logo_no_encontrado", success=True)
+           ctx.write_status("falso_positivo")
            return True
 
    except Exception as e:
-       log("error", f"Error crítico: {e}")
-       if driver:
-           save_screenshot(driver, "error_critico")
-       write_status("alarma_confirmada")
+       ctx.log("error", f"Error crítico: {e}")
+       ctx.save_screenshot(driver, "error_critico")
+       ctx.write_status("alarma_confirmada")
        return False
-   finally:
-       if driver:
-           driver.quit()
+
+def run(ctx: RunContext) -> Result:
+   ctx.log("info", f"Alerta: {ctx.alert_name} | Remitente: {ctx.from_email} | Asunto: {ctx.subject}")
+   ctx.log("info", f"Usando perfil de Firefox: {ctx.profile}")
+   try:
+       with ExitStack() as stack:
+           with ctx.step("arranque_navegador"):
+               driver = stack.enter_context(lease_driver(ctx.profile))
+           run_flow(ctx, driver)
+   except Exception as e:
+       ctx.log("error", f"Error crítico: {e}")
+       ctx.write_status("alarma_confirmada")
+   return ctx.result()
 
 if __name__ == "__main__":
-   log("info", f"Alerta: {ALERT_NAME} | Remitente: {FROM_EMAIL} | Asunto: {EMAIL_SUBJECT}")
-   success = run_automation()
-   sys.exit(0 if success else 1)
+   ctx = RunContext.from_env("01_carrega_url_wsdl")
+   result = run(ctx)
+   ctx.write_result(result)
+   sys.exit(0 if result.verdict == "falso_positivo" else 1)
@@ -7,7 +7,7 @@ Este script:
 3. Realiza pasos de autenticación y navegación en la web objetivo.
 4. Detecta si la alerta es un falso positivo o una alerta real.
 5. Guarda capturas, logs y estado de la ejecución.
-6. Envía correo de alerta en caso de incidencia real.
+6. Encola un correo de alerta en caso de incidencia real.
 
 Autor: Rodrigo Simoes
 Proyecto: GSIT_Alertas
@@ -15,20 +15,18 @@ Proyecto: GSIT_Alertas
 
 import os
 import sys
-import time
-from datetime import datetime
+from contextlib import ExitStack
 from dotenv import load_dotenv
-from selenium import webdriver
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.firefox import GeckoDriverManager
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.image import MIMEImage
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+   sys.path.insert(0, SRC_DIR)
+from browser.pool import lease_driver
+from browser.waits import wait_for_loaders, wait_until, wait_clickable, find_in_frames, wait_for_route_change
+from dispatcher.mailer import queue_mail
+from dispatcher.plugin import RunContext, Result
 
 # =========================
 # Cargar configuración
@@ -39,151 +37,48 @@ if os.path.exists(ENV_PATH):
 
 WORKSPACE = os.getenv("WORKSPACE", os.getcwd())
 EMAIL_USER = os.getenv("EMAIL_USER")
-EMAIL_PASS = os.getenv("EMAIL_PASS")
 ACCES_FRONTAL_EMD_URL = os.getenv("ACCES_FRONTAL_EMD_URL")
 DEFAULT_WAIT = int(os.getenv("DEFAULT_WAIT", "15"))
-ALERT_ID = os.getenv("ALERT_ID", datetime.now().strftime("%Y%m%d_%H%M%S"))
-ALERT_NAME = os.getenv("ALERT_NAME", "Acces Frontal EMD")
-
-# =========================
-# Carpetas de ejecución
-# =========================
-run_dir = os.path.join(WORKSPACE, "runs", ALERT_ID)
-screenshots_dir = os.path.join(run_dir, "screenshots")
-logs_dir = os.path.join(run_dir, "logs")
-os.makedirs(screenshots_dir, exist_ok=True)
-os.makedirs(logs_dir, exist_ok=True)
-
-# =========================
-# Logging
-# =========================
-def log(level: str, message: str) -> None:
-   """
-   Registra un mensaje en consola y en el archivo de log.
-
-   :param level: Nivel del log (info, warn, error).
-   :param message: Mensaje a registrar.
-   """
-   timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-   line = f"[{timestamp}] [{level.upper()}] {message}"
-   print(line)
-   with open(os.path.join(logs_dir, "execution.log"), "a", encoding="utf-8") as f:
-       f.write(line + "\n")
-
-def save_screenshot(driver, name: str) -> str:
-   """
-   Guarda una captura de pantalla en la carpeta de screenshots.
-
-   :param driver: Instancia de WebDriver.
-   :param name: Nombre del archivo sin extensión.
-   :return: Ruta completa de la captura guardada.
-   """
-   filename = os.path.join(screenshots_dir, f"{name}.png")
-   driver.save_screenshot(filename)
-   log("info", f"Captura guardada en: {filename}")
-   return filename
 
 # =========================
 # Email
 # =========================
-def send_alert_email(screenshot_path: str, error_msg: str):
+def send_alert_email(ctx, screenshot_path: str, error_msg: str):
    """
-   Envía un correo de alerta con la captura y el mensaje de error.
+   Encola un correo de alerta con la captura y el mensaje de error; lo envía
+   el mailer compartido en segundo plano, sin retrasar el veredicto.
 
-   :param screenshot_path: Ruta de la captura de pantalla.
+   :param ctx: Contexto de la ejecución.
+   :param screenshot_path: Ruta de la captura de pantalla (None si no la hay).
    :param error_msg: Mensaje de error a incluir en el correo.
    """
-   if not EMAIL_USER or not EMAIL_PASS:
-       log("warn", "Email no configurado.")
-       return
-
-   subject = f"ALERTA REAL: {ALERT_NAME}"
+   subject = f"ALERTA REAL: {ctx.alert_name}"
    body = f"""
    <h3>Alarma REAL detectada</h3>
    <p><strong>Error:</strong> {error_msg}</p>
-   <p><strong>Run:</strong> {ALERT_ID}</p>
+   <p><strong>Run:</strong> {ctx.alert_id}</p>
    <p>Revise urgentemente.</p>
    """
 
-   msg = MIMEMultipart()
-   msg['From'] = EMAIL_USER
-   msg['To'] = EMAIL_USER
-   msg['Subject'] = subject
-   msg.attach(MIMEText(body, 'html'))
-
-   with open(screenshot_path, 'rb') as f:
-       img = MIMEImage(f.read())
-       img.add_header('Content-Disposition', 'attachment', filename=os.path.basename(screenshot_path))
-       msg.attach(img)
-
-   try:
-       server = smtplib.SMTP('smtp.gmail.com', 587)
-       server.starttls()
-       server.login(EMAIL_USER, EMAIL_PASS)
-       server.send_message(msg)
-       server.quit()
-       log("info", "Email enviado.")
-   except Exception as e:
-       log("error", f"Email falló: {e}")
-
-# =========================
-# Driver Selenium
-# =========================
-def setup_driver() -> webdriver.Firefox:
-   """
-   Configura y devuelve una instancia de Firefox WebDriver con perfil predefinido.
-
-   :return: Instancia de Firefox WebDriver.
-   """
-   profile_path = os.path.join(WORKSPACE, "profiles", "selenium_cert")
-   if not os.path.exists(profile_path):
-       log("error", f"Perfil Selenium no encontrado en: {profile_path}")
-       sys.exit(2)
-
-   options = Options()
-   options.add_argument("--headless")
-   options.add_argument("--no-sandbox")
-   options.add_argument("--disable-dev-shm-usage")
-   options.add_argument("--disable-gpu")
-   options.add_argument("--window-size=1920,1080")
-   options.profile = webdriver.FirefoxProfile(profile_path)
+   if queue_mail(EMAIL_USER, subject, body, attachments=[screenshot_path]):
+       ctx.log("info", "Email encolado.")
+   else:
+       ctx.log("warn", "Email no configurado.")
 
-   service = Service(GeckoDriverManager().install())
-   driver = webdriver.Firefox(service=service, options=options)
-   driver.set_page_load_timeout(60)
-   return driver
-
-# =========================
-# Espera de loaders
-# =========================
-def wait_for_loaders(driver, timeout=DEFAULT_WAIT):
-   """
-   Espera a que desaparezcan elementos de carga (spinners, overlays, etc.).
-
-   :param driver: Instancia de WebDriver.
-   :param timeout: Tiempo máximo de espera por cada selector.
-   """
-   loaders_selectors = [
-       ".spinner", ".loading", ".loader", "[class*='spinner']", "[class*='loading']",
-       "app-root[loading]", "div[id*='loader']", ".overlay", ".blocker",
-       "body > div[style*='block']", "div[role='dialog']", ".modal-backdrop"
-   ]
-   for selector in loaders_selectors:
-       try:
-           WebDriverWait(driver, 2).until(
-               EC.invisibility_of_element_located((By.CSS_SELECTOR, selector))
-           )
-       except:
-           continue
-   log("info", "Loaders/Overlays desaparecidos.")
+def on_probe_alarm(ctx, reason: str):
+   """Alarma confirmada por la sonda HTTP sin abrir Firefox: mismo correo, sin captura."""
+   send_alert_email(ctx, None, reason)
 
 # =========================
 # Clic con espera
 # =========================
-def click_with_wait(driver, by, selector, description, iframe=False, shadow=False):
+def click_with_wait(ctx, driver, by, selector, description, iframe=False, shadow=False):
    """
-   Espera a que un elemento esté presente/visible y realiza clic.
+   Espera a que un elemento esté presente y sea clicable, y realiza clic.
+   Los timeouts salen del presupuesto aprendido del paso (ctx.wait_budget);
+   las constantes solo se usan mientras no hay histórico.
 
+   :param ctx: Contexto de la ejecución.
    :param driver: Instancia de WebDriver.
    :param by: Estrategia de localización (By.ID, By.XPATH, etc.).
    :param selector: Selector del elemento.
@@ -193,181 +88,159 @@ def click_with_wait(driver, by, selector, description, iframe=False, shadow=Fals
    :return: True si el clic fue exitoso, False en caso contrario.
    """
    try:
-       wait_for_loaders(driver, timeout=20)
+       wait_for_loaders(ctx, driver, timeout=ctx.wait_budget(20))
        if shadow:
            script = 'return document.querySelector("#single-spa-application\\\\:mfe-main-app > app-root").shadowRoot.querySelector("main > app-acces > div > div.left > button")'
-           WebDriverWait(driver, DEFAULT_WAIT).until(lambda d: d.execute_script(script))
-           elem = driver.execute_script(script)
+           elem = wait_until(ctx, driver, ctx.wait_budget(DEFAULT_WAIT), lambda d: d.execute_script(script))
        elif iframe:
-           iframe_elem = WebDriverWait(driver, DEFAULT_WAIT).until(
+           iframe_elem = wait_until(ctx, driver, ctx.wait_budget(DEFAULT_WAIT),
                EC.presence_of_element_located((By.TAG_NAME, "iframe"))
            )
            driver.switch_to.frame(iframe_elem)
-           elem = WebDriverWait(driver, 30).until(
+           elem = wait_until(ctx, driver, ctx.wait_budget(30),
                EC.presence_of_element_located((by, selector))
            )
        else:
-           elem = WebDriverWait(driver, 30).until(
-               EC.presence_of_element_located((by, selector))
-           )
-           WebDriverWait(driver, 30).until(
+           elem = wait_until(ctx, driver, ctx.wait_budget(30),
                EC.visibility_of_element_located((by, selector))
            )
 
-       driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", elem)
-       time.sleep(1)
+       wait_clickable(ctx, driver, elem, ctx.wait_budget(DEFAULT_WAIT))
        try:
            elem.click()
-           log("info", f"✓ Clic normal: {description}")
+           ctx.log("info", f"✓ Clic normal: {description}")
        except:
-           log("warn", f"Clic normal falló, usando JS para: {description}")
+           ctx.log("warn", f"Clic normal falló, usando JS para: {description}")
            driver.execute_script("arguments[0].click();", elem)
-           log("info", f"✓ Clic con JS: {description}")
+           ctx.log("info", f"✓ Clic con JS: {description}")
 
        if iframe:
            driver.switch_to.default_content()
        return True
    except Exception as e:
-       log("error", f"✗ Fallo total: {description} | {e}")
-       screenshot = save_screenshot(driver, f"error_{description.replace(' ', '_')}")
-       write_status("alarma_confirmada")
-       send_alert_email(screenshot, f"No se pudo interactuar: {description}")
+       ctx.log("error", f"✗ Fallo total: {description} | {e}")
+       screenshot = ctx.save_screenshot(driver, f"error_{description.replace(' ', '_')}")
+       ctx.write_status("alarma_confirmada")
+       send_alert_email(ctx, screenshot, f"No se pudo interactuar: {description}")
        return False
 
 # =========================
 # Certificado digital
 # =========================
-def click_btn_cert(driver) -> bool:
+def click_btn_cert(ctx, driver) -> bool:
    """
-   Intenta hacer clic en el botón de certificado digital, buscando en DOM principal e iframes.
+   Intenta hacer clic en el botón de certificado digital, buscando a la vez
+   en el DOM principal y en los iframes.
 
+   :param ctx: Contexto de la ejecución.
    :param driver: Instancia de WebDriver.
    :return: True si se clicó correctamente, False en caso contrario.
    """
    try:
-       wait_for_loaders(driver)
+       wait_for_loaders(ctx, driver, ctx.wait_budget(DEFAULT_WAIT))
        try:
-           elem = WebDriverWait(driver, DEFAULT_WAIT).until(
-               EC.presence_of_element_located((By.ID, "btnContinuaCertCaptcha"))
-           )
-           driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", elem)
-           time.sleep(1)
+           elem = find_in_frames(ctx, driver, By.ID, "btnContinuaCertCaptcha", ctx.wait_budget(DEFAULT_WAIT))
+           wait_clickable(ctx, driver, elem, ctx.wait_budget(DEFAULT_WAIT))
            driver.execute_script("arguments[0].click();", elem)
-           log("info", "Certificado clicado (DOM principal).")
+           ctx.log("info", "Certificado clicado.")
            return True
-       except:
-           log("warn", "Buscando certificado en iframes...")
-
-       for iframe in driver.find_elements(By.TAG_NAME, "iframe"):
-           driver.switch_to.frame(iframe)
-           try:
-               elem = WebDriverWait(driver, 5).until(
-                   EC.presence_of_element_located((By.ID, "btnContinuaCertCaptcha"))
-               )
-               driver.execute_script("arguments[0].click();", elem)
-               log("info", "Certificado clicado en iframe.")
-               driver.switch_to.default_content()
-               return True
-           except:
-               driver.switch_to.default_content()
-       return False
+       finally:
+           driver.switch_to.default_content()
    except Exception as e:
-       log("error", f"Error certificado: {e}")
-       save_screenshot(driver, "error_cert")
+       ctx.log("error", f"Error certificado: {e}")
+       ctx.save_screenshot(driver, "error_cert")
        return False
 
-# =========================
-# Escritura de status.txt
-# =========================
-def write_status(status_value):
-   """
-   Escribe el estado de la ejecución en logs y en la raíz del workspace.
-
-   :param status_value: Valor del estado (falso_positivo, alarma_confirmada, etc.).
-   """
-   log("info", f"Escribiendo status: {status_value}")
-   with open(os.path.join(logs_dir, "status.txt"), "w") as f:
-       f.write(status_value)
-   with open(os.path.join(WORKSPACE, "status.txt"), "w") as f:
-       f.write(status_value)
-
 # =========================
 # Flujo principal
 # =========================
-def run_automation():
+def run_flow(ctx, driver) -> bool:
    """
-   Ejecuta el flujo completo de validación:
+   Ejecuta el flujo completo de validación sobre un driver ya arrancado:
    1. Abre la URL objetivo.
    2. Interactúa con elementos clave (shadow DOM, certificado, botones).
    3. Verifica la carga de documentos.
    4. Determina si es falso positivo o alerta real.
    """
-   driver = setup_driver()
    try:
-       log("info", f"URL: {ACCES_FRONTAL_EMD_URL}")
-       driver.get(ACCES_FRONTAL_EMD_URL)
-       WebDriverWait(driver, 30).until(lambda d: d.execute_script("return document.readyState") == "complete")
-
-       if not click_with_wait(driver, None, None, "Botón 'Soc un ciutadà/ana'", shadow=True):
-           driver.quit()
-           return False
-
-       if not click_btn_cert(driver):
-           screenshot = save_screenshot(driver, "cert_fallo")
-           write_status("alarma_confirmada")
-           send_alert_email(screenshot, "No se pudo seleccionar certificado digital")
-           driver.quit()
-           return False
-
-       log("info", "Esperando 5 segundos extra post-certificado...")
-       time.sleep(5)
-       wait_for_loaders(driver, timeout=30)
-
-       if not click_with_wait(driver, By.ID, "apt_did", "Dades i documents"):
-           driver.quit()
-           return False
-
-       if not click_with_wait(driver, By.XPATH, '//*[@id="center_1R"]/app-root/app-home/div/div[2]/div[2]/h3/a', "Els meus documents"):
-           driver.quit()
-           return False
-
-       log("info", "Esperando documentos...")
-       try:
-           WebDriverWait(driver, DEFAULT_WAIT * 2).until(
-               EC.visibility_of_element_located((By.XPATH, '//*[@id="center_1R"]/app-root/app-emd/emd-home/emd-documents/div/emd-cards-view/ul/li[1]/div'))
-           )
+       with ctx.step("abrir_url"):
+           ctx.log("info", f"URL: {ACCES_FRONTAL_EMD_URL}")
+           driver.get(ACCES_FRONTAL_EMD_URL)
+           wait_until(ctx, driver, ctx.wait_budget(30), lambda d: d.execute_script("return document.readyState") == "complete")
+
+       with ctx.step("boton_ciutada"):
+           if not click_with_wait(ctx, driver, None, None, "Botón 'Soc un ciutadà/ana'", shadow=True):
+               return False
+
+       with ctx.step("certificado"):
+           previous_url = driver.current_url
+           if not click_btn_cert(ctx, driver):
+               screenshot = ctx.save_screenshot(driver, "cert_fallo")
+               ctx.write_status("alarma_confirmada")
+               send_alert_email(ctx, screenshot, "No se pudo seleccionar certificado digital")
+               return False
+
+           # El portal redirige tras validar el certificado: esperar a la nueva ruta y a que se calme
+           wait_for_route_change(ctx, driver, previous_url, ctx.wait_budget(30))
+           wait_for_loaders(ctx, driver, timeout=ctx.wait_budget(30))
+
+       with ctx.step("dades_i_documents"):
+           if not click_with_wait(ctx, driver, By.ID, "apt_did", "Dades i documents"):
+               return False
+
+       with ctx.step("els_meus_documents"):
+           if not click_with_wait(ctx, driver, By.XPATH, '//*[@id="center_1R"]/app-root/app-home/div/div[2]/div[2]/h3/a', "Els meus documents"):
+               return False
+
+       with ctx.step("carga_documentos"):
+           ctx.log("info", "Esperando documentos...")
+           try:
+               wait_until(ctx, driver, ctx.wait_budget(DEFAULT_WAIT * 2),
+                   EC.visibility_of_element_located((By.XPATH, '//*[@id="center_1R"]/app-root/app-emd/emd-home/emd-documents/div/emd-cards-view/ul/li[1]/div'))
+               )
            
            
-           # 2. Esperar a que el spinner de carga DESAPAREZCA
-           # Ajusta el selector según el HTML real (ver más abajo)
-           WebDriverWait(driver, 10).until(
-                EC.invisibility_of_element_located(
-                    (By.XPATH, "//*[contains(@class, 'spinner') or contains(@class, 'loading') or contains(@class, 'overlay')]")
+               # 2. Esperar a que el spinner de carga DESAPAREZCA
+               # Ajusta el selector según el HTML real (ver más abajo)
+               wait_until(ctx, driver, ctx.wait_budget(10),
+                    EC.invisibility_of_element_located(
+                        (By.XPATH, "//*[contains(@class, 'spinner') or contains(@class, 'loading') or contains(@class, 'overlay')]")
+                    )
                 )
-            )
-           # Opcional: pequeño sleep para estabilidad visual (solo si es necesario)
-           # import time; time.sleep(0.5)
-           log("info", "FLUJOS OK - Falso positivo")
-           save_screenshot(driver, "final_ok")
-           write_status("falso_positivo")
+               # Opcional: pequeño sleep para estabilidad visual (solo si es necesario)
+               # import time; time.sleep(0.5)
+               ctx.log("info", "FLUJOS OK - Falso positivo")
+               ctx.save_screenshot(driver, "final_ok", success=True)
+               ctx.write_status("falso_positivo")
            
-           return True
-       except:
-           log("error", "ALERTA REAL: No cargaron documentos")
-           screenshot = save_screenshot(driver, "alarma_real")
-           write_status("alarma_confirmada")
-           send_alert_email(screenshot, "No se cargó la lista de documentos")
-           return False
+               return True
+           except:
+               ctx.log("error", "ALERTA REAL: No cargaron documentos")
+               screenshot = ctx.save_screenshot(driver, "alarma_real")
+               ctx.write_status("alarma_confirmada")
+               send_alert_email(ctx, screenshot, "No se cargó la lista de documentos")
+               return False
 
    except Exception as e:
-       log("error", f"Error crítico: {e}")
-       screenshot = save_screenshot(driver, "error_critico")
-       write_status("alarma_confirmada")
-       send_alert_email(screenshot, f"Error crítico: {e}")
+       ctx.log("error", f"Error crítico: {e}")
+       screenshot = ctx.save_screenshot(driver, "error_critico")
+       ctx.write_status("alarma_confirmada")
+       send_alert_email(ctx, screenshot, f"Error crítico: {e}")
        return False
-   finally:
-       driver.quit()
+
+def run(ctx: RunContext) -> Result:
+   """
+   Punto de entrada del plugin: toma un Firefox (del pool o en frío) con el
+   perfil de certificado de la ejecución y lanza el flujo de validación.
+   """
+   with ExitStack() as stack:
+       with ctx.step("arranque_navegador"):
+           driver = stack.enter_context(lease_driver(ctx.profile))
+       run_flow(ctx, driver)
+   return ctx.result()
 
 if __name__ == "__main__":
-   success = run_automation()
-   sys.exit(0 if success else 1)
+   ctx = RunContext.from_env("acces_frontal_emd", "Acces Frontal EMD")
+   result = run(ctx)
+   ctx.write_result(result)
+   sys.exit(0 if result.verdict == "falso_positivo" else 1)
@@ -0,0 +1,19 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Mismo layout que en Jenkins: src/ para dispatcher y browser, la raíz para utils/
+for path in (os.path.join(ROOT_DIR, "src"), ROOT_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture(autouse=True)
+def retry_store(tmp_path, monkeypatch):
+    """Ningún test debe crear state/retries.db en el checkout."""
+    path = str(tmp_path / "retries.db")
+    monkeypatch.setenv("RETRY_STORE", path)
+    return path
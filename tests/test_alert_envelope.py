@@ -0,0 +1,60 @@
+# tests/test_alert_envelope.py
+from email.mime.text import MIMEText
+
+from utils.alert_envelope import AlertEnvelope, clean_body, html_to_text, message_text
+
+BODY = """ALERTA ACTIVA - Àrea Privada
+Recepció: 17/10/2026 10:15:42
+Inici: 17/10/2026 10:12
+Criticitat: Alta / Servei
+Afectació: Total
+Afectació: Total
+Descripció: Temps de resposta
+superior al llindar
+Error: HTTP 503 - Timeout
+---------------------------------------------------------------------------------------------------------------
+Este mensaje va dirigido exclusivamente a su destinatario
+"""
+
+
+def test_from_text_extracts_every_field():
+    envelope = AlertEnvelope.from_text(BODY, "monitor@gva.es", "ALERTA ACTIVA - Àrea Privada", "<1@x>")
+    assert envelope.alert_type == "ACTIVA"
+    assert envelope.alert_id == "20261017_101542"
+    assert envelope.recepcio == "17/10/2026 10:15:42"
+    # Como el generador original: la primera línea Inici o Recepció
+    assert envelope.inici == "17/10/2026 10:15"
+    assert envelope.recuperacio == ""
+    assert envelope.criticitat == "Alta"
+    assert envelope.afectacio == "Total"
+    assert envelope.descripcio == "Temps de resposta\nsuperior al llindar"
+    assert envelope.error == "HTTP 503 - Timeout"
+
+
+def test_resolved_alert_and_missing_reception():
+    body = BODY.replace("ALERTA ACTIVA", "Alerta resuelta") + "Recuperació: 17/10/2026 11:00:00\n"
+    assert AlertEnvelope.from_text(body, subject="Alerta resuelta").alert_type == "RESUELTA"
+    envelope = AlertEnvelope.from_text("ALERTA ACTIVA sin fecha")
+    assert envelope.alert_type == "ACTIVA" and envelope.alert_id == ""
+
+
+def test_json_round_trip_ignores_unknown_fields():
+    envelope = AlertEnvelope.from_text(BODY, "monitor@gva.es", "asunto", "<1@x>")
+    assert AlertEnvelope.from_json(envelope.to_json()) == envelope
+    assert AlertEnvelope.from_json({"alert_id": "X", "nuevo_campo": 1}).alert_id == "X"
+    assert AlertEnvelope.from_json("") is None
+    assert AlertEnvelope.from_json("{no es json") is None
+
+
+def test_clean_body_drops_disclaimer_and_repeated_afectacio():
+    cleaned = clean_body(BODY)
+    assert cleaned.count("Afectació") == 1
+    assert "Este mensaje" not in cleaned
+
+
+def test_html_bodies_become_plain_text():
+    html = "<html><head><style>p{}</style></head><body><p>Recepció: 17/10/2026 10:15:42</p><div>Error: X</div></body></html>"
+    text = html_to_text(html)
+    assert "p{}" not in text
+    assert "Recepció: 17/10/2026 10:15:42\n" in text
+    assert message_text(MIMEText(html, "html", "utf-8")) == text
@@ -0,0 +1,53 @@
+# tests/test_email_generator.py
+import os
+
+import pytest
+
+from utils import email_generator
+from utils.alert_envelope import AlertEnvelope
+from utils.email_generator import CompiledTemplate, calcular_duracion
+
+
+def test_render_fills_every_placeholder_in_one_pass():
+    template = CompiledTemplate("<p>{{ alert_id }} · {{criticitat}} · {{alert_id}}</p>")
+    assert template.placeholders == {"alert_id", "criticitat"}
+    # Un valor con llaves no se vuelve a expandir
+    assert template.render({"alert_id": "{{criticitat}}", "criticitat": "Alta"}) == \
+        "<p>{{criticitat}} · Alta · {{criticitat}}</p>"
+
+
+def test_missing_values_stay_visible():
+    assert CompiledTemplate("Hola {{nombre}}!").render({}) == "Hola {{nombre}}!"
+    assert CompiledTemplate("sin marcadores").render({"x": 1}) == "sin marcadores"
+
+
+def test_calcular_duracion():
+    assert calcular_duracion("17/10/2026 10:00", "17/10/2026 11:05:30") == "1:05:30"
+    assert calcular_duracion("17/10/2026 10:00", "") == ""
+
+
+@pytest.fixture
+def templates(tmp_path, monkeypatch):
+    monkeypatch.setattr(email_generator, "TEMPLATES_DIR", str(tmp_path))
+    monkeypatch.setattr(email_generator, "_TEMPLATE_CACHE", {})
+    return tmp_path
+
+
+def test_compiled_template_is_cached_until_the_file_changes(templates):
+    path = templates / "demo.html"
+    path.write_text("v1 {{alert_id}}", encoding="utf-8")
+    first = email_generator.compile_template("demo")
+    assert email_generator.compile_template("demo") is first
+    path.write_text("version 2 {{alert_id}}", encoding="utf-8")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+    assert email_generator.compile_template("demo").source == "version 2 {{alert_id}}"
+    with pytest.raises(FileNotFoundError):
+        email_generator.compile_template("no_existe")
+
+
+def test_generate_email_uses_the_envelope(templates):
+    (templates / "demo.html").write_text("{{alert_id}} {{fecha_inicio}} {{duracion}} {{afectacio}}", encoding="utf-8")
+    envelope = AlertEnvelope(inici="17/10/2026 10:00", recuperacio="17/10/2026 10:30:00", afectacio="Total")
+    html, fields = email_generator.generate_email_and_excel_fields("demo", "", "RESUELTA", "A1", envelope=envelope)
+    assert html == "A1 17/10/2026 10:00 0:30:00 Total"
+    assert fields["ID"] == "A1" and fields["Fi"] == "17/10/2026 10:30:00"
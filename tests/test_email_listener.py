@@ -0,0 +1,62 @@
+# tests/test_email_listener.py
+import importlib
+import os
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("imapclient")
+pytest.importorskip("requests")
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def listener(tmp_path, monkeypatch):
+    monkeypatch.setenv("STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("ALERTS_CONFIG", os.path.join(ROOT_DIR, "config", "alerts.json"))
+    module = importlib.import_module("email_listener")
+    monkeypatch.setattr(module, "CHECKPOINT_PATH", str(tmp_path / "imap_checkpoint.json"))
+    monkeypatch.setattr(module, "STATE_DIR", str(tmp_path))
+    return module
+
+
+class Mailbox:
+    """Servidor IMAP mínimo: respuestas FETCH fijas por UID."""
+
+    def __init__(self, headers):
+        self.headers = headers
+        self.seen = []
+
+    def search(self, criteria):
+        return sorted(self.headers)
+
+    def fetch(self, uids, items):
+        return {uid: self.headers[uid] for uid in uids if self.headers[uid] is not None}
+
+    def add_flags(self, uids, flags):
+        self.seen.extend(uids)
+
+
+def headers(key=b"BODY[HEADER.FIELDS (FROM SUBJECT MESSAGE-ID)]"):
+    return {key: b"From: nadie@example.com\r\nSubject: Hola\r\nMessage-ID: <1@x>\r\n\r\n"}
+
+
+def test_header_key_is_matched_case_insensitively(listener):
+    raw = listener.header_part(headers(b"body[header.fields (subject from message-id)]"))
+    assert raw.startswith(b"From:")
+    assert listener.header_part({b"BODY[]": b"x"}) is None
+
+
+def test_missing_headers_stop_seen_flag_and_checkpoint(listener):
+    server = Mailbox({5: headers(), 6: None, 7: headers()})
+    listener.process_unseen(server, 1)
+    assert server.seen == [5]
+    assert listener.load_checkpoint(1) == 5
+
+
+def test_retry_store_is_opened_on_first_use(listener, monkeypatch, retry_store):
+    monkeypatch.setattr(listener, "_RETRIES", None)
+    assert not os.path.exists(retry_store)
+    assert listener.retry_scheduler().store.path == retry_store
+    assert os.path.exists(retry_store)
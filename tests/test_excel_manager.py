@@ -0,0 +1,78 @@
+# tests/test_excel_manager.py
+import os
+import sqlite3
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("openpyxl")
+pytest.importorskip("filelock")
+
+from filelock import FileLock  # noqa: E402
+
+from utils import excel_manager  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    excel = str(tmp_path / "alertas.xlsx")
+    monkeypatch.setattr(excel_manager, "SHARED_EXCEL_PATH", excel)
+    monkeypatch.setattr(excel_manager, "LOCK_PATH", excel + ".lock")
+    monkeypatch.setattr(excel_manager, "ALERTS_DB_PATH", str(tmp_path / "alertas.db"))
+    return excel
+
+
+def rows(excel):
+    return pd.read_excel(excel, dtype=str).fillna("")
+
+
+def test_upsert_skips_duplicates_and_close_sets_fi(store):
+    outcomes = excel_manager.upsert_alerts([{"ID": "A1", "Inici": "x"}, {"ID": " A1 "}, {"ID": "A2"}])
+    assert outcomes == [("A1", "inserted"), ("A1", "duplicate"), ("A2", "inserted")]
+    assert excel_manager.close_alerts([{"ID": "A2", "Fi": "01/01/2026 10:00"}, "A9"]) == [
+        ("A2", "closed"), ("A9", "not_found")]
+    df = rows(store)
+    assert list(df["ID"]) == ["A1", "A2"]
+    assert list(df["Fi"]) == ["", "01/01/2026 10:00"]
+
+
+def test_excel_is_current_right_after_add_alert(store):
+    # Con el intervalo por defecto cada build copia un Excel que ya incluye su alerta
+    excel_manager.add_alert({"ID": "A1"})
+    excel_manager.add_alert({"ID": "A2"})
+    assert list(rows(store)["ID"]) == ["A1", "A2"]
+
+
+def test_materialize_only_when_version_changed(store):
+    excel_manager.upsert_alerts([{"ID": "A1"}])
+    assert not excel_manager.materialize_excel(force=True)
+    excel_manager.upsert_alerts([{"ID": "A2"}])
+    assert len(rows(store)) == 2
+
+
+def test_interval_defers_write_until_forced(store, monkeypatch):
+    excel_manager.upsert_alerts([{"ID": "A1"}])
+    monkeypatch.setattr(excel_manager, "MATERIALIZE_INTERVAL", 3600)
+    excel_manager.upsert_alerts([{"ID": "A2"}])
+    assert len(rows(store)) == 1
+    assert excel_manager.materialize_excel(force=True)
+    assert len(rows(store)) == 2
+
+
+def test_lock_timeout_is_logged_not_raised(store, monkeypatch, capsys):
+    excel_manager.upsert_alerts([{"ID": "A1"}])
+    monkeypatch.setattr(excel_manager, "FileLock", lambda path, timeout: FileLock(path, timeout=0.1))
+    with FileLock(excel_manager.LOCK_PATH):
+        excel_manager.add_alert({"ID": "A2"})
+    assert "timeout" in capsys.readouterr().out
+    assert len(rows(store)) == 1
+    assert [f for f in os.listdir(os.path.dirname(store)) if f.endswith(".xlsx")] == ["alertas.xlsx"]
+
+
+def test_locked_database_is_logged_not_raised(store, monkeypatch, capsys):
+    def locked(records):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(excel_manager, "upsert_alerts", locked)
+    excel_manager.add_alert({"ID": "A1"})
+    assert "bloqueado" in capsys.readouterr().out
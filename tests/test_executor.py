@@ -0,0 +1,82 @@
+# tests/test_executor.py
+import threading
+import time
+from concurrent.futures import wait
+
+import pytest
+
+from dispatcher.executor import AlertExecutor
+
+
+def run_with_deadline(fn, seconds=10):
+    """Ejecuta fn en un hilo y falla si no termina a tiempo (en lugar de colgar la suite)."""
+    outcome = {}
+    worker = threading.Thread(target=lambda: outcome.setdefault("value", fn()), daemon=True)
+    worker.start()
+    worker.join(seconds)
+    assert not worker.is_alive(), "el executor se ha bloqueado"
+    return outcome.get("value")
+
+
+def test_instant_jobs_do_not_deadlock():
+    # Jobs que terminan antes de add_done_callback: el callback se ejecuta en el hilo que envía
+    executor = AlertExecutor(lambda job: job, max_workers=8, per_target_limit=2)
+
+    def burst():
+        futures = [executor.submit(f"target{i % 3}", f"alert{i}", i) for i in range(500)]
+        wait(futures)
+        return sorted(f.result() for f in futures)
+
+    try:
+        assert run_with_deadline(burst) == list(range(500))
+    finally:
+        executor.shutdown()
+
+
+def test_per_target_limit_is_respected():
+    lock = threading.Lock()
+    running, peak = {"n": 0}, {"n": 0}
+
+    def job(_):
+        with lock:
+            running["n"] += 1
+            peak["n"] = max(peak["n"], running["n"])
+        time.sleep(0.02)
+        with lock:
+            running["n"] -= 1
+
+    executor = AlertExecutor(job, max_workers=8, per_target_limit=2)
+    try:
+        futures = [executor.submit("same_target", f"alert{i}", i) for i in range(10)]
+        run_with_deadline(lambda: wait(futures))
+        assert all(f.done() for f in futures)
+        assert peak["n"] == 2
+    finally:
+        executor.shutdown()
+
+
+def test_same_alert_id_returns_in_flight_future():
+    release = threading.Event()
+    executor = AlertExecutor(lambda job: release.wait(5) and job, max_workers=2, per_target_limit=2)
+    try:
+        first = executor.submit("t", "alert", "a")
+        second = executor.submit("t", "alert", "b")
+        assert first is second
+        release.set()
+        assert first.result(timeout=5) == "a"
+    finally:
+        executor.shutdown()
+
+
+def test_job_exception_reaches_future():
+    def job(_):
+        raise RuntimeError("boom")
+
+    executor = AlertExecutor(job, max_workers=1, per_target_limit=1)
+    try:
+        futures = [executor.submit("t", f"alert{i}", i) for i in range(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="boom"):
+                future.result(timeout=5)
+    finally:
+        executor.shutdown()
@@ -0,0 +1,80 @@
+# tests/test_http_probe.py
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from dispatcher import http_probe  # noqa: E402
+from dispatcher.http_probe import DOWN, INCONCLUSIVE, UP, classify, run_probe  # noqa: E402
+
+PAGES = {
+    "/ok": (200, "<h1>Benvingut a l'Àrea Privada</h1>"),
+    "/shell": (200, "<div id='app'></div>"),
+    "/maintenance": (200, "<h1>Servei en manteniment</h1>"),
+    "/down": (503, "Service Unavailable"),
+    "/missing": (404, "Not Found"),
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, body = PAGES[self.path]
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+CONFIG = {"expect_text": "Àrea Privada", "forbid_text": ["manteniment"], "timeout": 2}
+
+
+@pytest.mark.parametrize("path, outcome", [
+    ("/ok", UP),
+    ("/shell", INCONCLUSIVE),
+    ("/maintenance", DOWN),
+    ("/down", DOWN),
+    ("/missing", INCONCLUSIVE),
+])
+def test_classify(site, path, outcome):
+    probe = classify(CONFIG, site + path)
+    assert probe.outcome == outcome, probe.reason
+    assert probe.verdict == http_probe.VERDICTS.get(outcome)
+
+
+def test_connection_refused_is_down():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    assert classify(CONFIG, f"http://127.0.0.1:{port}/").outcome == DOWN
+
+
+def test_tls_error_is_inconclusive(site):
+    # HTTPS contra un servidor HTTP: el handshake falla como con un certificado no reconocido
+    probe = classify(CONFIG, site.replace("http://", "https://") + "/ok")
+    assert probe.outcome == INCONCLUSIVE and probe.reason.startswith("Error TLS")
+    assert probe.verdict is None
+
+
+def test_run_probe_confirms_down_and_needs_a_url(site, monkeypatch):
+    calls = []
+    real = http_probe.classify
+    monkeypatch.setattr(http_probe, "classify", lambda config, url: calls.append(url) or real(config, url))
+    probe = run_probe(dict(CONFIG, url=site + "/down", attempts=2, retry_delay=0))
+    assert probe.outcome == DOWN and len(calls) == 2
+    assert run_probe({"url_env": "NO_EXISTE_ESTA_URL"}).outcome == INCONCLUSIVE
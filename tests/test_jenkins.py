@@ -0,0 +1,35 @@
+# tests/test_jenkins.py
+import threading
+
+import pytest
+
+pytest.importorskip("requests")
+
+from dispatcher.jenkins import JenkinsClient  # noqa: E402
+
+
+def params(alert_name, alert_id="17/10/2026 10:00:00"):
+    return {"SCRIPT_NAME": alert_name, "ALERT_NAME": alert_name, "ALERT_ID": alert_id, "ALERT_TYPE": "ACTIVA"}
+
+
+def test_in_flight_key_includes_the_alert(monkeypatch):
+    client = JenkinsClient("http://jenkins.invalid", "job")
+    release, posted = threading.Event(), []
+
+    def post_build(p):
+        posted.append(p["ALERT_NAME"])
+        release.wait(5)
+        return True
+
+    monkeypatch.setattr(client, "_post_build", post_build)
+    try:
+        first = client.trigger(params("area_privada"))
+        assert client.trigger(params("area_privada")) is first
+        other = client.trigger(params("acces_frontal_emd"))
+        assert other is not first
+        release.set()
+        assert first.result(5) and other.result(5)
+        assert sorted(posted) == ["acces_frontal_emd", "area_privada"]
+    finally:
+        release.set()
+        client.close()
@@ -0,0 +1,43 @@
+# tests/test_ledger.py
+import pytest
+
+from dispatcher.ledger import IngestionLedger
+
+RECEPCIO = "17/10/2026 10:00:00"
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = IngestionLedger(str(tmp_path / "state" / "ledger.db"))
+    yield ledger
+    ledger.close()
+
+
+def test_same_message_or_same_alert_is_a_duplicate(ledger):
+    assert ledger.claim("<1@x>", RECEPCIO, "ACTIVA", "area_privada")
+    assert not ledger.claim("<1@x>", "otro", "ACTIVA", "otra")
+    assert not ledger.claim("<2@x>", RECEPCIO, "activa", "Area_Privada")
+    assert ledger.claim("<3@x>", RECEPCIO, "RESUELTA", "area_privada")
+
+
+def test_different_alerts_in_the_same_second_are_both_dispatched(ledger):
+    assert ledger.claim("<1@x>", RECEPCIO, "ACTIVA", "area_privada")
+    assert ledger.claim("<2@x>", RECEPCIO, "ACTIVA", "acces_frontal_emd")
+
+
+def test_release_lets_the_alert_be_claimed_again(ledger):
+    assert ledger.claim("<1@x>", RECEPCIO, "ACTIVA", "area_privada")
+    ledger.release("<1@x>", RECEPCIO, "ACTIVA", "area_privada")
+    assert ledger.claim("<1@x>", RECEPCIO, "ACTIVA", "area_privada")
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("dispatcher.ledger.time.time", lambda: clock[0])
+    ledger = IngestionLedger(str(tmp_path / "ledger.db"), ttl=60)
+    try:
+        assert ledger.claim("<1@x>", RECEPCIO, "ACTIVA", "area_privada")
+        clock[0] += 61
+        assert ledger.claim("<1@x>", RECEPCIO, "ACTIVA", "area_privada")
+    finally:
+        ledger.close()
@@ -0,0 +1,32 @@
+# tests/test_loader.py
+import threading
+
+from dispatcher import loader
+
+# Cada import deja una marca junto al script
+SCRIPT = """
+import time
+with open(__file__ + ".imports", "a") as f:
+    f.write("x")
+time.sleep(0.2)
+
+def run(context):
+    return "ok"
+"""
+
+
+def test_concurrent_load_imports_the_script_once(tmp_path, monkeypatch):
+    (tmp_path / "demo.py").write_text(SCRIPT, encoding="utf-8")
+    monkeypatch.setattr(loader, "WORKSPACE", str(tmp_path))
+    monkeypatch.setattr(loader, "_PLUGINS", {})
+    monkeypatch.setitem(loader.SCRIPT_REGISTRY, "demo", "demo.py")
+
+    modules = []
+    threads = [threading.Thread(target=lambda: modules.append(loader.load_plugin("demo"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert (tmp_path / "demo.py.imports").read_text() == "x"
+    assert len({id(m) for m in modules}) == 1
+    assert modules[0].run(None) == "ok"
@@ -0,0 +1,129 @@
+# tests/test_mailer.py
+import json
+import os
+import time
+
+import pytest
+
+from dispatcher import mailer
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    monkeypatch.setattr(mailer, "_own_entries", set())
+    return str(tmp_path / "outbox")
+
+
+@pytest.fixture
+def idle_mailer(outbox, monkeypatch):
+    """Mailer con el hilo ya parado: las pruebas llaman a _drain a mano."""
+    m = mailer.Mailer("bot@example.com", "secret", outbox=outbox)
+    m.close()
+    sent = []
+    monkeypatch.setattr(m, "_send", lambda msg: sent.append(msg["Subject"]))
+    m.sent = sent
+    return m
+
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_claim_gets_fresh_mtime(idle_mailer, outbox, monkeypatch):
+    path = mailer.enqueue("ops@example.com", "alerta", "<p>x</p>", outbox=outbox)
+    age(path, mailer.CLAIM_STALE + 60)
+    claims = []
+
+    def deliver(entry, claimed, original):
+        # Mientras se envía, otro drenador no debe ver el reclamo como abandonado
+        claims.append(time.time() - os.path.getmtime(claimed))
+        idle_mailer._recover_stale(claimed)
+        assert os.path.exists(claimed)
+        os.remove(claimed)
+
+    monkeypatch.setattr(idle_mailer, "_deliver", deliver)
+    idle_mailer._drain()
+    assert claims and claims[0] < 5
+
+
+def test_stale_claim_returns_to_queue(idle_mailer, outbox):
+    path = mailer.enqueue("ops@example.com", "alerta", "<p>x</p>", outbox=outbox)
+    claimed = path + ".sending"
+    os.rename(path, claimed)
+    age(claimed, mailer.CLAIM_STALE + 60)
+    idle_mailer._recover_stale(claimed)
+    assert os.path.exists(path) and not os.path.exists(claimed)
+
+
+def test_deliver_with_missing_claim_is_already_handled(idle_mailer, outbox, monkeypatch):
+    path = mailer.enqueue("ops@example.com", "alerta", "<p>x</p>", outbox=outbox)
+    with open(path, encoding="utf-8") as f:
+        entry = json.load(f)
+    os.remove(path)
+    idle_mailer._deliver(dict(entry), path + ".sending", path)
+    assert idle_mailer.sent == ["alerta"]
+
+    def fail(msg):
+        raise OSError("smtp caído")
+
+    monkeypatch.setattr(idle_mailer, "_send", fail)
+    idle_mailer._deliver(dict(entry), path + ".sending", path)
+    # Sin reclamo no se reencola: otro proceso ya se ha hecho cargo
+    assert os.listdir(outbox) == ["failed"]
+
+
+def test_failed_send_goes_back_with_backoff(idle_mailer, outbox, monkeypatch):
+    path = mailer.enqueue("ops@example.com", "alerta", "<p>x</p>", outbox=outbox)
+
+    def fail(msg):
+        raise OSError("smtp caído")
+
+    monkeypatch.setattr(idle_mailer, "_send", fail)
+    idle_mailer._drain()
+    with open(path, encoding="utf-8") as f:
+        entry = json.load(f)
+    assert entry["attempts"] == 1 and entry["next_attempt"] > time.time()
+    assert not os.path.exists(path + ".sending")
+
+
+def test_flush_ignores_foreign_and_backoff_entries(idle_mailer, outbox):
+    own = mailer.enqueue("ops@example.com", "propia", "<p>x</p>", outbox=outbox)
+    # Reintento pendiente de esta ejecución y reclamo en curso de otro proceso
+    with open(own, encoding="utf-8") as f:
+        entry = json.load(f)
+    entry["next_attempt"] = time.time() + 300
+    mailer._write_entry(own, entry)
+    foreign = os.path.join(outbox, "0_ajena.json.sending")
+    mailer._write_entry(foreign, dict(entry, next_attempt=0))
+
+    start = time.monotonic()
+    assert idle_mailer.flush(timeout=5, entries=mailer._own_entries)
+    assert time.monotonic() - start < 1
+    assert idle_mailer.pending() == []
+    # El reclamo ajeno solo cuenta si se pregunta por esa entrada
+    assert idle_mailer.pending([foreign[:-len(".sending")]]) == [foreign[:-len(".sending")]]
+
+
+def test_flush_waits_for_own_entries(outbox, monkeypatch):
+    sent = []
+    monkeypatch.setattr(mailer.Mailer, "_send", lambda self, msg: sent.append(msg["Subject"]))
+    m = mailer.Mailer("bot@example.com", "secret", outbox=outbox)
+    try:
+        mailer.enqueue("ops@example.com", "propia", "<p>x</p>", outbox=outbox)
+        assert m.flush(timeout=5, entries=mailer._own_entries)
+        assert sent == ["propia"]
+    finally:
+        m.close()
+
+
+def test_parent_adopts_child_entries(outbox):
+    os.makedirs(outbox)
+    child = os.path.join(outbox, f"{time.time_ns()}_4242_abcd1234.json")
+    other = os.path.join(outbox, f"{time.time_ns()}_4343_abcd1234.json")
+    for path in (child, other):
+        mailer._write_entry(path, {"to": [], "subject": "", "html": "", "attachments": [],
+                                   "created": 0, "attempts": 0, "next_attempt": 0})
+    os.rename(child, child + ".sending")
+    mailer.adopt_entries(4242, outbox=outbox)
+    assert mailer._own_entries == {child}
@@ -0,0 +1,40 @@
+# tests/test_metrics.py
+import pytest
+
+from dispatcher import metrics
+from dispatcher.result import Result, StepTiming
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {"db_path": str(tmp_path / "metrics.db"), "textfile_dir": str(tmp_path / "metrics")}
+
+
+def run(mode, seconds, verdict="falso_positivo"):
+    return Result(verdict=verdict, script="area_privada", mode=mode, total_s=seconds,
+                  steps=[StepTiming(name="login", duration_s=seconds)])
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 21))
+    assert metrics.percentile(values, 0.95) == 19
+    assert metrics.percentile(values, 0.5) == 10
+    assert metrics.percentile([7], 0.95) == 7
+
+
+def test_budgets_learn_only_from_browser_runs(paths, monkeypatch):
+    monkeypatch.setattr(metrics, "BUDGET_MIN_SAMPLES", 3)
+    for _ in range(3):
+        metrics.export_run_metrics(run("browser", 4.0), **paths)
+    for _ in range(10):
+        metrics.export_run_metrics(run("probe", 0.2), **paths)
+        metrics.export_run_metrics(run("resuelta", 0.0, "resuelta"), **paths)
+    assert metrics.learned_budgets("area_privada", paths["db_path"]) == {"login": 12.0}
+
+
+def test_series_are_labelled_by_mode(paths):
+    path = metrics.export_run_metrics(run("probe", 0.3, "alarma_confirmada"), **paths)
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    assert 'gsit_check_runs_total{mode="probe",script="area_privada",verdict="alarma_confirmada"} 1' in text
+    assert 'mode="browser"' not in text
@@ -0,0 +1,47 @@
+# tests/test_plugin.py
+import threading
+
+import pytest
+
+from dispatcher import plugin
+from dispatcher.metrics import BUDGET_MIN
+
+
+@pytest.fixture
+def ctx(tmp_path, monkeypatch):
+    monkeypatch.setattr(plugin, "WORKSPACE", str(tmp_path))
+    context = plugin.RunContext(alert_id="A1", script="demo").prepare()
+    context._budgets = {"login": 8.0}
+    return context
+
+
+def test_without_history_waits_use_the_default(ctx):
+    with ctx.step("sin_historico"):
+        assert ctx.wait_budget(30) == 30
+
+
+def test_budget_only_shortens_the_default(ctx):
+    with ctx.step("login"):
+        assert 7 < ctx.wait_budget(30) <= 8
+        assert ctx.wait_budget(3) == 3
+
+
+def test_exhausted_budget_keeps_a_floor_and_only_warns(ctx, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(plugin.time, "monotonic", lambda: clock[0])
+    with ctx.step("login"):
+        clock[0] += 60
+        assert ctx.wait_budget(30) == BUDGET_MIN
+        assert ctx.wait_budget(2) == 2
+    assert ctx.steps[-1].outcome == "ok"
+    with open(f"{ctx.logs_dir}/execution.log", encoding="utf-8") as f:
+        assert "por encima de su presupuesto" in f.read()
+
+
+def test_inprocess_timeout_is_reported_and_logged(ctx):
+    release = threading.Event()
+    with pytest.raises(TimeoutError):
+        plugin._run_in_thread(lambda context: release.wait(5), ctx, timeout=0.1)
+    release.set()
+    with open(f"{ctx.logs_dir}/execution.log", encoding="utf-8") as f:
+        assert "sigue ejecutándose" in f.read()
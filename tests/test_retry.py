@@ -0,0 +1,84 @@
+# tests/test_retry.py
+import threading
+import time
+
+import pytest
+
+from dispatcher import retry
+from dispatcher.retry import RetryScheduler, RetryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RetryStore(str(tmp_path / "state" / "retries.db"))
+
+
+def params(alert_id="A1", retry_count="1"):
+    return {"ALERT_ID": alert_id, "SCRIPT_NAME": "area_privada", "RETRY_COUNT": retry_count}
+
+
+def test_store_path_is_read_when_opened(tmp_path, monkeypatch):
+    path = tmp_path / "compartido" / "retries.db"
+    monkeypatch.setenv("RETRY_STORE", str(path))
+    assert RetryStore().path == str(path)
+    assert path.exists()
+
+
+def test_take_returns_params_once(store):
+    store.put("A1", params(), 100.0)
+    assert store.take("A1", 100.0) == params()
+    assert store.take("A1", 100.0) is None
+    assert store.pending() == []
+
+
+def test_take_ignores_a_rescheduled_entry(store):
+    store.put("A1", params(retry_count="1"), 100.0)
+    store.put("A1", params(retry_count="2"), 200.0)
+    assert store.take("A1", 100.0) is None
+    assert store.take("A1", 200.0)["RETRY_COUNT"] == "2"
+
+
+def test_concurrent_take_hands_the_retry_to_one_caller(tmp_path):
+    path = str(tmp_path / "retries.db")
+    RetryStore(path).put("A1", params(), 100.0)
+    # Un almacén por hilo, como varios procesos sobre el mismo fichero
+    results, stores = [], [RetryStore(path) for _ in range(8)]
+    threads = [threading.Thread(target=lambda s=s: results.append(s.take("A1", 100.0))) for s in stores]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert sum(r is not None for r in results) == 1
+
+
+def test_run_due_fires_due_entries_and_reschedules_failures(store, monkeypatch):
+    monkeypatch.setattr(retry, "RETRY_FAILED_DELAY", 60)
+    now = time.time()
+    store.put("A1", params("A1"), now - 5)
+    store.put("A2", params("A2"), now - 1)
+    store.put("A3", params("A3"), now + 300)
+    fired = []
+    scheduler = RetryScheduler(store, fire=lambda p: fired.append(p["ALERT_ID"]) or p["ALERT_ID"] == "A1")
+    assert scheduler.run_due() == 2
+    assert fired == ["A1", "A2"]
+    pending = dict((alert_id, due) for due, alert_id in store.pending())
+    assert set(pending) == {"A2", "A3"}
+    assert pending["A2"] >= now + 59
+
+
+def test_scheduler_thread_fires_when_due(store):
+    fired = threading.Event()
+    scheduler = RetryScheduler(store, fire=lambda p: fired.set() or True, poll=0.1).start()
+    try:
+        scheduler.schedule(params(), 0.2)
+        assert fired.wait(3)
+        assert store.pending() == []
+    finally:
+        scheduler.stop()
+
+
+def test_retry_delay_per_attempt_from_config(monkeypatch):
+    monkeypatch.setattr(retry, "load_check_config", lambda name: {"retry_backoff": [30, 120]})
+    assert [retry.retry_delay("area_privada", n) for n in (1, 2, 3)] == [30, 120, 120]
+    monkeypatch.setattr(retry, "load_check_config", lambda name: {})
+    assert retry.retry_delay("area_privada", 1) == retry.RETRY_BACKOFF
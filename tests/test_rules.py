@@ -0,0 +1,58 @@
+# tests/test_rules.py
+import json
+
+import pytest
+
+from dispatcher.rules import NeedleSet, RuleMatcher, load_alert_rules, normalize_text
+
+RULES = {
+    "area_privada": {"from": "monitor@gva.es", "subject_contains": "Àrea Privada", "script": "area_privada"},
+    "area_privada_login": {"from": "monitor@gva.es", "subject_contains": "Àrea Privada",
+                           "body_contains": "login", "script": "area_privada"},
+    "wsdl": {"subject_contains": "WSDL", "body_contains": "carrega url", "script": "01_carrega_url_wsdl"},
+}
+
+
+def match(matcher, from_email, subject, body=""):
+    return matcher.match(normalize_text(from_email), normalize_text(subject), normalize_text(body))[0]
+
+
+def test_normalize_text_strips_symbols_and_case():
+    assert normalize_text("  🚨 ALERTA:  Àrea-Privada!! ") == "alerta àrea privada"
+    assert normalize_text(None) == ""
+
+
+def test_first_matching_rule_wins_in_declaration_order():
+    matcher = RuleMatcher(RULES)
+    assert match(matcher, "Monitor@GVA.es", "ALERTA Àrea Privada", "error de login") == "area_privada"
+    assert match(matcher, "x@y", "Fallo WSDL", "no carrega url") == "wsdl"
+    assert match(matcher, "x@y", "Fallo WSDL", "otro texto") is None
+
+
+def test_prefilter_uses_only_headers():
+    matcher = RuleMatcher(RULES)
+    assert matcher.prefilter(normalize_text("monitor@gva.es"), normalize_text("Àrea Privada"))
+    assert matcher.prefilter("", normalize_text("wsdl caído"))
+    assert not matcher.prefilter(normalize_text("monitor@gva.es"), "otro asunto")
+
+
+def test_needle_set_reports_overlapping_needles():
+    needles = NeedleSet(["error", "error de login", "login"])
+    assert needles.find("hay un error de login") == {"error", "error de login", "login"}
+
+
+@pytest.mark.parametrize("value", ["🚨🚨", "!!", "   "])
+def test_empty_rule_value_after_normalizing_is_rejected(tmp_path, value):
+    path = tmp_path / "alerts.json"
+    path.write_text(json.dumps({"mala": {"subject_contains": value, "script": "area_privada"}}), encoding="utf-8")
+    with pytest.raises(ValueError, match="mala"):
+        load_alert_rules(str(path))
+    with pytest.raises(ValueError, match="subject_contains"):
+        RuleMatcher({"mala": {"subject_contains": value, "script": "area_privada"}})
+
+
+def test_rule_without_script_is_rejected(tmp_path):
+    path = tmp_path / "alerts.json"
+    path.write_text(json.dumps({"sin_script": {"from": "a@b"}}), encoding="utf-8")
+    with pytest.raises(ValueError, match="script"):
+        load_alert_rules(str(path))
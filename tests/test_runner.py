@@ -0,0 +1,80 @@
+# tests/test_runner.py
+import json
+import socket
+
+import pytest
+
+pytest.importorskip("requests")
+
+import runner  # noqa: E402
+from dispatcher import loader, plugin  # noqa: E402
+from dispatcher.http_probe import INCONCLUSIVE, ProbeResult  # noqa: E402
+from dispatcher.plugin import RunContext  # noqa: E402
+
+# Script de prueba: anota en un fichero cada llamada al hook
+SCRIPT = """
+import json
+
+def run(context):
+    context.write_status("falso_positivo")
+    return context.result()
+
+def on_probe_alarm(context, reason):
+    with open(__file__ + ".alarms", "a", encoding="utf-8") as f:
+        f.write(json.dumps([context.alert_id, reason]) + "\\n")
+"""
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.setattr(plugin, "WORKSPACE", str(tmp_path))
+    monkeypatch.setattr(loader, "WORKSPACE", str(tmp_path))
+    monkeypatch.setattr(loader, "_PLUGINS", {})
+    monkeypatch.setattr(loader, "_CHECKS", {})
+    monkeypatch.setattr(plugin, "learned_budgets", lambda script: {})
+    monkeypatch.setattr(plugin, "export_run_metrics", lambda result: None)
+    return tmp_path
+
+
+def add_script(workspace, monkeypatch, name, source, probe=None):
+    (workspace / f"{name}.py").write_text(source, encoding="utf-8")
+    monkeypatch.setitem(loader.SCRIPT_REGISTRY, name, f"{name}.py")
+    if probe:
+        loader._CHECKS[name] = {"probe": probe}
+
+
+def refused_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}/"
+
+
+def test_probe_alarm_calls_the_script_hook(workspace, monkeypatch):
+    add_script(workspace, monkeypatch, "demo", SCRIPT, probe={"url": refused_url(), "retry_delay": 0})
+    result = runner.run_check(RunContext(alert_id="A1", script="demo", alert_type="ACTIVA"))
+    assert result.verdict == "alarma_confirmada" and result.mode == "probe"
+    alarms = (workspace / "demo.py.alarms").read_text(encoding="utf-8").splitlines()
+    alert_id, reason = json.loads(alarms[0])
+    assert len(alarms) == 1 and alert_id == "A1" and reason.startswith("Sonda HTTP: Sin conexión")
+
+
+def test_inconclusive_probe_falls_through_to_the_script(workspace, monkeypatch):
+    add_script(workspace, monkeypatch, "demo", SCRIPT, probe={"url": "https://intranet.example/"})
+    monkeypatch.setattr(runner, "run_probe", lambda config: ProbeResult(INCONCLUSIVE, "Error TLS: prueba"))
+    result = runner.run_check(RunContext(alert_id="A2", script="demo", alert_type="ACTIVA"))
+    assert result.verdict == "falso_positivo" and result.mode == "browser"
+    assert not (workspace / "demo.py.alarms").exists()
+
+
+def test_value_error_from_run_still_writes_result(workspace, monkeypatch):
+    add_script(workspace, monkeypatch, "demo", "def run(context):\n    int('sin número')\n")
+    context = RunContext(alert_id="A3", script="demo", alert_type="ACTIVA")
+    result = runner.run_check(context)
+    assert result.verdict == "alarma_confirmada" and "invalid literal" in result.detail
+    with open(workspace / "runs" / "A3" / "result.json", encoding="utf-8") as f:
+        assert json.load(f)["verdict"] == "alarma_confirmada"
+
+
+def test_unregistered_script_is_a_configuration_error(workspace):
+    with pytest.raises(ValueError, match="no está registrado"):
+        runner.run_check(RunContext(alert_id="A4", script="no_existe", alert_type="ACTIVA"))
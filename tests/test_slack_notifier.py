@@ -0,0 +1,60 @@
+# tests/test_slack_notifier.py
+import os
+import threading
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("filelock")
+pytest.importorskip("requests")
+
+from utils import slack_notifier  # noqa: E402
+
+
+def alert(n, alert_type="ACTIVA"):
+    return dict(alert_id=f"ID{n}", alert_name=f"Servicio {n}", alert_type=alert_type,
+                status="alarma_confirmada", email_body="", jenkins_url=f"https://jenkins/job/{n}/")
+
+
+@pytest.fixture
+def posted(monkeypatch, tmp_path):
+    sent = []
+    monkeypatch.setattr(slack_notifier, "SLACK_WEBHOOK_URL", "https://hooks.example/x")
+    monkeypatch.setattr(slack_notifier, "SLACK_SPOOL", str(tmp_path / "slack"))
+    monkeypatch.setattr(slack_notifier, "SLACK_DIGEST_WINDOW", 0.5)
+    monkeypatch.setattr(slack_notifier, "post_payload", lambda payload, webhook_url=None: sent.append(payload) or True)
+    return sent
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert slack_notifier.retry_after_seconds("7", 1.0) == 7.0
+    later = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 <= slack_notifier.retry_after_seconds(format_datetime(later, usegmt=True), 1.0) <= 30
+    assert slack_notifier.retry_after_seconds("pronto", 2.0) == 2.0
+    assert slack_notifier.retry_after_seconds(None, 2.0) == 2.0
+
+
+def test_lone_alert_is_sent_individually(posted):
+    os.makedirs(slack_notifier.SLACK_SPOOL)
+    slack_notifier._spool_alert(alert(1), slack_notifier.SLACK_SPOOL)
+    slack_notifier.drain_spool(slack_notifier.SLACK_SPOOL, window=0)
+    assert len(posted) == 1
+    assert "Servicio 1" in posted[0]["attachments"][0]["blocks"][0]["text"]["text"]
+    assert os.listdir(slack_notifier.SLACK_SPOOL) == [".lock"]
+
+
+def test_concurrent_builds_share_one_digest(posted):
+    # Varios builds a la vez: uno envía el resumen, los demás solo encolan
+    threads = [threading.Thread(target=slack_notifier.queue_slack_alert, kwargs=alert(n)) for n in range(5)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert time.monotonic() - start < 5
+    assert len(posted) == 1
+    header = posted[0]["attachments"][0]["blocks"][0]["text"]["text"]
+    assert header.startswith("🚨 5 alertas")
@@ -0,0 +1,51 @@
+# tests/test_waits.py
+import pytest
+
+pytest.importorskip("selenium")
+
+from selenium.common.exceptions import (  # noqa: E402
+    InvalidSessionIdException, JavascriptException, TimeoutException,
+)
+
+from browser.waits import wait_for_page_idle  # noqa: E402
+
+
+class Timeouts:
+    script = 30
+
+
+class ScriptedDriver:
+    """Driver que responde a execute_async_script con la secuencia dada (excepción o resultado)."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+        self.timeouts = Timeouts()
+
+    def set_script_timeout(self, seconds):
+        self.timeouts.script = seconds
+
+    def execute_async_script(self, script, *args):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+IDLE = {"idle": True, "quiet": False, "blocking": None, "elapsed_ms": 2000}
+
+
+def test_navigation_and_script_timeout_are_retried():
+    driver = ScriptedDriver(JavascriptException("Document was unloaded"), TimeoutException("script timeout"), IDLE)
+    assert wait_for_page_idle(driver, timeout=5) == IDLE
+    assert driver.calls == 3
+    assert driver.timeouts.script == 30
+
+
+def test_dead_session_fails_fast():
+    driver = ScriptedDriver(InvalidSessionIdException("session deleted"), IDLE)
+    with pytest.raises(InvalidSessionIdException):
+        wait_for_page_idle(driver, timeout=5)
+    assert driver.calls == 1
+    assert driver.timeouts.script == 30
@@ -0,0 +1,179 @@
+# utils/alert_envelope.py
+import re
+import json
+from html import unescape
+from html.parser import HTMLParser
+from datetime import datetime
+from dataclasses import dataclass, asdict, fields
+
+# Campos del cuerpo de la alerta: un único juego de patrones para listener,
+# generador de correo y Slack
+ACTIVA_PATTERN = re.compile(r"alerta\s*activa[\s\-]*", re.IGNORECASE)
+RESUELTA_PATTERN = re.compile(r"alerta\s*resuelta[\s\-]*", re.IGNORECASE)
+RECEPCIO_PATTERN = re.compile(r"Recepci[oó]:\s*(\d{2}/\d{2}/\d{4}\s+\d{2}:\d{2}(?::\d{2})?)")
+INICI_PATTERN = re.compile(r"(?:Inici|Recepció):\s*(\d{2}/\d{2}/\d{4}\s+\d{2}:\d{2})")
+RECUPERACIO_PATTERN = re.compile(r"Recuperaci[oó]:\s*(\d{2}/\d{2}/\d{4}\s+\d{2}:\d{2}:\d{2})")
+CRITICITAT_PATTERN = re.compile(r"Criticitat:\s*([^\n/]+)", re.IGNORECASE)
+AFECTACIO_PATTERN = re.compile(r"Afectaci[oó]:\s*(.+)")
+DESCRIPCIO_PATTERN = re.compile(r"Descripci[oó]:\s*(.+?)(?=\nError:)", re.IGNORECASE | re.DOTALL)
+ERROR_PATTERN = re.compile(r"Error:\s*(.+)", re.IGNORECASE | re.DOTALL)
+
+DISCLAIMER_MARKERS = (
+    "---------------------------------------------------------------------------------------------------------------",
+    "Este mensaje va dirigido",
+    "This message is addressed",
+    "Viewnext, S.A.",
+)
+_AFECTACIO_LINE = re.compile(r"Afectaci[oó]:", re.IGNORECASE)
+
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+_SPACES_RE = re.compile(r"\s+")
+
+_BLOCK_TAGS = {"br", "p", "div", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "ul", "ol"}
+_SKIP_TAGS = {"script", "style", "head", "title"}
+
+
+class _TextExtractor(HTMLParser):
+    """Recorre el HTML en streaming (sin árbol DOM) y se queda con el texto."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Texto plano de un HTML; los bloques (p, div, br, li…) se separan por saltos de línea."""
+    parser = _TextExtractor()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        return unescape(re.sub(r"<[^>]+>", "", html))
+    return "".join(parser.parts)
+
+
+def message_text(email_message) -> str:
+    """Primer cuerpo text/plain o text/html del mensaje, como texto plano."""
+    parts = email_message.walk() if email_message.is_multipart() else [email_message]
+    for part in parts:
+        content_type = part.get_content_type()
+        if email_message.is_multipart() and content_type not in ("text/plain", "text/html"):
+            continue
+        payload = part.get_payload(decode=True)
+        if not payload:
+            continue
+        body = payload.decode(errors="ignore")
+        return html_to_text(body) if content_type == "text/html" else body
+    return ""
+
+
+def clean_body(body: str) -> str:
+    """Quita disclaimers, líneas 'Afectació' repetidas y líneas vacías."""
+    for marker in DISCLAIMER_MARKERS:
+        if marker in body:
+            body = body.split(marker)[0]
+            break
+    seen_afectacio = False
+    lines = []
+    for line in body.splitlines():
+        if _AFECTACIO_LINE.search(line):
+            if seen_afectacio:
+                continue
+            seen_afectacio = True
+        if line.strip():
+            lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def _normalize(text: str) -> str:
+    """Misma normalización que las reglas de alertas: sin signos, minúsculas, espacios colapsados."""
+    return _SPACES_RE.sub(" ", _NON_WORD_RE.sub(" ", text or "").strip().lower())
+
+
+def _first(pattern, text, default=""):
+    match = pattern.search(text)
+    return match.group(1).strip() if match else default
+
+
+@dataclass
+class AlertEnvelope:
+    """
+    Todo lo que se extrae de un correo de alerta, calculado una sola vez en el
+    listener y pasado tal cual (JSON) a Jenkins, al generador de correo y a Slack.
+    """
+    message_id: str = ""
+    from_email: str = ""
+    subject: str = ""
+    alert_type: str = ""       # ACTIVA | RESUELTA | ""
+    alert_id: str = ""         # AAAAMMDD_HHMMSS de Recepció
+    recepcio: str = ""         # dd/mm/aaaa hh:mm:ss
+    inici: str = ""            # dd/mm/aaaa hh:mm (Inici o Recepció)
+    recuperacio: str = ""      # dd/mm/aaaa hh:mm:ss
+    criticitat: str = ""
+    afectacio: str = ""
+    descripcio: str = ""
+    error: str = ""
+
+    @classmethod
+    def from_text(cls, body: str, from_email: str = "", subject: str = "", message_id: str = "") -> "AlertEnvelope":
+        """Extrae todos los campos del cuerpo (texto plano) en una pasada por patrón."""
+        body = body or ""
+        cleaned = clean_body(body)
+        subject_norm, body_norm = _normalize(subject), _normalize(body)
+        if ACTIVA_PATTERN.search(subject_norm) or ACTIVA_PATTERN.search(body_norm):
+            alert_type = "ACTIVA"
+        elif RESUELTA_PATTERN.search(subject_norm) or RESUELTA_PATTERN.search(body_norm):
+            alert_type = "RESUELTA"
+        else:
+            alert_type = ""
+        recepcio = _first(RECEPCIO_PATTERN, body)
+        try:
+            alert_id = datetime.strptime(recepcio, "%d/%m/%Y %H:%M:%S").strftime("%Y%m%d_%H%M%S")
+        except ValueError:
+            alert_id = ""
+        return cls(
+            message_id=message_id,
+            from_email=from_email,
+            subject=subject,
+            alert_type=alert_type,
+            alert_id=alert_id,
+            recepcio=recepcio,
+            inici=_first(INICI_PATTERN, body),
+            recuperacio=_first(RECUPERACIO_PATTERN, body),
+            criticitat=_first(CRITICITAT_PATTERN, cleaned),
+            afectacio=_first(AFECTACIO_PATTERN, cleaned),
+            descripcio=_first(DESCRIPCIO_PATTERN, cleaned),
+            error=_first(ERROR_PATTERN, cleaned),
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, data):
+        """Reconstruye el sobre desde JSON (str o dict); None si viene vacío o inválido."""
+        if not data:
+            return None
+        try:
+            values = json.loads(data) if isinstance(data, str) else dict(data)
+        except ValueError:
+            return None
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in values.items() if k in known})
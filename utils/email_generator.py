@@ -2,33 +2,106 @@
 import os
 import re
 import uuid
+import threading
+from datetime import datetime
+from utils.alert_envelope import AlertEnvelope
 
-def extract_fecha_inicio(body):
-    match = re.search(r"(Inici|Recepció):\s*(\d{2}/\d{2}/\d{4}\s+\d{2}:\d{2})", body)
-    return match.group(2) if match else "Desconegut"
+TEMPLATES_DIR = "email_templates"
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+_TEMPLATE_CACHE = {}  # ruta -> (mtime_ns, size, CompiledTemplate)
+_CACHE_LOCK = threading.Lock()
 
-def extract_fecha_resolucion(body):
-    match = re.search(r"Recuperació:\s*(\d{2}/\d{2}/\d{4}\s+\d{2}:\d{2}:\d{2})", body)
-    return match.group(1) if match else ""
+def calcular_duracion(inicio, fin):
+    """Duración h:mm:ss entre dos fechas dd/mm/aaaa hh:mm[:ss]; "" si falta alguna."""
+    parsed = []
+    for value in (inicio, fin):
+        for fmt in ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M"):
+            try:
+                parsed.append(datetime.strptime(value, fmt))
+                break
+            except (TypeError, ValueError):
+                continue
+    if len(parsed) != 2:
+        return ""
+    total_seconds = int((parsed[1] - parsed[0]).total_seconds())
+    hours, rest = divmod(total_seconds, 3600)
+    return f"{hours}:{rest // 60:02}:{rest % 60:02}"
 
-def load_template(script_name):
-    template_path = os.path.join("email_templates", f"{script_name}.html")
-    if not os.path.exists(template_path):
+class CompiledTemplate:
+    """
+    Plantilla analizada una sola vez: trozos literales y nombres de los
+    placeholders {{nombre}}. render() sustituye todos en una pasada.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        pieces = _PLACEHOLDER.split(source)
+        self._literals = pieces[0::2]
+        self._names = pieces[1::2]
+        self.placeholders = frozenset(self._names)
+
+    def render(self, values):
+        """Los placeholders sin valor se dejan tal cual para que se noten en el correo."""
+        out = [self._literals[0]]
+        for name, literal in zip(self._names, self._literals[1:]):
+            value = values.get(name)
+            out.append("{{" + name + "}}" if value is None else str(value))
+            out.append(literal)
+        return "".join(out)
+
+def compile_template(script_name):
+    """
+    Devuelve la plantilla compilada de un script. Se lee y analiza solo la primera
+    vez o cuando cambia el fichero (mtime/tamaño).
+    """
+    template_path = os.path.abspath(os.path.join(TEMPLATES_DIR, f"{script_name}.html"))
+    try:
+        stat = os.stat(template_path)
+    except FileNotFoundError:
         raise FileNotFoundError(f"Plantilla no encontrada para {script_name}")
+    with _CACHE_LOCK:
+        cached = _TEMPLATE_CACHE.get(template_path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
     with open(template_path, "r", encoding="utf-8") as f:
-        return f.read()
+        compiled = CompiledTemplate(f.read())
+    with _CACHE_LOCK:
+        _TEMPLATE_CACHE[template_path] = (stat.st_mtime_ns, stat.st_size, compiled)
+    return compiled
 
-def generate_email_and_excel_fields(script_name, body, alert_type, alert_id=None):
-    """Genera el HTML del correo y los campos para el Excel."""
-    fecha_inicio = extract_fecha_inicio(body)
-    fecha_resolucion = extract_fecha_resolucion(body) if alert_type == "RESUELTA" else ""
+def load_template(script_name):
+    return compile_template(script_name).source
 
-    template = load_template(script_name)
-    html_email = template.replace("{{fecha_inicio}}", fecha_inicio)
+def template_values(script_name, envelope, alert_type, alert_id=None):
+    """Valores disponibles para los placeholders de las plantillas, sacados del AlertEnvelope."""
+    fecha_inicio = envelope.inici or "Desconegut"
+    fecha_resolucion = envelope.recuperacio if alert_type == "RESUELTA" else ""
+    return {
+        "script_name": script_name,
+        "alert_id": alert_id or "",
+        "alert_type": alert_type,
+        "fecha_inicio": fecha_inicio,
+        "fecha_resolucion": fecha_resolucion,
+        "fecha_fin": fecha_resolucion or "Desconegut",
+        "duracion": calcular_duracion(fecha_inicio, fecha_resolucion) or "En curs",
+        "criticitat": envelope.criticitat or "Alta",
+        "afectacio": envelope.afectacio or "No especificada",
+    }
 
+def generate_email_and_excel_fields(script_name, body, alert_type, alert_id=None, envelope=None):
+    """
+    Genera el HTML del correo y los campos para el Excel.
+    Si llega el AlertEnvelope del listener no se vuelve a parsear el cuerpo.
+    """
     if not alert_id:
         alert_id = str(uuid.uuid4())
 
+    envelope = envelope or AlertEnvelope.from_text(body)
+    values = template_values(script_name, envelope, alert_type, alert_id)
+    fecha_inicio = values["fecha_inicio"]
+    fecha_resolucion = values["fecha_resolucion"]
+    html_email = compile_template(script_name).render(values)
+
     excel_fields = {
         "ID": alert_id,
         "Inici": fecha_inicio,
@@ -1,4 +1,8 @@
 import os
+import time
+import sqlite3
+import tempfile
+import threading
 import pandas as pd
 from datetime import datetime
 from filelock import FileLock, Timeout
@@ -7,6 +11,16 @@ from filelock import FileLock, Timeout
 SHARED_EXCEL_PATH = "/var/lib/jenkins/shared/alertas.xlsx"
 LOCK_PATH = SHARED_EXCEL_PATH + ".lock"
 
+# Registro transaccional de alertas: el Excel se regenera a partir de aquí
+ALERTS_DB_PATH = os.getenv("ALERTS_DB_PATH", os.path.splitext(SHARED_EXCEL_PATH)[0] + ".db")
+# Segundos mínimos entre regeneraciones del Excel (0 = tras cada cambio). Solo
+# para procesos de larga duración que arrancan start_materializer (listener):
+# lo que queda pendiente lo escribe ese hilo o un cron
+MATERIALIZE_INTERVAL = int(os.getenv("EXCEL_MATERIALIZE_INTERVAL", "0"))
+
+COLUMNS = ["ID", "Inici", "Fi", "Afecta a", "Incidència", "Parcial/Total", "Origen", "Descripción"]
+_QUOTED = ", ".join(f'"{c}"' for c in COLUMNS)
+
 def ensure_shared_excel_dir():
    """Crea el directorio compartido si no existe y da permisos."""
    shared_dir = os.path.dirname(SHARED_EXCEL_PATH)
@@ -21,9 +35,7 @@ def create_excel_if_not_exists():
    """Crea el Excel si no existe en la ruta compartida."""
    ensure_shared_excel_dir()
    if not os.path.exists(SHARED_EXCEL_PATH):
-       df = pd.DataFrame(columns=[
-           "ID", "Inici", "Fi", "Afecta a", "Incidència", "Parcial/Total", "Origen", "Descripción"
-       ])
+       df = pd.DataFrame(columns=COLUMNS)
        df.to_excel(SHARED_EXCEL_PATH, index=False)
        try:
            os.chmod(SHARED_EXCEL_PATH, 0o666)
@@ -33,39 +45,238 @@ def create_excel_if_not_exists():
    else:
        print(f"[INFO] Usando Excel existente en {SHARED_EXCEL_PATH}")
 
-def add_alert(fields):
-   """Añade una nueva alerta al Excel compartido evitando duplicados y con bloqueo."""
-   create_excel_if_not_exists()
-   lock = FileLock(LOCK_PATH, timeout=30)  # Espera hasta 30s si otro proceso está escribiendo
+# =========================
+# Registro SQLite
+# =========================
+def _connect():
+   """
+   Abre el registro de alertas (WAL: lectores y escritor no se bloquean).
+   La primera vez importa las filas del Excel existente para no perder histórico.
+   """
+   ensure_shared_excel_dir()
+   conn = sqlite3.connect(ALERTS_DB_PATH, timeout=30, isolation_level=None)
+   conn.execute("PRAGMA journal_mode=WAL")
+   conn.execute("PRAGMA synchronous=NORMAL")
+   conn.execute(f"""
+       CREATE TABLE IF NOT EXISTS alerts (
+           {", ".join(f'"{c}" TEXT' + (" PRIMARY KEY" if c == "ID" else "") for c in COLUMNS)},
+           updated_at REAL NOT NULL
+       )""")
+   conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+   conn.execute("BEGIN IMMEDIATE")
+   try:
+       if conn.execute("SELECT 1 FROM meta WHERE key = 'version'").fetchone() is None:
+           _import_excel(conn)
+           conn.executemany("INSERT INTO meta (key, value) VALUES (?, 0)",
+                            [("version",), ("materialized",), ("materialized_at",)])
+       conn.execute("COMMIT")
+   except Exception:
+       conn.execute("ROLLBACK")
+       raise
+   try:
+       os.chmod(ALERTS_DB_PATH, 0o666)
+   except Exception:
+       pass
+   return conn
+
+def _import_excel(conn):
+   """Migra una sola vez las alertas del Excel compartido al registro."""
+   if not os.path.exists(SHARED_EXCEL_PATH):
+       return
+   df = pd.read_excel(SHARED_EXCEL_PATH, dtype=str).reindex(columns=COLUMNS).fillna("")
+   df["ID"] = df["ID"].str.strip()
+   rows = [tuple(r) + (time.time(),) for r in df.itertuples(index=False, name=None) if r[0]]
+   conn.executemany(f"INSERT OR IGNORE INTO alerts ({_QUOTED}, updated_at) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})", rows)
+   print(f"[INFO] {len(rows)} alertas importadas desde {SHARED_EXCEL_PATH}")
+
+def _bump_version(conn):
+   conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+def _row(fields):
+   return tuple("" if fields.get(c) is None else str(fields.get(c)) for c in COLUMNS)
+
+def _is_locked(e):
+   return isinstance(e, sqlite3.OperationalError) and "locked" in str(e)
+
+def materialize_excel(force=False):
+   """
+   Regenera alertas.xlsx desde el registro en una sola escritura (tmp + rename).
+   No hace nada si el Excel ya refleja la última versión del registro o si
+   la última regeneración es más reciente que EXCEL_MATERIALIZE_INTERVAL
+   (salvo force=True). El libro temporal se genera fuera del bloqueo; bajo el
+   bloqueo solo se comprueba la versión y se renombra.
+
+   :return: True si se escribió el Excel.
+   """
+   tmp_path = None
    try:
-       with lock:
-           df = pd.read_excel(SHARED_EXCEL_PATH)
+       conn = _connect()
+       try:
+           meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+           if meta["materialized"] >= meta["version"] and os.path.exists(SHARED_EXCEL_PATH):
+               return False
+           if not force and MATERIALIZE_INTERVAL and time.time() - meta["materialized_at"] < MATERIALIZE_INTERVAL:
+               return False
 
-           alert_id = str(fields.get("ID")).strip()
-           if alert_id in df["ID"].astype(str).str.strip().values:
-               print(f"[INFO] ALERT_ID {alert_id} ya existe en Excel, no se añade duplicado.")
-               return
+           df = pd.read_sql_query(f"SELECT {_QUOTED} FROM alerts ORDER BY rowid", conn)
+           version = meta["version"]
+           fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(SHARED_EXCEL_PATH), suffix=".xlsx")
+           os.close(fd)
+           df.to_excel(tmp_path, index=False)
+           os.chmod(tmp_path, 0o666)
 
-           df = pd.concat([df, pd.DataFrame([fields])], ignore_index=True)
-           df.to_excel(SHARED_EXCEL_PATH, index=False)
-           print(f"[INFO] Alerta añadida con ID {alert_id}")
+           with FileLock(LOCK_PATH, timeout=30):
+               # Otro proceso puede haber escrito una versión igual o más reciente mientras tanto
+               done = conn.execute("SELECT value FROM meta WHERE key = 'materialized'").fetchone()[0]
+               if done >= version and os.path.exists(SHARED_EXCEL_PATH):
+                   return False
+               os.replace(tmp_path, SHARED_EXCEL_PATH)
+               tmp_path = None
+               conn.execute("UPDATE meta SET value = MAX(value, ?) WHERE key = 'materialized'", (version,))
+               conn.execute("UPDATE meta SET value = ? WHERE key = 'materialized_at'", (time.time(),))
+       finally:
+           conn.close()
    except Timeout:
        print("[ERROR] No se pudo obtener el bloqueo para escribir en el Excel (timeout).")
+       return False
+   except sqlite3.OperationalError as e:
+       if not _is_locked(e):
+           raise
+       print(f"[ERROR] Registro de alertas bloqueado, el Excel se regenerará más tarde: {e}")
+       return False
+   finally:
+       if tmp_path and os.path.exists(tmp_path):
+           os.remove(tmp_path)
+   print(f"[INFO] Excel regenerado con {len(df)} alertas en {SHARED_EXCEL_PATH}")
+   return True
+
+def start_materializer(interval=None):
+   """
+   Hilo que regenera el Excel cada `interval` segundos (por defecto
+   EXCEL_MATERIALIZE_INTERVAL) si el registro cambió: escribe lo que la
+   limitación de frecuencia dejó pendiente tras la última alerta.
+   """
+   interval = interval or MATERIALIZE_INTERVAL or 60
+
+   def loop():
+       while True:
+           time.sleep(interval)
+           try:
+               materialize_excel(force=True)
+           except Exception as e:
+               print(f"[WARN] No se pudo regenerar el Excel: {e}")
+
+   thread = threading.Thread(target=loop, name="excel-materializer", daemon=True)
+   thread.start()
+   return thread
+
+# =========================
+# API de alertas
+# =========================
+INSERTED, DUPLICATE, CLOSED, NOT_FOUND = "inserted", "duplicate", "closed", "not_found"
+
+def _existing_ids(conn, ids):
+   """Índice de los IDs ya registrados, consultado en bloques de una sola pasada."""
+   found, ids = set(), list(ids)
+   for i in range(0, len(ids), 500):
+       chunk = ids[i:i + 500]
+       placeholders = ", ".join("?" * len(chunk))
+       found.update(r[0] for r in conn.execute(f"SELECT ID FROM alerts WHERE ID IN ({placeholders})", chunk))
+   return found
+
+def upsert_alerts(records):
+   """
+   Registra varias alertas en una sola transacción y regenera el Excel una vez.
+
+   :param records: Iterable de dicts con las columnas del Excel (ID obligatorio).
+   :return: Lista [(ID, "inserted" | "duplicate")], una entrada por registro.
+   """
+   rows = [(str(r.get("ID")).strip(),) + _row(r)[1:] for r in records]
+   outcomes = []
+   conn = _connect()
+   try:
+       with conn:
+           conn.execute("BEGIN IMMEDIATE")
+           existing = _existing_ids(conn, {row[0] for row in rows})
+           new_rows, now = [], time.time()
+           for row in rows:
+               if row[0] in existing:
+                   outcomes.append((row[0], DUPLICATE))
+                   continue
+               existing.add(row[0])
+               outcomes.append((row[0], INSERTED))
+               new_rows.append(row + (now,))
+           if new_rows:
+               conn.executemany(
+                   f"INSERT INTO alerts ({_QUOTED}, updated_at) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                   new_rows)
+               _bump_version(conn)
+   finally:
+       conn.close()
+
+   if new_rows:
+       materialize_excel()
+   return outcomes
+
+def close_alerts(items):
+   """
+   Cierra varias alertas en una sola transacción y regenera el Excel una vez.
+
+   :param items: IDs o dicts con ID y, opcionalmente, Fi (por defecto, ahora).
+   :return: Lista [(ID, "closed" | "not_found")], una entrada por elemento.
+   """
+   default_fi = datetime.now().strftime("%d/%m/%Y %H:%M")
+   requested = []
+   for item in items:
+       fields = item if isinstance(item, dict) else {"ID": item}
+       requested.append((str(fields.get("ID")).strip(), fields.get("Fi") or default_fi))
+   updates = dict(requested)
+   conn = _connect()
+   try:
+       with conn:
+           conn.execute("BEGIN IMMEDIATE")
+           existing = _existing_ids(conn, updates)
+           now = time.time()
+           conn.executemany('UPDATE alerts SET "Fi" = ?, updated_at = ? WHERE ID = ?',
+                            [(fi, now, alert_id) for alert_id, fi in updates.items() if alert_id in existing])
+           if existing:
+               _bump_version(conn)
+   finally:
+       conn.close()
+
+   outcomes = [(alert_id, CLOSED if alert_id in existing else NOT_FOUND) for alert_id, _ in requested]
+   if existing:
+       materialize_excel()
+   return outcomes
+
+def add_alert(fields):
+   """Registra una nueva alerta evitando duplicados y regenera el Excel compartido."""
+   try:
+       alert_id, outcome = upsert_alerts([fields])[0]
+   except sqlite3.OperationalError as e:
+       if not _is_locked(e):
+           raise
+       print(f"[ERROR] No se pudo registrar la alerta (registro bloqueado): {e}")
+       return
+   if outcome == DUPLICATE:
+       print(f"[INFO] ALERT_ID {alert_id} ya existe en Excel, no se añade duplicado.")
+   else:
+       print(f"[INFO] Alerta añadida con ID {alert_id}")
 
 def close_alert(fields):
-   """Cierra una alerta existente actualizando la columna Fi con bloqueo."""
-   create_excel_if_not_exists()
-   lock = FileLock(LOCK_PATH, timeout=30)
+   """Cierra una alerta existente actualizando la columna Fi y regenera el Excel compartido."""
    try:
-       with lock:
-           df = pd.read_excel(SHARED_EXCEL_PATH)
-           alert_id = str(fields.get("ID")).strip()
-           match = df[df["ID"].astype(str).str.strip() == alert_id]
-           if not match.empty:
-               df.loc[df["ID"].astype(str).str.strip() == alert_id, "Fi"] = fields.get("Fi") or datetime.now().strftime("%d/%m/%Y %H:%M")
-               df.to_excel(SHARED_EXCEL_PATH, index=False)
-               print(f"[INFO] Alerta {alert_id} cerrada correctamente.")
-           else:
-               print(f"[ERROR] No se encontró alerta con ID {alert_id}")
-   except Timeout:
-       print("[ERROR] No se pudo obtener el bloqueo para escribir en el Excel (timeout).")
+       alert_id, outcome = close_alerts([fields])[0]
+   except sqlite3.OperationalError as e:
+       if not _is_locked(e):
+           raise
+       print(f"[ERROR] No se pudo cerrar la alerta (registro bloqueado): {e}")
+       return
+   if outcome == CLOSED:
+       print(f"[INFO] Alerta {alert_id} cerrada correctamente.")
+   else:
+       print(f"[ERROR] No se encontró alerta con ID {alert_id}")
+
+if __name__ == "__main__":
+   # Regeneración programada (cron) si no hay listener que la haga con start_materializer
+   materialize_excel(force=True)
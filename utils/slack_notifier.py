@@ -1,58 +1,105 @@
 import os
-import re
+import time
+import tempfile
+import threading
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
+from filelock import FileLock, Timeout
 import json
+from utils.alert_envelope import AlertEnvelope
 
 load_dotenv()
 SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
+SLACK_TIMEOUT = float(os.getenv("SLACK_TIMEOUT", "10"))
+SLACK_MAX_RETRIES = int(os.getenv("SLACK_MAX_RETRIES", "5"))
+SLACK_DIGEST_WINDOW = float(os.getenv("SLACK_DIGEST_WINDOW", "10"))  # segundos para agrupar alertas
+SLACK_DIGEST_MAX_LINES = 40  # Slack admite 50 bloques por mensaje
+# Cola compartida entre builds: las alertas de una tormenta salen en un mensaje resumen
+SLACK_SPOOL = os.getenv("SLACK_SPOOL", os.path.join(os.getenv("WORKSPACE", os.getcwd()), "state", "slack"))
 
-def clean_email_body(email_body: str) -> str:
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+def load_check_result(result_path: str) -> dict:
     """
-    Limpia el cuerpo del correo eliminando disclaimers, repeticiones y separadores.
+    Lee el result.json de la comprobación (veredicto, pasos, tiempos).
+    Devuelve {} si no existe o no se puede leer.
     """
-    disclaimer_patterns = [
-        "---------------------------------------------------------------------------------------------------------------",
-        "Este mensaje va dirigido",
-        "This message is addressed",
-        "Viewnext, S.A."
-    ]
-    for pattern in disclaimer_patterns:
-        if pattern in email_body:
-            email_body = email_body.split(pattern)[0]
-            break
-
-    lines = email_body.splitlines()
-    seen_afectacion = False
-    cleaned_lines = []
-    for line in lines:
-        if re.search(r"Afectaci[oó]:", line, re.IGNORECASE):
-            if seen_afectacion:
-                continue
-            seen_afectacion = True
-        cleaned_lines.append(line)
-
-    cleaned_text = "\n".join([l for l in cleaned_lines if l.strip() != ""])
-    return cleaned_text.strip()
+    if not result_path or not os.path.exists(result_path):
+        return {}
+    try:
+        with open(result_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[WARN] No se pudo leer result.json: {e}")
+        return {}
 
-def extract_fecha_inicio(body: str) -> str:
-    match = re.search(r"Recepci[oó]:\s*(\d{2}/\d{2}/\d{4}\s+\d{2}:\d{2}:\d{2})", body)
-    return match.group(1) if match else ""
+def get_session() -> requests.Session:
+    """Sesión HTTP compartida: reutiliza la conexión TLS con Slack entre mensajes."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = requests.Session()
+            _SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        return _SESSION
 
-def extract_fecha_resolucion(body: str) -> str:
-    match = re.search(r"Recuperaci[oó]:\s*(\d{2}/\d{2}/\d{4}\s+\d{2}:\d{2}:\d{2})", body)
-    return match.group(1) if match else ""
+def retry_after_seconds(value: str, default: float) -> float:
+    """Segundos que pide Retry-After (número o fecha HTTP); si no se entiende, `default`."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when is None:
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
 
-def send_slack_alert(alert_id: str, alert_name: str, alert_type: str, status: str, email_body: str, jenkins_url: str = None, ticket_url: str = None) -> bool:
-    if not SLACK_WEBHOOK_URL:
-        print("[WARN] SLACK_WEBHOOK_URL no configurado.")
-        return False
+def post_payload(payload: dict, webhook_url: str = None) -> bool:
+    """
+    Envía un mensaje al webhook con timeout y reintentos.
+    Respeta 429 + Retry-After y aplica backoff exponencial ante 5xx o errores de red.
+    """
+    webhook_url = webhook_url or SLACK_WEBHOOK_URL
+    backoff = 1.0
+    for attempt in range(1, SLACK_MAX_RETRIES + 1):
+        try:
+            resp = get_session().post(webhook_url, json=payload, timeout=SLACK_TIMEOUT)
+            if resp.status_code == 200:
+                return True
+            if resp.status_code == 429:
+                wait = retry_after_seconds(resp.headers.get("Retry-After"), backoff)
+                print(f"[WARN] Slack limita el envío (429), reintento en {wait}s")
+            elif resp.status_code >= 500:
+                wait = backoff
+                print(f"[WARN] Slack respondió {resp.status_code}, reintento en {wait}s")
+            else:
+                print(f"[ERROR] Fallo al enviar mensaje: {resp.status_code} - {resp.text}")
+                return False
+        except requests.RequestException as e:
+            wait = backoff
+            print(f"[WARN] Excepción enviando mensaje ({attempt}/{SLACK_MAX_RETRIES}): {e}")
+        if attempt < SLACK_MAX_RETRIES:
+            time.sleep(wait)
+            backoff = min(backoff * 2, 60)
+    print(f"[ERROR] Mensaje a Slack descartado tras {SLACK_MAX_RETRIES} intentos")
+    return False
 
-    email_body = clean_email_body(email_body)
+def build_alert_payload(alert_id: str, alert_name: str, alert_type: str, status: str, email_body: str = "", jenkins_url: str = None, ticket_url: str = None, result_path: str = None, envelope: AlertEnvelope = None) -> dict:
+    """Mensaje Block Kit de una alerta individual (campos del AlertEnvelope)."""
+    envelope = envelope or AlertEnvelope.from_text(email_body)
 
-    fecha_inicio = extract_fecha_inicio(email_body)
-    fecha_resolucion = extract_fecha_resolucion(email_body)
+    fecha_inicio = envelope.recepcio
+    fecha_resolucion = envelope.recuperacio
 
     duracion = "N/A"
     try:
@@ -69,17 +116,14 @@ def send_slack_alert(alert_id: str, alert_name: str, alert_type: str, status: st
     except Exception as e:
         print(f"[WARN] No se pudo calcular duración: {e}")
 
-    criticidad_match = re.search(r"Criticitat:\s*([^\n/]+)", email_body, re.IGNORECASE)
-    criticidad = criticidad_match.group(1).strip().capitalize() if criticidad_match else "Alta"
-
-    afectacion_match = re.search(r"Afectaci[oó]:\s*(.+)", email_body)
-    afectacion = afectacion_match.group(1).strip() if afectacion_match else "No especificada"
+    criticidad = envelope.criticitat.capitalize() if envelope.criticitat else "Alta"
+    afectacion = envelope.afectacio or "No especificada"
+    descripcion = envelope.descripcio or "No disponible"
+    error = envelope.error or "No especificado"
 
-    descripcion_match = re.search(r"Descripci[oó]:\s*(.+?)(?=\nError:)", email_body, re.IGNORECASE | re.DOTALL)
-    descripcion = descripcion_match.group(1).strip() if descripcion_match else "No disponible"
-
-    error_match = re.search(r"Error:\s*(.+)", email_body, re.IGNORECASE | re.DOTALL)
-    error = error_match.group(1).strip() if error_match else "No especificado"
+    check_result = load_check_result(result_path)
+    if check_result.get("verdict"):
+        status = check_result["verdict"]
 
     # Color según tipo de alerta
     if alert_type.upper() == "ACTIVA":
@@ -120,6 +164,15 @@ def send_slack_alert(alert_id: str, alert_name: str, alert_type: str, status: st
                             {"type": "mrkdwn", "text": f"*Recuperación:* {fecha_resolucion or 'N/A'}"}
                         ]
                     },
+                ] + ([
+                    {
+                        "type": "section",
+                        "fields": [
+                            {"type": "mrkdwn", "text": f"*Verificación:* {check_result.get('total_s', 'N/A')}s"},
+                            {"type": "mrkdwn", "text": f"*Paso fallido:* {check_result.get('failing_step') or '-'}"}
+                        ]
+                    }
+                ] if check_result else []) + [
                     {
                         "type": "section",
                         "text": {"type": "mrkdwn", "text": f"*Descripción:*\n{descripcion}"}
@@ -137,16 +190,133 @@ def send_slack_alert(alert_id: str, alert_name: str, alert_type: str, status: st
         ]
     }
 
+    return payload
+
+def build_digest_payload(alerts: list, window: float = SLACK_DIGEST_WINDOW) -> dict:
+    """Un único mensaje resumen para varias alertas recibidas en la misma ventana."""
+    activas = sum(1 for a in alerts if str(a.get("alert_type", "")).upper() == "ACTIVA")
+    color = "#ff0000" if activas else "#36a64f"
+    blocks = [
+        {
+            "type": "header",
+            "text": {"type": "plain_text", "text": f"🚨 {len(alerts)} alertas en {int(window)}s ({activas} activas)", "emoji": True}
+        }
+    ]
+    for alert in alerts[:SLACK_DIGEST_MAX_LINES]:
+        line = (f"*{alert.get('alert_name')}* · {alert.get('alert_type')} · "
+                f"{alert.get('status')} · ID {alert.get('alert_id')}")
+        if alert.get("jenkins_url"):
+            line += f" · <{alert['jenkins_url']}|Jenkins>"
+        blocks.append({"type": "section", "text": {"type": "mrkdwn", "text": line}})
+    if len(alerts) > SLACK_DIGEST_MAX_LINES:
+        blocks.append({"type": "context", "elements": [
+            {"type": "mrkdwn", "text": f"… y {len(alerts) - SLACK_DIGEST_MAX_LINES} alertas más"}
+        ]})
+    return {"attachments": [{"color": color, "blocks": blocks}]}
+
+def send_slack_alert(alert_id: str, alert_name: str, alert_type: str, status: str, email_body: str = "", jenkins_url: str = None, ticket_url: str = None, result_path: str = None, envelope: AlertEnvelope = None) -> bool:
+    """Envía inmediatamente el mensaje de una alerta (un job de Jenkins = una alerta)."""
+    if not SLACK_WEBHOOK_URL:
+        print("[WARN] SLACK_WEBHOOK_URL no configurado.")
+        return False
+
+    payload = build_alert_payload(alert_id, alert_name, alert_type, status, email_body,
+                                  jenkins_url, ticket_url, result_path, envelope)
     print(json.dumps(payload, indent=2, ensure_ascii=False))
 
-    try:
-        resp = requests.post(SLACK_WEBHOOK_URL, json=payload)
-        if resp.status_code == 200:
-            print("[INFO] Mensaje enriquecido enviado a Slack.")
-            return True
-        else:
-            print(f"[ERROR] Fallo al enviar mensaje: {resp.status_code} - {resp.text}")
-            return False
-    except Exception as e:
-        print(f"[ERROR] Excepción enviando mensaje: {e}")
+    if post_payload(payload):
+        print("[INFO] Mensaje enriquecido enviado a Slack.")
+        return True
+    return False
+
+def _spool_alert(alert: dict, spool: str) -> str:
+    """Escribe la alerta (ya renderizada) en la cola compartida; escritura atómica."""
+    check_result = load_check_result(alert.get("result_path"))
+    entry = {
+        "created": time.time(),
+        "payload": build_alert_payload(**alert),
+        "line": {
+            "alert_id": alert.get("alert_id"),
+            "alert_name": alert.get("alert_name"),
+            "alert_type": alert.get("alert_type"),
+            "status": check_result.get("verdict") or alert.get("status"),
+            "jenkins_url": alert.get("jenkins_url"),
+        },
+    }
+    path = os.path.join(spool, f"{time.time_ns()}_{os.getpid()}.json")
+    fd, tmp_path = tempfile.mkstemp(dir=spool, prefix=".alert.")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+def _read_spool(spool: str) -> list:
+    """Entradas de la cola como (ruta, entrada), de la más antigua a la más nueva."""
+    entries = []
+    for name in sorted(os.listdir(spool)):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(spool, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries.append((path, json.load(f)))
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Entrada de Slack ilegible, se descarta: {path} ({e})")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return entries
+
+def drain_spool(spool: str = None, window: float = None, webhook_url: str = None) -> None:
+    """
+    Envía lo que haya en la cola. Solo un proceso envía a la vez (lock de la
+    cola): espera hasta `window` segundos desde la alerta más antigua y manda
+    todo lo acumulado en un mensaje. Si otro proceso tiene el lock, este vuelve
+    enseguida: su alerta ya está en la cola y la recoge el que envía, que
+    revisa la cola de nuevo tras soltar el lock.
+    """
+    spool = spool or SLACK_SPOOL
+    window = SLACK_DIGEST_WINDOW if window is None else window
+    lock = FileLock(os.path.join(spool, ".lock"))
+    while _read_spool(spool):
+        try:
+            lock.acquire(timeout=0)
+        except Timeout:
+            return
+        try:
+            entries = _read_spool(spool)
+            if not entries:
+                continue
+            oldest = min(entry["created"] for _, entry in entries)
+            time.sleep(max(0.0, oldest + window - time.time()))
+            entries = _read_spool(spool)
+            if len(entries) == 1:
+                payload = entries[0][1]["payload"]
+            else:
+                payload = build_digest_payload([entry["line"] for _, entry in entries], window)
+            if post_payload(payload, webhook_url):
+                print(f"[INFO] {len(entries)} alerta(s) enviadas a Slack en un mensaje.")
+            # post_payload ya ha reintentado: lo que no sale se descarta, como en send_slack_alert
+            for path, _ in entries:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        finally:
+            lock.release()
+
+def queue_slack_alert(**alert) -> bool:
+    """
+    Notifica una alerta agrupándola con las de otros builds (mismos argumentos
+    que send_slack_alert). La alerta se deja en la cola compartida SLACK_SPOOL;
+    el primer build de una tormenta espera SLACK_DIGEST_WINDOW segundos y envía
+    un único mensaje resumen. Una alerta sola conserva el formato individual.
+    """
+    if not SLACK_WEBHOOK_URL:
+        print("[WARN] SLACK_WEBHOOK_URL no configurado.")
         return False
+    os.makedirs(SLACK_SPOOL, exist_ok=True)
+    _spool_alert(alert, SLACK_SPOOL)
+    drain_spool(SLACK_SPOOL)
+    return True